@@ -2,17 +2,480 @@
 An AI player for Othello. 
 """
 
+import hashlib
+import os
 import random
 import sys
+import threading
 import time
 
 # You can use the functions from othello_shared to write your AI
-from othello_shared import find_lines, get_possible_moves, get_score, play_move
-
-cache = {} # Use this for state caching
+import othello_shared
+import othello_bitboard
+import othello_protocol
+import batch_evaluation
+from othello_shared import (apply_move, find_lines, flips_to_mask, get_moves_and_flips,
+                            get_possible_moves, get_score, play_move)
+from endgame import EXACT_EMPTIES, WIN, EndgameSolver
+from evaluation import EvalState, current_weights, load_weights as load_heuristic_weights, reset_weights
+from analysis_cache import AnalysisCache
+from instrumentation import SearchCounters, write_record
+from opening_book import OpeningBook
+from patterns import PatternState, set_weights_path, tables as pattern_tables
+from probcut import MIN_DEPTH as PROBCUT_MIN_DEPTH, EmptyCount, load_model
+from symmetry import symmetry
+from lazy_smp import LazySMP
+from move_ordering import clear_tables as clear_move_ordering, move_ordering
+from timing import MOVE_TIME_LIMIT, SearchTimeout, TimeManager
+from transposition import (EXACT, LOWER, UNLIMITED, UPPER, SharedTranspositionTable, TranspositionTable,
+                           bound_flag, usable)
+
+# Move generation backends. Both modules provide find_lines,
+# get_possible_moves, play_move, get_score, get_moves_and_flips, apply_move
+# and flips_to_mask with identical results; the bitboard one replaces the
+# square-by-square ray walks with mask flood fills.
+BACKENDS = {"tuple": othello_shared, "bitboard": othello_bitboard}
+
+cache = TranspositionTable() # Use this for state caching
+timer = None # TimeManager of the running anytime search, if any
+stop_signal = None # if set, polled by the anytime search, which stops when it returns True
+search_stats = {} # depth completed, best move and nodes of the last anytime search
+smp = None # LazySMP helper processes of the parallel search, if any
+counters = None # SearchCounters of the current move when statistics are on (see instrumentation.py)
+
+# Driver of the fixed-depth alpha-beta search on the negamax core: "pvs"
+# (principal variation search from the root) or "mtdf" (MTD(f), which
+# always uses the cache).
+DRIVERS = ("pvs", "mtdf")
+driver = "pvs"
+
+# Evaluation of non-terminal nodes at the depth limit: "utility" (the disc
+# difference, compute_utility), "heuristic" (compute_heuristic), "weighted"
+# (a weighted-square sum, see batch_evaluation.py; needs NumPy) or
+# "patterns" (pattern tables, see patterns.py).
+EVALUATORS = ("utility", "heuristic", "weighted", "patterns")
+evaluator = "utility"
+tracker = None # EvalState, PatternState or EmptyCount of the running search, kept up to date move by move
+searching = False # True while a select_move function (or the ponder thread) runs a search
+PATTERNS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "patterns{}.bin")
+HEURISTIC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "heuristic.json") # see tuner.py
+TERMINAL_SCALE = 1000 # weight of a final disc difference against heuristic values
+
+# With NumPy, the children of nodes one ply above the depth limit and the
+# children sorted by node ordering are evaluated in batches.
+batching = batch_evaluation.available()
+
+# Pondering: while the opponent thinks, a background thread searches the
+# positions after its likely replies, filling the cache and ponder_results.
+ponder_thread = None
+ponder_stop = None # TimeManager of the ponder thread, stopped when the board arrives
+ponder_results = {} # packed board after a reply -> (depth searched, best move)
+
+# Opening book probed before searching; by default book<n>.bin next to this
+# file is used for an n x n board (see opening_book.py).
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book{}.bin")
+book = None # OpeningBook for the current board size, if one was found
+files_opened = None # (book path, analysis path, evaluator, analysis tag, board size) of the files open now
+values_settings = None # (evaluator, weights file, ProbCut file) that the values in the cache were searched with
+
+# Without a depth limit (or with one that reaches the end of the game),
+# select_move_alphabeta hands positions with at most endgame_empties empty
+# squares to the exact endgame solver, and positions with at most
+# wld_empties to its win/loss/draw mode (0 turns either off).
+endgame_empties = EXACT_EMPTIES
+wld_empties = 0
+
+# Selective search: with a calibration file (see probcut.py), nodes whose
+# deep value a shallow search predicts to fall outside the window are cut.
+PROBCUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "probcut.json")
+probcut = None # ProbCutModel for the current evaluator, if selective search is on
+
+# Persistent analysis cache (see analysis_cache.py): deep results of earlier
+# games, looked up when the cache misses, and this game's deep results,
+# merged into the file when the game ends.
+ANALYSIS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "analysis{}.bin")
+analysis = None # AnalysisCache for the current board size and evaluator, if the option is on
 
 def eprint(*args, **kwargs): #use this for debugging, to print to sterr
     print(*args, file=sys.stderr, **kwargs)
+
+def set_backend(name):
+    """
+    Switch the move generation functions used by the search to the given
+    backend ("tuple" or "bitboard").
+    """
+    global find_lines, get_possible_moves, get_score, play_move
+    global get_moves_and_flips, apply_move, flips_to_mask
+    backend = BACKENDS[name]
+    find_lines = backend.find_lines
+    get_possible_moves = backend.get_possible_moves
+    get_score = backend.get_score
+    play_move = backend.play_move
+    get_moves_and_flips = backend.get_moves_and_flips
+    apply_move = backend.apply_move
+    flips_to_mask = backend.flips_to_mask
+
+def search_depth(limit):
+    """
+    Remaining depth of a node searched with the given limit, as stored in the
+    transposition table (a negative limit means no depth limit).
+    """
+    return limit if limit >= 0 else UNLIMITED
+
+def position_key(board, to_move, color):
+    """
+    Symmetry key of a node: board, side to move and the colour its value is
+    computed for, hashed in all eight orientations of the board (see
+    symmetry.py).
+    """
+    return symmetry(len(board)).key(board, to_move, color)
+
+def probe_position(key, n):
+    """
+    Look up a node in the cache under the canonical key of its symmetry key,
+    so that a result stored for any rotation or reflection of the board is
+    found. The stored move is mapped back to the orientation of the board.
+    OUTPUT: a tuple (slot, entry or None); slot is passed to store_position
+    """
+    table = symmetry(n)
+    slot = table.canonical(key)
+    entry = cache.probe(slot[0])
+    if entry is None and analysis is not None and analysis.n == n:
+        entry = analysis.probe(slot[0])
+        if entry is not None: # keep it in the table for the next probes
+            cache.store(slot[0], *entry[:4])
+    if counters is not None:
+        counters.probes += 1
+        counters.hits += entry is not None
+    if entry is not None and entry[3] is not None:
+        entry = entry[:3] + (table.restore_move(slot[1], entry[3]),) + entry[4:]
+    return slot, entry
+
+def store_position(slot, n, depth, flag, value, move):
+    """
+    Store a node probed with probe_position, its move mapped into the
+    canonical orientation.
+    """
+    if move is not None:
+        move = symmetry(n).transform_move(slot[1], move)
+    if counters is not None:
+        counters.stores += 1
+    cache.store(slot[0], depth, flag, value, move)
+    if analysis is not None and depth >= analysis.min_depth:
+        analysis.record(slot[0], depth, flag, value, move)
+
+def expand(board, player):
+    """
+    Return the children of board when player is to move, as a list of
+    (move, flips, child board) triples. Each move is generated together with
+    the discs it flips, so playing it never searches its lines again; the
+    child boards are only built when needed (None until then).
+    """
+    return [(move, flips, None) for move, flips in get_moves_and_flips(board, player)]
+
+def order_children(board, player, color, children, reverse):
+    """
+    Node ordering: play every child once and sort the children by the utility
+    of their boards for color (highest first if reverse). The boards are kept
+    in the triples, so the search does not play the moves again.
+    """
+    children = [(move, flips, apply_move(board, player, move[0], move[1], flips))
+                for move, flips, new_board in children]
+    if batching and len(children) >= batch_evaluation.MIN_BATCH:
+        values = batch_evaluation.utilities([child[2] for child in children], color)
+        order = sorted(range(len(children)), key=values.__getitem__, reverse=reverse)
+        return [children[index] for index in order]
+    children.sort(key=lambda child: compute_utility(child[2], color), reverse=reverse)
+    return children
+
+def order_node(board, player, color, children, limit, reverse):
+    """
+    Node ordering below the root. One ply above the depth limit the children
+    are sorted by their utility as in order_children, since their boards
+    are built and evaluated anyway; higher up they are sorted by the killer
+    moves and history of the search, without playing them (see
+    move_ordering.py).
+    """
+    if limit == 1:
+        return order_children(board, player, color, children, reverse)
+    return move_ordering(len(board)).order(children, player, limit)
+
+def enter_child(key, n, player, move, flips, limit):
+    """
+    Apply the move to the evaluation tracker and derive the symmetry key of
+    the child from the key of the parent (only if the parent has a key and
+    the child is not a leaf), both from the flip set of the move.
+    OUTPUT: a tuple (child key or None, mask of flipped discs)
+    """
+    if tracker is None and (key is None or limit == 1):
+        return None, 0
+    square = move[0] * n + move[1]
+    mask = flips_to_mask(flips, n)
+    if tracker is not None:
+        tracker.make(player, square, mask)
+    if key is None or limit == 1:
+        return None, mask
+    return symmetry(n).play(key, player, square, mask), mask
+
+def leave_child(n, player, move, mask):
+    """
+    Undo the evaluation tracker update made by enter_child.
+    """
+    if tracker is not None:
+        tracker.unmake(player, move[0] * n + move[1], mask)
+
+def set_evaluator(name):
+    """
+    Choose the evaluation used at the depth limit (one of EVALUATORS).
+    """
+    global evaluator
+    if name not in EVALUATORS:
+        raise ValueError("Unknown evaluator: {}".format(name))
+    if name == "weighted" and not batch_evaluation.available():
+        raise ValueError("The weighted evaluator needs NumPy")
+    evaluator = name
+
+def set_weights(path = None):
+    """
+    Load the weight file of the current evaluator: path, or by default
+    HEURISTIC_PATH for the heuristic (whose built-in weights are kept if
+    there is no file) and PATTERNS_PATH for the pattern tables.
+    Returns a description of the weights in use.
+    """
+    if evaluator == "patterns":
+        set_weights_path(path or PATTERNS_PATH)
+        return "pattern weights from {}".format(path or PATTERNS_PATH)
+    reset_weights()
+    if evaluator != "heuristic" or (path is None and not os.path.exists(HEURISTIC_PATH)):
+        return "built-in weights"
+    try:
+        load_heuristic_weights(path or HEURISTIC_PATH)
+    except (OSError, ValueError, KeyError) as error:
+        eprint("Ignoring heuristic weights:", error)
+        return "built-in weights"
+    return "heuristic weights from {}".format(path or HEURISTIC_PATH)
+
+def start_tracking(board):
+    """
+    Called by the select_move functions before searching board: with the
+    heuristic evaluator, create the evaluation state that the search updates
+    incrementally through enter_child/leave_child (with the pattern
+    evaluator, the pattern indices; with another evaluator and ProbCut on,
+    the number of empty squares).
+    """
+    global tracker, searching
+    searching = True
+    if evaluator == "heuristic":
+        tracker = EvalState(board)
+    elif evaluator == "patterns":
+        tracker = PatternState(board)
+    elif probcut is not None:
+        tracker = EmptyCount(board)
+    else:
+        tracker = None
+
+def stop_tracking():
+    global tracker, searching
+    tracker = None
+    searching = False
+
+def outside_search(node, board, arguments):
+    """
+    Run node(*arguments), a node function called directly rather than by a
+    select_move function, as a search of its own: from fresh killer and
+    history tables, so that its result does not depend on earlier calls.
+    """
+    global searching
+    move_ordering(len(board)).clear()
+    searching = True
+    try:
+        return node(*arguments)
+    finally:
+        searching = False
+
+def evaluate(board, color):
+    """
+    Value of a non-terminal node at the depth limit for color.
+    """
+    if counters is not None:
+        counters.leaves += 1
+    if evaluator == "utility":
+        return compute_utility(board, color)
+    if evaluator == "weighted":
+        return batch_evaluation.weighted_values([board], color)[0]
+    if evaluator == "patterns":
+        if tracker is not None:
+            return tracker.value(color)
+        return pattern_tables(len(board)).value(board, color)
+    if tracker is not None:
+        return tracker.heuristic(color)
+    return compute_heuristic(board, color)
+
+def batches(children, limit):
+    """
+    Return True if the children of a node searched with the given limit are
+    leaves that should be evaluated in one batch. Only children whose boards
+    were already built by node ordering are batched: building the others
+    just to evaluate them would cost more than the cutoffs save.
+    """
+    return (limit == 1 and batching and evaluator in ("utility", "weighted") and
+            len(children) >= batch_evaluation.MIN_BATCH and children[0][2] is not None)
+
+def frontier_node(color, alpha, beta, children, maximize):
+    """
+    Search a node one ply above the depth limit: evaluate all of its children
+    in one batch, then go through them as the alpha-beta loop does, with the
+    same cutoffs, so that the result is the same. Each child reached is
+    counted by the timer as if it had been visited.
+    OUTPUT: a tuple (best move, value)
+    """
+    boards = [child[2] for child in children]
+    if evaluator == "utility":
+        values = batch_evaluation.utilities(boards, color)
+    else:
+        values = batch_evaluation.weighted_values(boards, color)
+    if counters is not None:
+        counters.nodes += len(boards)
+        counters.leaves += len(boards)
+    best_move = None
+    if maximize:
+        best = float('-inf')
+        for child, utility in zip(children, values):
+            if timer is not None:
+                timer.check()
+            if utility > best:
+                best_move = child[0]
+                best = utility
+            alpha = max(alpha, best)
+            if alpha >= beta:
+                if counters is not None:
+                    counters.cutoff(child is children[0])
+                break
+    else:
+        best = float('inf')
+        for child, utility in zip(children, values):
+            if timer is not None:
+                timer.check()
+            if utility < best:
+                best_move = child[0]
+                best = utility
+            beta = min(beta, best)
+            if beta <= alpha:
+                if counters is not None:
+                    counters.cutoff(child is children[0])
+                break
+    return best_move, best
+
+def terminal_utility(board, color):
+    """
+    Value of a node where the player to move has no moves (the game is over).
+    With a heuristic evaluator, final results are scaled so that a won game
+    always outranks a good heuristic value.
+    """
+    if evaluator == "utility":
+        return compute_utility(board, color)
+    return compute_utility(board, color) * TERMINAL_SCALE
+
+def hash_move_first(children, move):
+    """
+    Move the child reached by the best move stored in the transposition table
+    to the front.
+    """
+    if move is not None:
+        for index, child in enumerate(children):
+            if child[0] == move:
+                children.insert(0, children.pop(index))
+                break
+
+def open_book(path, n):
+    """
+    Memory-map the opening book for an n x n board. path may contain "{}"
+    for the board size; "off" disables the book. Returns the OpeningBook or
+    None if there is no usable book.
+    """
+    global book
+    if book is not None:
+        book.close()
+    book = None
+    if path == "off":
+        return None
+    path = path.format(n)
+    if os.path.exists(path):
+        try:
+            book = OpeningBook(path)
+        except (OSError, ValueError) as error:
+            eprint("Ignoring opening book:", error)
+    return book
+
+def analysis_tag(n):
+    """
+    Return a 64-bit digest of the settings besides the evaluator that the
+    values of a search of an n x n board depend on: the weights in use
+    (heuristic weights or pattern tables) and the Multi-ProbCut
+    calibration, if any. Analysis files are only shared by searches with
+    the same tag.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    if evaluator == "patterns":
+        for weights in pattern_tables(n).weights:
+            digest.update(weights.tobytes())
+    elif evaluator == "heuristic":
+        digest.update(repr(current_weights()).encode())
+    digest.update(repr(sorted(probcut.cuts.items()) if probcut is not None else None).encode())
+    return int.from_bytes(digest.digest(), "little")
+
+def open_analysis(path, n):
+    """
+    Open the analysis file for an n x n board, the current evaluator and
+    its settings (see analysis_tag). path may contain "{}" for the board
+    size. Returns the AnalysisCache or None if the file belongs to another
+    evaluator or other settings, or cannot be read.
+    """
+    global analysis
+    if analysis is not None: # keep what the games so far found
+        analysis.merge()
+        analysis.close()
+    try:
+        analysis = AnalysisCache(path.format(n), n, evaluator, tag=analysis_tag(n))
+    except (OSError, ValueError) as error:
+        eprint("Ignoring analysis cache:", error)
+        analysis = None
+    return analysis
+
+def load_probcut(path):
+    """
+    Load the Multi-ProbCut coefficients of the current evaluator from the
+    calibration file path. Returns the ProbCutModel or None.
+    """
+    try:
+        return load_model(path, evaluator)
+    except (OSError, ValueError) as error:
+        eprint("Ignoring ProbCut calibration:", error)
+        return None
+
+def book_move(board, color):
+    """
+    Return the book move for board with color to move, or None if the
+    position is not in the book.
+    """
+    if book is None:
+        return None
+    entry = book.probe(board, color)
+    if entry is None or entry[0] not in get_possible_moves(board, color):
+        return None
+    return entry[0]
+
+def parse_options(fields):
+    """
+    Parse the optional key=value fields that follow the five standard fields
+    of the handshake line.
+    """
+    options = {}
+    for field in fields:
+        if "=" in field:
+            key, value = field.split("=", 1)
+            options[key.strip()] = value.strip()
+    return options
     
 def compute_utility(board, color):
     # IMPLEMENT!
@@ -35,186 +498,237 @@ def compute_heuristic(board, color):
     Method to heuristic value of board, to be used if we are at a depth limit.
     INPUT: a game state and the player that is in control
     OUTPUT: an integer that represents heuristic value
-    """
-
-    CORNER_WEIGHT = 25
-    EDGE_WEIGHT = 5
-    STABLE_WEIGHT = 15
-    MOBILITY_WEIGHT = 10
-    DISK_WEIGHT = 1
 
-    opponent_color = 3 - color
+    The value is a weighted sum of five differences between color and the
+    opponent: corners owned, edge squares owned, stable discs of color (discs
+    with an unbroken line of own discs to the edge), legal moves (mobility)
+    and discs. The weights depend on the game phase, chosen by the share of
+    empty squares: the opening rewards corners, edges and mobility, the
+    midgame adds stability and discs, the endgame drops edges and mobility.
+    The terms are kept up to date move by move in an EvalState (see
+    evaluation.py); here one is built for a single board.
+    """
+    return EvalState(board).heuristic(color)
 
-    corners = [(0, 0), (0, len(board) - 1), (len(board) - 1, 0), (len(board) - 1, len(board) - 1)]
-
-    corner_score = 0
-    for i, j in corners:
-        if board[i][j] == color:
-            corner_score += 1
-        elif board[i][j] == opponent_color:
-            corner_score -= 1
-
-    edge_score = 0
-    for i in range(1, len(board) - 1):
-        if board[0][i] == color:
-            edge_score += 1
-        elif board[0][i] == opponent_color:
-            edge_score -= 1
-
-        if board[len(board) - 1][i] == color:
-            edge_score += 1
-        elif board[len(board) - 1][i] == opponent_color:
-            edge_score -= 1
-
-        if board[i][0] == color:
-            edge_score += 1
-        elif board[i][0] == opponent_color:
-            edge_score -= 1
-
-        if board[i][len(board) - 1] == color:
-            edge_score += 1
-        elif board[i][len(board) - 1] == opponent_color:
-            edge_score -= 1
-
-    stable_score = 0
-    rows, cols = len(board), len(board[0])
-
-    def is_stable(i, j):
-        if board[i][j] != color:
-            return False
-        directions = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]
-        for x, y in directions:
-            n_x, n_y = i + x, j + y
-            while 0 <= n_x < rows and 0 <= n_y < cols:
-                if board[n_x][n_y] == 0 or board[n_x][n_y] == opponent_color:
-                    break
-                n_x, n_y = n_x + x, n_y + y
-            else:
-                return True
-        return False
-
-    for i in range(rows):
-        for j in range(cols):
-            if is_stable(i, j):
-                stable_score += 1 if board[i][j] == color else -1
-
-    player_moves = len(get_possible_moves(board, color))
-    opponent_moves = len(get_possible_moves(board, opponent_color))
-    mobility_score = player_moves - opponent_moves
-
-    player_disks = sum(row.count(color) for row in board)
-    opponent_disks = sum(row.count(opponent_color) for row in board)
-    disk_score = player_disks - opponent_disks
-
-    total_squares = len(board) * len(board[0])
-    empty_squares = sum(row.count(0) for row in board)
-
-    if empty_squares > total_squares * 0.5:
-        corner_weight = CORNER_WEIGHT
-        edge_weight = EDGE_WEIGHT
-        stable_weight = 0 
-        mobility_weight = MOBILITY_WEIGHT
-        disk_weight = 0 
-    elif empty_squares > total_squares * 0.2:
-        corner_weight = CORNER_WEIGHT
-        edge_weight = EDGE_WEIGHT // 2
-        stable_weight = STABLE_WEIGHT
-        mobility_weight = MOBILITY_WEIGHT // 2
-        disk_weight = DISK_WEIGHT
-    else: 
-        corner_weight = CORNER_WEIGHT
-        edge_weight = 0 
-        stable_weight = STABLE_WEIGHT * 2
-        mobility_weight = 0  
-        disk_weight = DISK_WEIGHT * 2
-
-    heuristic_value = (
-        corner_weight * corner_score +
-        edge_weight * edge_score +
-        stable_weight * stable_score +
-        mobility_weight * mobility_score +
-        disk_weight * disk_score
-    )
-
-    return heuristic_value
+############ NEGAMAX ################################
+def player_bound(flag, sign):
+    """
+    Flag of a cache entry once its value is multiplied by sign: negating a
+    lower bound gives an upper bound and vice versa.
+    """
+    if sign > 0 or flag == EXACT:
+        return flag
+    return UPPER if flag == LOWER else LOWER
 
-############ MINIMAX ###############################
-def minimax_min_node(board, color, limit, caching = 0):
-    # IMPLEMENT!
+def negamax_node(board, color, player, alpha, beta, limit, caching = 0, ordering = 0, key = None, pruning = True):
     """
-    A helper function for minimax that finds the lowest possible utility
+    Negamax search of board with player to move: the core of the minimax and
+    alpha-beta searches below, which only convert its result. Values are
+    computed for color (at the depth limit and at the end of the game) and
+    negated for the opponent, so the value returned is for player.
+    With pruning, this is a principal variation search with the fail-soft
+    window (alpha, beta): the first child (the best one according to node
+    ordering and the cache) is searched with the full window and the others
+    only with a null window, which proves them no better, and again with
+    the full window only if they fail high (see pvs_child). Without pruning
+    every child is searched with an infinite window (minimax).
+    Cache entries are stored under the same keys, and with values and
+    bounds for color, as by the min/max functions before, so the minimax,
+    alpha-beta and MTD(f) searches share them.
+    OUTPUT: a tuple (best move, value for player)
     """
-    # HINT:
-    # 1. Get the allowed moves
-    # 2. Check if w are at terminal state
-    # 3. If not, for each possible move, get the max utiltiy
-    # 4. After checking every move, you can find the minimum utility
-    # ...
+    if not searching:
+        return outside_search(negamax_node, board, (board, color, player, alpha, beta, limit, caching, ordering, key, pruning))
+    if timer is not None:
+        timer.check()
+    if counters is not None:
+        counters.nodes += 1
 
-    best_move = None
+    sign = 1 if player == color else -1
 
     if limit == 0:
-        return best_move, compute_utility(board, color)
-    
-    if caching and board in cache:
-        return best_move, cache[board]
+        return None, sign * evaluate(board, color)
 
-    opponent_color = 3 - color
-    possible_moves = get_possible_moves(board, opponent_color)
+    n = len(board)
+    if caching:
+        if key is None:
+            key = position_key(board, player, color)
+        slot, entry = probe_position(key, n)
+        if entry is not None:
+            entry = (entry[0], player_bound(entry[1], sign), sign * entry[2]) + entry[3:]
+            if usable(entry, search_depth(limit), alpha, beta):
+                return entry[3], entry[2]
+
+    children = expand(board, player)
+
+    if not children:
+        utility = terminal_utility(board, color)
+        if caching:
+            store_position(slot, n, UNLIMITED, EXACT, utility, None)
+        return None, sign * utility
+
+    if probcut is not None and pruning and limit >= PROBCUT_MIN_DEPTH:
+        value = probcut_node(board, color, player, alpha, beta, limit, caching, ordering, key)
+        if value is not None:
+            return None, value
+
+    if ordering:
+        children = order_node(board, player, color, children, limit, player == color)
 
-    if not possible_moves:
-        return best_move, compute_utility(board, color)
+    if caching and entry is not None:
+        hash_move_first(children, entry[3])
 
-    min_utility = float('inf')
-    for possible_move in possible_moves:
-        new_board = play_move(board, opponent_color, possible_move[0], possible_move[1])
-        old_node, utility = minimax_max_node(new_board, color, limit - 1, caching)
-        if utility < min_utility:
-            best_move = possible_move
-        min_utility = min(min_utility, utility)
+    alpha_start, beta_start = alpha, beta
+    if batches(children, limit):
+        if sign > 0:
+            best_move, best = frontier_node(color, alpha, beta, children, True)
+        else:
+            best_move, best = frontier_node(color, -beta, -alpha, children, False)
+            best = -best
+    else:
+        best_move = None
+        best = float('-inf')
+        for possible_move, flips, new_board in children:
+            if new_board is None:
+                new_board = apply_move(board, player, possible_move[0], possible_move[1], flips)
+            new_key, mask = enter_child(key, n, player, possible_move, flips, limit)
+            if pruning:
+                value = pvs_child(new_board, color, player, alpha, beta, limit - 1, caching, ordering, new_key,
+                                  best_move is None)
+            else:
+                value = -negamax_node(new_board, color, 3 - player, float('-inf'), float('inf'), limit - 1,
+                                      caching, 0, new_key, False)[1]
+            leave_child(n, player, possible_move, mask)
+            if value > best:
+                best_move = possible_move
+                best = value
+
+            if pruning:
+                alpha = max(alpha, best)
+                if alpha >= beta:
+                    if ordering:
+                        move_ordering(n).cutoff(player, possible_move, limit)
+                    if counters is not None:
+                        counters.cutoff(possible_move == children[0][0])
+                    break
 
     if caching:
-        cache[board] = min_utility
-    return best_move, min_utility
+        store_position(slot, n, search_depth(limit), player_bound(bound_flag(best, alpha_start, beta_start), sign),
+                       sign * best, best_move)
+    return best_move, best
 
-def minimax_max_node(board, color, limit, caching = 0):
-    # IMPLEMENT!
+def probcut_node(board, color, player, alpha, beta, limit, caching = 0, ordering = 0, key = None):
     """
-    A helper function for minimax that finds the highest possible utility
+    Multi-ProbCut test of a node of negamax_node (see probcut.py): return
+    beta if a shallow search predicts that the search to limit would fail
+    high, alpha if it predicts a fail low, or None if the node must be
+    searched. Nothing is stored in the cache for a cut node.
     """
-    # HINT:
-    # 1. Get the allowed moves
-    # 2. Check if w are at terminal state
-    # 3. If not, for each possible move, get the min utiltiy
-    # 4. After checking every move, you can find the maximum utility
-    # ...
+    empties = tracker.empties if tracker is not None else sum(row.count(0) for row in board)
+    cut = probcut.lookup(len(board), empties, limit, 1 if player == color else -1)
+    if cut is None:
+        return None
+    # A single shallow search with the window (lower, upper) answers both tests.
+    inf = float('inf')
+    lower = probcut.lower_cut(cut, alpha) if alpha > -inf else -inf
+    upper = probcut.upper_cut(cut, beta) if beta < inf else inf
+    if lower >= upper or (lower == -inf and upper == inf):
+        return None
+    value = negamax_node(board, color, player, lower, upper, cut[0], caching, ordering, key)[1]
+    if value >= upper:
+        result = beta
+    elif value <= lower:
+        result = alpha
+    else:
+        return None
+    if counters is not None:
+        counters.probcuts += 1
+    return result
 
+def pvs_child(new_board, color, player, alpha, beta, limit, caching = 0, ordering = 0, key = None, first = True):
+    """
+    Value for player of new_board, the child reached by a move of player,
+    searched to the given limit as a principal variation search does: with
+    the full window (alpha, beta) if it is the first child, otherwise with
+    the null window (alpha, alpha + 1) and, if that proves it better than
+    alpha (values are integers), once more with the full window.
+    The null window is only tried with the cache on, where the re-search
+    finds the bounds the first search stored, and not right above the depth
+    limit, where a child is searched about as fast with the full window:
+    elsewhere the re-searches cost more nodes than the null windows save.
+    """
+    opponent_color = 3 - player
+    if not first and caching and (limit < 0 or limit > 1):
+        value = -negamax_node(new_board, color, opponent_color, -alpha - 1, -alpha, limit, caching, ordering, key)[1]
+        if not alpha < value < beta:
+            return value
+    return -negamax_node(new_board, color, opponent_color, -beta, -alpha, limit, caching, ordering, key)[1]
+
+def mtdf(board, color, limit, guess = 0, ordering = 0):
+    """
+    MTD(f): find the value of board for color (to move) to the depth limit
+    with a sequence of null-window searches of negamax_node. Each search
+    around the current guess proves the value above or below it, the guess
+    moves to the bound returned, and the search stops when the lower and
+    upper bounds meet. The cache must be on: it keeps each search from
+    redoing the work of the previous ones.
+    OUTPUT: a tuple (best move, value)
+    """
+    if not searching:
+        return outside_search(mtdf, board, (board, color, limit, guess, ordering))
+    lower = float('-inf')
+    upper = float('inf')
+    value = guess
     best_move = None
+    while lower < upper:
+        beta = value + 1 if value == lower else value
+        move, value = negamax_node(board, color, color, beta - 1, beta, limit, 1, ordering)
+        if value < beta:
+            upper = value
+        else:
+            lower = value
+            best_move = move or best_move
+    if best_move is None: # never failed high: every move is as bad, take the one of the last search
+        best_move = move or get_possible_moves(board, color)[0]
+    return best_move, value
 
-    if limit == 0:
-        return best_move, compute_utility(board, color)
-    
-    if caching and board in cache:
-        return best_move, cache[board]
-
-    possible_moves = get_possible_moves(board, color)
-
-    if not possible_moves:
-        return best_move, compute_utility(board, color)
+def select_move_mtdf(board, color, limit, ordering = 0):
+    """
+    Choose a move with MTD(f) to the depth limit. The first guess is the
+    value the cache holds for board, if any, else its evaluation. Ties
+    between moves of equal value may be broken differently than by
+    select_move_alphabeta.
+    """
+    if not get_possible_moves(board, color):
+        return None
+    cache.new_search()
+    if ordering:
+        move_ordering(len(board)).new_search()
+    slot, entry = probe_position(position_key(board, color, color), len(board))
+    guess = entry[2] if entry is not None else evaluate(board, color)
+    start_tracking(board)
+    try:
+        move, value = mtdf(board, color, limit, guess, ordering)
+    finally:
+        stop_tracking()
+    return move
 
-    max_utility = float('-inf')
-    for possible_move in possible_moves:
-        new_board = play_move(board, color, possible_move[0], possible_move[1])
-        old_node, utility = minimax_min_node(new_board, color, limit - 1, caching)
-        if utility > max_utility:
-            best_move = possible_move
-        max_utility = max(max_utility, utility)
+############ MINIMAX ###############################
+def minimax_min_node(board, color, limit, caching = 0, key = None):
+    """
+    A helper function for minimax that finds the lowest possible utility
+    (the opponent of color to move), with negamax_node.
+    """
+    move, value = negamax_node(board, color, 3 - color, float('-inf'), float('inf'), limit, caching, 0, key, False)
+    return move, -value
 
-    if caching:
-        cache[board] = max_utility
-    return best_move, max_utility
+def minimax_max_node(board, color, limit, caching = 0, key = None):
+    """
+    A helper function for minimax that finds the highest possible utility
+    (color to move), with negamax_node.
+    """
+    return negamax_node(board, color, color, float('-inf'), float('inf'), limit, caching, 0, key, False)
 
-    
 def select_move_minimax(board, color, limit, caching = 0):
     # IMPLEMENT!
     """
@@ -228,108 +742,53 @@ def select_move_minimax(board, color, limit, caching = 0):
     INPUT: a game state, the player that is in control, the depth limit for the search, and a flag determining whether state caching is on or not
     OUTPUT: a tuple of integers (i,j) representing a move, where i is the column and j is the row on the board.
     """
-    possible_moves = get_possible_moves(board, color)
+    children = expand(board, color)
     
-    if not possible_moves:
+    if not children:
         return None
 
     best_move = None
     best_utility = float('-inf')
 
-    for possible_move in possible_moves:
-        new_board = play_move(board, color, possible_move[0], possible_move[1])
-        old_node, utility = minimax_min_node(new_board, color, limit-1, caching)
-        if utility > best_utility:
-            best_utility = utility
-            best_move = possible_move
+    key = None
+    if caching:
+        cache.new_search()
+        key = position_key(board, color, color)
+
+    start_tracking(board)
+    try:
+        for possible_move, flips, new_board in children:
+            if new_board is None:
+                new_board = apply_move(board, color, possible_move[0], possible_move[1], flips)
+            new_key, mask = enter_child(key, len(board), color, possible_move, flips, limit)
+            old_node, utility = minimax_min_node(new_board, color, limit-1, caching, new_key)
+            leave_child(len(board), color, possible_move, mask)
+            if utility > best_utility:
+                best_utility = utility
+                best_move = possible_move
+    finally:
+        stop_tracking()
     return best_move
 
 ############ ALPHA-BETA PRUNING #####################
-def alphabeta_min_node(board, color, alpha, beta, limit, caching = 0, ordering = 0):
-    # IMPLEMENT!
+def alphabeta_min_node(board, color, alpha, beta, limit, caching = 0, ordering = 0, key = None):
     """
-    A helper function for alpha-beta that finds the lowest possible utility (don't forget to utilize and update alpha and beta!)
+    A helper function for alpha-beta that finds the lowest possible utility
+    (the opponent of color to move) within the window (alpha, beta), with the
+    principal variation search of negamax_node.
     """
+    move, value = negamax_node(board, color, 3 - color, -beta, -alpha, limit, caching, ordering, key)
+    return move, -value
 
-    best_move = None
-
-    if limit == 0:
-        return best_move, compute_utility(board, color)
-    
-    if caching and board in cache:
-        return best_move, cache[board]
-    
-    opponent_color = 3 - color
-    possible_moves = get_possible_moves(board, opponent_color)
-
-    if not possible_moves:
-        return best_move, compute_utility(board, color)
-
-    if ordering:
-        possible_moves.sort(key=lambda move: compute_utility(
-            play_move(board, opponent_color, move[0], move[1]), color
-        ))
-
-    min_utility = float('inf')
-    for possible_move in possible_moves:
-        new_board = play_move(board, opponent_color, possible_move[0], possible_move[1])
-        old_move, utility = alphabeta_max_node(new_board, color, alpha, beta, limit - 1, caching, ordering)
-        if utility < min_utility:
-            best_move = possible_move
-        min_utility = min(min_utility, utility)
-
-        beta = min(beta, min_utility)
-        
-        if beta <= alpha:
-            break
-        
-    
-    if caching:
-        cache[board] = min_utility
-    return best_move, min_utility
-
-def alphabeta_max_node(board, color, alpha, beta, limit, caching = 0, ordering = 0):
-    # IMPLEMENT!
+def alphabeta_max_node(board, color, alpha, beta, limit, caching = 0, ordering = 0, key = None):
     """
-    A helper function for alpha-beta that finds the highest possible utility (don't forget to utilize and update alpha and beta!)
+    A helper function for alpha-beta that finds the highest possible utility
+    (color to move) within the window (alpha, beta), with the principal
+    variation search of negamax_node.
     """
+    return negamax_node(board, color, color, alpha, beta, limit, caching, ordering, key)
 
-    best_move = None
-
-    if limit == 0:
-        return best_move, compute_utility(board, color)
-    
-    if caching and board in cache:
-        return best_move, cache[board]
-    
-    possible_moves = get_possible_moves(board, color)
-
-    if not possible_moves:
-        return best_move, compute_utility(board, color)
-    
-    if ordering:
-        possible_moves.sort(key=lambda move: compute_utility(
-            play_move(board, color, move[0], move[1]), color
-        ), reverse=True)
-        
-    max_utility = float('-inf')
-    for possible_move in possible_moves:
-        new_board = play_move(board, color, possible_move[0], possible_move[1])
-        old_move, utility = alphabeta_min_node(new_board, color, alpha, beta, limit - 1, caching, ordering)
-        if utility > max_utility:
-            best_move = possible_move
-        max_utility = max(max_utility, utility)
-
-        alpha = max(alpha, max_utility)
-        
-        if alpha >= beta:
-            break        
-
-    if caching:
-        cache[board] = max_utility
-    return best_move, max_utility
-
-def select_move_alphabeta(board, color, limit = -1, caching = 0, ordering = 0):
+def select_move_alphabeta(board, color, limit = -1, caching = 0, ordering = 0, time_limit = None):
     # IMPLEMENT!
     """
     Given a board and a player color, decide on a move using Alpha-Beta algorithm. 
@@ -341,12 +800,27 @@ def select_move_alphabeta(board, color, limit = -1, caching = 0, ordering = 0):
     If caching is OFF (i.e. 0), do NOT use state caching to reduce the number of state evaluations.    
     If ordering is ON (i.e. 1), use node ordering to expedite pruning and reduce the number of state evaluations. 
     If ordering is OFF (i.e. 0), do NOT use node ordering to expedite pruning and reduce the number of state evaluations. 
+    If time_limit is given, search with iterative deepening for at most that many seconds instead (see select_move_iterative).
+    The search runs on the negamax core (see negamax_node): a principal variation search from the root, or MTD(f) if driver is "mtdf".
     INPUT: a game state, the player that is in control, the depth limit for the search, a flag determining whether state caching is on or not, a flag determining whether node ordering is on or not
     OUTPUT: a tuple of integers (i,j) representing a move, where i is the column and j is the row on the board.
     """
-    possible_moves = get_possible_moves(board, color)
+    empties = sum(row.count(0) for row in board)
+    if (limit < 0 or limit >= empties) and empties <= max(endgame_empties, wld_empties):
+        return select_move_endgame(board, color, ordering, time_limit, empties > endgame_empties)
+
+    if smp is not None:
+        return select_move_parallel(board, color, time_limit or MOVE_TIME_LIMIT, limit, ordering)
+
+    if time_limit:
+        return select_move_iterative(board, color, time_limit, limit, caching, ordering)
 
-    if not possible_moves:
+    if driver == "mtdf":
+        return select_move_mtdf(board, color, limit, ordering)
+
+    children = expand(board, color)
+
+    if not children:
         return None
 
     best_move = None
@@ -354,38 +828,377 @@ def select_move_alphabeta(board, color, limit = -1, caching = 0, ordering = 0):
     beta = float('inf')
 
     if ordering:
-        possible_moves.sort(key=lambda move: compute_utility(
-            play_move(board, color, move[0], move[1]), color
-        ), reverse=True)
-
-    for possible_move in possible_moves:
-        new_board = play_move(board, color, possible_move[0], possible_move[1])
-        old_move, utility = alphabeta_min_node(new_board, color, alpha, beta, limit - 1, caching, ordering)
-        if utility > alpha:
-            alpha = utility
-            best_move = possible_move
+        children = order_children(board, color, color, children, True)
+        move_ordering(len(board)).new_search()
+
+    key = None
+    if caching:
+        cache.new_search()
+        key = position_key(board, color, color)
+
+    start_tracking(board)
+    try:
+        for possible_move, flips, new_board in children:
+            if new_board is None:
+                new_board = apply_move(board, color, possible_move[0], possible_move[1], flips)
+            new_key, mask = enter_child(key, len(board), color, possible_move, flips, limit)
+            utility = pvs_child(new_board, color, color, alpha, beta, limit - 1, caching, ordering, new_key,
+                                best_move is None)
+            leave_child(len(board), color, possible_move, mask)
+            if utility > alpha:
+                alpha = utility
+                best_move = possible_move
+    finally:
+        stop_tracking()
+    return best_move
+
+############ ENDGAME ################################
+def select_move_endgame(board, color, ordering = 0, time_limit = None, wld = False):
+    """
+    Choose a move by solving the rest of the game exactly with the endgame
+    solver (see endgame.py). The root moves are searched in the same order,
+    and ties broken the same way, as in select_move_alphabeta, so the chosen
+    move is the one an unlimited alpha-beta search would choose. If wld is
+    True, only win/loss/draw is determined and the first winning (or else
+    drawing) move is returned. The solve is aborted after time_limit seconds
+    (the move time limit if not given), returning the best move so far.
+    """
+    global timer
+    children = expand(board, color)
+
+    if not children:
+        return None
+
+    if ordering:
+        children = order_children(board, color, color, children, True)
+
+    n = len(board)
+    own, opp = othello_bitboard.player_masks(board, color)
+    best_move = children[0][0]
+    alpha = float('-inf')
+    timer = TimeManager(time_limit or MOVE_TIME_LIMIT)
+    solver = EndgameSolver(n, timer)
+    try:
+        for possible_move, flips, new_board in children:
+            square = possible_move[0] * n + possible_move[1]
+            mask = flips_to_mask(flips, n)
+            new_own = own | mask | (1 << square)
+            if wld:
+                utility = -solver.solve(opp ^ mask, new_own, -WIN, WIN)
+                utility = (utility > 0) - (utility < 0)
+            else:
+                utility = -solver.solve(opp ^ mask, new_own, float('-inf'), -alpha)
+            if utility > alpha:
+                alpha = utility
+                best_move = possible_move
+                if wld and utility == WIN:
+                    break
+    except SearchTimeout:
+        eprint("Endgame solver ran out of time")
+    finally:
+        timer = None
+        if counters is not None:
+            counters.nodes += solver.nodes
+    return best_move
+
+############ ITERATIVE DEEPENING ####################
+def principal_variation(board, color, length):
+    """
+    Return the principal variation from board (color to move) as stored in
+    the transposition table: the chain of best moves, at most length long.
+    """
+    line = []
+    to_move = color
+    while len(line) < length:
+        slot, entry = probe_position(position_key(board, to_move, color), len(board))
+        if entry is None or entry[3] is None or entry[3] not in get_possible_moves(board, to_move):
+            break
+        line.append(entry[3])
+        board = play_move(board, to_move, entry[3][0], entry[3][1])
+        to_move = 3 - to_move
+    return line
+
+def select_move_iterative(board, color, time_limit, limit = -1, caching = 0, ordering = 0,
+                          start_depth = 1, seed = None):
+    """
+    Anytime version of select_move_alphabeta. Searches to depth 1, 2, 3, ...
+    (up to limit if it is positive, and never deeper than the number of empty
+    squares) until time_limit seconds minus a safety margin are used up, and
+    returns the best move of the deepest completed iteration. An iteration
+    that is cut short still counts if it already proved a different move
+    better, since the previous best move is always searched first.
+    The previous iterations are carried over through the transposition
+    table: the stored best moves (the previous principal variation) are
+    searched first at every node, so this search always uses the table,
+    whatever the caching flag says.
+    The helpers of the parallel search start at a later start_depth and
+    shuffle the root moves after the best one with a random generator
+    seeded with seed. search_stats records the result.
+    """
+    global timer
+    moves = get_moves_and_flips(board, color)
+    search_stats.clear()
+    search_stats.update(depth=0, move=None, nodes=0)
+
+    if not moves:
+        return None
+    if len(moves) == 1:
+        search_stats["move"] = moves[0][0]
+        return moves[0][0]
+
+    empties = sum(row.count(0) for row in board)
+    max_depth = empties if limit < 0 else min(limit, empties)
+
+    cache.new_search()
+    move_ordering(len(board)).new_search()
+    n = len(board)
+    key = position_key(board, color, color)
+    slot = symmetry(n).canonical(key)
+    children = []
+    for move, flips in moves:
+        mask = flips_to_mask(flips, n)
+        children.append((move, apply_move(board, color, move[0], move[1], flips),
+                         symmetry(n).play(key, color, move[0] * n + move[1], mask), mask))
+
+    best_move = moves[0][0]
+    completed = 0
+    scores = {}
+    rng = random.Random(seed) if seed is not None else None
+    timer = TimeManager(time_limit, should_stop=stop_signal)
+    start_tracking(board)
+    try:
+        for depth in range(min(start_depth, max_depth), max_depth + 1):
+            if not timer.can_start_iteration():
+                break
+            started = time.perf_counter()
+            if scores:
+                children.sort(key=lambda child: (child[0] != best_move, -scores[child[0]]))
+            if rng is not None:
+                rest = children[1:]
+                rng.shuffle(rest)
+                children[1:] = rest
+            alpha = float('-inf')
+            iteration_best = None
+            try:
+                for move, new_board, new_key, flips in children:
+                    if tracker is not None:
+                        tracker.make(color, move[0] * n + move[1], flips)
+                    utility = pvs_child(new_board, color, color, alpha, float('inf'), depth - 1, 1, ordering,
+                                        new_key, iteration_best is None)
+                    leave_child(n, color, move, flips)
+                    scores[move] = utility
+                    if utility > alpha:
+                        alpha = utility
+                        iteration_best = move
+            except SearchTimeout:
+                if iteration_best is not None:
+                    best_move = iteration_best
+                break
+            best_move = iteration_best
+            completed = depth
+            store_position(slot, n, depth, EXACT, alpha, best_move)
+            if counters is not None:
+                counters.finished_depth(depth)
+            timer.finished_iteration(started)
+    finally:
+        search_stats.update(depth=completed, move=best_move, nodes=timer.nodes)
+        timer = None
+        stop_tracking()
+    return best_move
+
+def select_move_parallel(board, color, time_limit, limit = -1, ordering = 0):
+    """
+    Lazy SMP: the helper processes of smp search the same root as this
+    process with select_move_iterative, half of them one ply ahead and all
+    with their own root move order, sharing the transposition table (which
+    must be a SharedTranspositionTable). When this search ends the helpers
+    are stopped, and the best move of the deepest iteration completed by any
+    process is returned (this process's move if none went deeper).
+    """
+    smp.start(board, color, time_limit, limit, ordering, cache.generation + 1)
+    try:
+        best_move = select_move_iterative(board, color, time_limit, limit, 1, ordering)
+    finally:
+        results = smp.finish()
+    best_depth = search_stats["depth"]
+    for depth, move, nodes in results:
+        if depth > best_depth and move is not None:
+            best_depth = depth
+            best_move = move
+    search_stats["depth"] = best_depth
+    search_stats["nodes"] += sum(result[2] for result in results)
     return best_move
 
 ####################################################
-def run_ai():
+############ PONDERING ##############################
+def ponder(board, color, ordering, stop):
     """
-    This function establishes communication with the game manager.
-    It first introduces itself and receives its color.
-    Then it repeatedly receives the current score and current board state until the game is over.
+    Body of the ponder thread. board is the position after our move, with
+    the opponent to move. The replies are searched one ply deeper at a time,
+    all of them at each depth, the reply our own search expected first
+    (the best move stored in the cache for board). Every result goes into the
+    cache and into ponder_results, until stop is stopped or runs out of time.
     """
-    print("Othello AI") # First line is the name of this AI
-    arguments = input().split(",")
-    
-    color = int(arguments[0]) # Player color: 1 for dark (goes first), 2 for light. 
-    limit = int(arguments[1]) # Depth limit
-    minimax = int(arguments[2]) # Minimax or alpha beta
-    caching = int(arguments[3]) # Caching 
-    ordering = int(arguments[4]) # Node-ordering (for alpha-beta only)
+    global timer
+    opponent_color = 3 - color
+    replies = get_possible_moves(board, opponent_color)
+    slot, entry = probe_position(position_key(board, opponent_color, color), len(board))
+    if entry is not None and entry[3] in replies:
+        replies.remove(entry[3])
+        replies.insert(0, entry[3])
+    positions = [play_move(board, opponent_color, move[0], move[1]) for move in replies]
+    positions = [new_board for new_board in positions if get_possible_moves(new_board, color)]
+    empties = sum(row.count(0) for row in board) - 1
+    timer = stop
+    try:
+        for depth in range(1, empties + 1):
+            for new_board in positions:
+                start_tracking(new_board)
+                try:
+                    move, value = alphabeta_max_node(new_board, color, float('-inf'), float('inf'),
+                                                     depth, 1, ordering)
+                finally:
+                    stop_tracking()
+                ponder_results[othello_bitboard.pack_board(new_board)] = (depth, move)
+    except SearchTimeout:
+        pass
+    finally:
+        timer = None
+
+def start_pondering(board, color, ordering = 0):
+    """
+    Start pondering on board (the position after our move).
+    """
+    global ponder_thread, ponder_stop
+    ponder_results.clear()
+    cache.new_search()
+    move_ordering(len(board)).new_search()
+    ponder_stop = TimeManager(MOVE_TIME_LIMIT)
+    ponder_thread = threading.Thread(target=ponder, args=(board, color, ordering, ponder_stop), daemon=True)
+    ponder_thread.start()
+
+def stop_pondering():
+    """
+    Stop the ponder thread, if any, and wait until it has left the search.
+    """
+    global ponder_thread
+    if ponder_thread is not None:
+        ponder_stop.stop()
+        ponder_thread.join()
+        ponder_thread = None
+
+def pondered_move(board, limit):
+    """
+    Return the best move found while pondering on board if it was searched
+    to at least the depth limit, or None.
+    """
+    result = ponder_results.get(othello_bitboard.pack_board(board))
+    if result is None or limit < 0 or result[0] < limit:
+        return None
+    return result[1]
+
+def write_stats(stream, board, color, move, source, limit):
+    """
+    Write the statistics of the move just played as one JSON line (see
+    instrumentation.py). The principal variation is read from the cache.
+    """
+    empties = sum(row.count(0) for row in board)
+    depth = empties if limit < 0 or limit >= empties else limit
+    if source == "search" and not counters.depths:
+        counters.finished_depth(depth)
+    record = counters.record(list(move), source, None)
+    pv = principal_variation(board, color, depth)
+    if not pv or pv[0] != move:
+        pv = [move]
+    record["pv"] = [list(pv_move) for pv_move in pv]
+    write_record(stream, record)
+
+def parse_handshake(arguments):
+    """
+    Return the settings of a game from the comma-separated fields of its
+    handshake line as a dict.
+    """
+    options = parse_options(arguments[5:]) # Optional key=value fields
+    return {"color": int(arguments[0]), # Player color: 1 for dark (goes first), 2 for light.
+            "limit": int(arguments[1]), # Depth limit
+            "minimax": int(arguments[2]), # Minimax or alpha beta
+            "caching": int(arguments[3]), # Caching
+            "ordering": int(arguments[4]), # Node-ordering (for alpha-beta only)
+            "options": options,
+            "protocol": options.get(othello_protocol.CAPABILITY, othello_protocol.TEXT)} # Board encoding
+
+def configure(game, pondering = True):
+    """
+    Apply the search settings of game (from parse_handshake) that belong to
+    the whole process: evaluator, backend, table, selective and parallel
+    search, driver, endgame solver and statistics. Settings left out of the
+    options get their defaults. Returns the settings the turns of the game
+    need (time limit, pondering, statistics stream, book and analysis
+    files) as a dict. When the settings that values depend on (evaluator,
+    weights, ProbCut) differ from the last game's, the cache, the move
+    ordering tables and the ponder results are cleared, since what they
+    hold was searched with the old ones.
+    """
+    global cache, smp, batching, endgame_empties, wld_empties, counters, driver, probcut, values_settings
+    limit, minimax, caching, ordering = game["limit"], game["minimax"], game["caching"], game["ordering"]
+    options = game["options"]
+
+    time_limit = float(options.get("time", 0)) # Seconds per move for iterative deepening
+
+    if "hash_mb" in options and not isinstance(cache, SharedTranspositionTable):
+        cache.resize(int(options["hash_mb"]))
+
+    set_evaluator(options.get("eval", "utility"))
+    eprint("Depth Limit Evaluation is", evaluator.upper())
+    weights_path = options.get("weights") # Weight file of the evaluator ("{}" stands for the board size of pattern weights)
+    if evaluator in ("heuristic", "patterns"):
+        eprint("Evaluation uses", set_weights(weights_path))
+
+    batching = batch_evaluation.available() and options.get("batch", "1") != "0"
+    if batching: eprint("Batched Evaluation is ON")
+
+    backend = options.get("backend", "tuple")
+    set_backend(backend)
+    eprint("Move Generation Backend is", backend.upper())
+
+    probcut = None
+    probcut_path = options.get("probcut", "0") # Selective search: 1 for the default calibration file, or a file name
+    if (minimax == 0 and probcut_path != "0"):
+        probcut_path = PROBCUT_PATH if probcut_path == "1" else probcut_path
+        probcut = load_probcut(probcut_path)
+        if probcut is not None: eprint("Multi-ProbCut is ON ({} cuts from {})".format(len(probcut), probcut_path))
+        else: eprint("Multi-ProbCut is OFF (no calibration for {} in {})".format(evaluator, probcut_path))
+
+    settings = (evaluator, weights_path, probcut_path if probcut is not None else None)
+    if settings != values_settings:
+        if values_settings is not None:
+            stop_pondering()
+            ponder_results.clear()
+            cache.clear()
+            clear_move_ordering()
+        values_settings = settings
+
+    if smp is not None: # helpers of an earlier game's settings
+        smp.close()
+        smp = None
+    if isinstance(cache, SharedTranspositionTable):
+        cache.close()
+        cache = TranspositionTable(int(options.get("hash_mb", 32)))
+    workers = int(options.get("workers", 1)) # Processes of the parallel search
+    if (minimax == 0 and workers > 1):
+        cache = SharedTranspositionTable(int(options.get("hash_mb", 32)))
+        smp = LazySMP(workers, cache, backend, evaluator, probcut_path if probcut is not None else None,
+                      weights_path)
+        eprint("Lazy SMP is ON ({} processes)".format(workers))
+
+    driver = options.get("search", "pvs")
+    if driver not in DRIVERS:
+        raise ValueError("Unknown search driver: {}".format(driver))
 
     if (minimax == 1): eprint("Running MINIMAX")
-    else: eprint("Running ALPHA-BETA")
+    else: eprint("Running ALPHA-BETA ({})".format(driver.upper()))
 
-    if (caching == 1): eprint("State Caching is ON")
+    if (caching == 1): eprint("State Caching is ON ({} table slots)".format(cache.slots))
     else: eprint("State Caching is OFF")
 
     if (ordering == 1): eprint("Node Ordering is ON")
@@ -394,34 +1207,181 @@ def run_ai():
     if (limit == -1): eprint("Depth Limit is OFF")
     else: eprint("Depth Limit is ", limit)
 
+    if (time_limit > 0): eprint("Iterative Deepening is ON, {} seconds per move".format(time_limit))
+
+    endgame_empties = int(options.get("endgame", EXACT_EMPTIES))
+    wld_empties = int(options.get("wld", 0))
+    if (minimax == 0 and endgame_empties > 0): eprint("Endgame Solver is ON at {} empties".format(endgame_empties))
+    if (minimax == 0 and wld_empties > endgame_empties): eprint("Win/Loss/Draw Solver is ON at {} empties".format(wld_empties))
+
     if (minimax == 1 and ordering == 1): eprint("Node Ordering should have no impact on Minimax")
 
+    pondering = pondering and minimax == 0 and options.get("ponder", "0") == "1"
+    if pondering: eprint("Pondering is ON")
+
+    counters = None
+    stats_stream = None
+    stats = options.get("stats", "0") # Per-move search statistics: 1 for stderr, or a file name
+    if (stats != "0"):
+        counters = SearchCounters()
+        stats_stream = sys.stderr if stats == "1" else open(stats, "a")
+        eprint("Search Statistics are ON ({})".format("stderr" if stats == "1" else stats))
+
+    analysis_path = options.get("analysis", "0") # Persistent analysis cache: 1 for the default file, or a file name
+    if (caching == 1 and analysis_path != "0"):
+        analysis_path = ANALYSIS_PATH if analysis_path == "1" else analysis_path
+    else:
+        analysis_path = None
+
+    return {"time_limit": time_limit, "pondering": pondering, "stats_stream": stats_stream,
+            "book_path": options.get("book", BOOK_PATH), "analysis_path": analysis_path}
+
+def open_files(settings, n):
+    """
+    Open the opening book and the analysis file of settings for an n x n
+    board, once the board size is known, unless they are open already.
+    """
+    global files_opened, analysis
+    opened = (settings["book_path"], settings["analysis_path"], evaluator,
+              analysis_tag(n) if settings["analysis_path"] is not None else None, n)
+    if opened == files_opened:
+        return
+    files_opened = opened
+    if open_book(settings["book_path"], n) is not None:
+        eprint("Opening Book is ON ({} positions)".format(len(book)))
+    if settings["analysis_path"] is not None:
+        if open_analysis(settings["analysis_path"], n) is not None:
+            eprint("Analysis Cache is ON ({} positions in {})".format(len(analysis), analysis.path))
+    elif analysis is not None:
+        analysis.merge()
+        analysis.close()
+        analysis = None
+
+def play_turn(game, settings, board, reply):
+    """
+    Choose the move of game on board and send it with reply(i, j); then
+    write its statistics and start pondering, if they are on.
+    """
+    color, limit, ordering = game["color"], game["limit"], game["ordering"]
+    time_limit = settings["time_limit"]
+    open_files(settings, len(board))
+
+    if counters is not None:
+        counters.reset()
+
+    # Select the move and send it to the manager
+    move = book_move(board, color)
+    source = "book"
+    if move is None and settings["pondering"] and not time_limit:
+        move = pondered_move(board, limit)
+        source = "ponder"
+    if move is not None: # play instantly from the opening book or the ponder search
+        movei, movej = move
+    elif (game["minimax"] == 1): # run this if the minimax flag is given
+        movei, movej = select_move_minimax(board, color, limit, game["caching"])
+    else: # else run alphabeta
+        movei, movej = select_move_alphabeta(board, color, limit, game["caching"], ordering, time_limit)
+
+    reply(movei, movej)
+
+    if counters is not None:
+        write_stats(settings["stats_stream"], board, color, (movei, movej), "search" if move is None else source, limit)
+
+    if settings["pondering"]:
+        start_pondering(play_move(board, color, movei, movej), color, ordering)
+
+def end_game():
+    """
+    Called when a game is over: merge its deep results into the analysis
+    file, if there is one.
+    """
+    if analysis is not None:
+        eprint("Analysis cache holds {} positions".format(analysis.merge()))
+
+def send_move(i, j):
+    print("{} {}".format(i, j))
+    sys.stdout.flush()
+
+def run_ai():
+    """
+    This function establishes communication with the game manager.
+    It first introduces itself and receives its color.
+    Then it repeatedly receives the current score and current board state until the game is over.
+    """
+    print(othello_protocol.advertise("Othello AI")) # First line is the name of this AI (and the board encodings it reads)
+    game = parse_handshake(input().split(","))
+    settings = configure(game)
+
     while True: # This is the main loop
         # Read in the current game status, for example:
         # "SCORE 2 2" or "FINAL 33 31" if the game is over.
         # The first number is the score for player 1 (dark), the second for player 2 (light)
         next_input = input()
+        stop_pondering() # the opponent has moved
         status, dark_score_s, light_score_s = next_input.strip().split()
         dark_score = int(dark_score_s)
         light_score = int(light_score_s)
 
         if status == "FINAL": # Game is over.
-            print
+            end_game()
+            break
         else:
-            board = eval(input()) # Read in the input and turn it into a Python
-                                  # object. The format is a list of rows. The
-                                  # squares in each row are represented by
-                                  # 0 : empty square
-                                  # 1 : dark disk (player 1)
-                                  # 2 : light disk (player 2)
-
-            # Select the move and send it to the manager
-            if (minimax == 1): # run this if the minimax flag is given
-                movei, movej = select_move_minimax(board, color, limit, caching)
-            else: # else run alphabeta
-                movei, movej = select_move_alphabeta(board, color, limit, caching, ordering)
-            
-            print("{} {}".format(movei, movej))
+            # Read in the input and turn it into a Python object (see othello_protocol).
+            # The format is a list of rows. The squares in each row are represented by
+            # 0 : empty square
+            # 1 : dark disk (player 1)
+            # 2 : light disk (player 2)
+            board = othello_protocol.decode_board(input(), game["protocol"])
+            play_turn(game, settings, board, send_move)
+
+def run_server():
+    """
+    Agent-server mode (python3 agent.py --server): play any number of
+    games, one after the other or interleaved, in this one process, so that
+    the interpreter, the imports, the transposition table and the loaded
+    files stay warm from game to game. Every line from the manager starts
+    with the id of its game (see othello_protocol.server_line), then NEW
+    and the usual handshake fields, SCORE, the scores and the board
+    (answered by the id and the move), or FINAL and the scores. Requests are served
+    in order; the process settings (see configure) are switched only when
+    a request comes from a game with other options than the last one.
+    Pondering is off in this mode.
+    """
+    print(othello_protocol.advertise("Othello AI", server=True))
+    sys.stdout.flush()
+    games = {} # game id -> settings from parse_handshake
+    current = None # options, minimax and caching flags of the settings applied last
+    settings = None # what configure returned for them
+    while True:
+        try:
+            line = input()
+        except EOFError:
+            break
+        game_id, message = othello_protocol.parse_server_line(line)
+        command, _, fields = message.partition(" ")
+        if command == "NEW":
+            games[game_id] = parse_handshake(fields.split(","))
+        elif command == "SCORE":
+            game = games[game_id]
+            applied = (sorted(game["options"].items()), game["minimax"], game["caching"])
+            if applied != current:
+                settings = configure(game, pondering=False)
+                current = applied
+            board = othello_protocol.decode_board(fields.split(None, 2)[2], game["protocol"])
+
+            def reply(i, j):
+                print(othello_protocol.server_line(game_id, "{} {}".format(i, j)))
+                sys.stdout.flush()
+            play_turn(game, settings, board, reply)
+        elif command == "FINAL":
+            games.pop(game_id, None)
+            end_game()
+    end_game()
+    if smp is not None:
+        smp.close()
 
 if __name__ == "__main__":
-    run_ai()
+    if "--server" in sys.argv[1:]:
+        run_server()
+    else:
+        run_ai()
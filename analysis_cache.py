@@ -0,0 +1,194 @@
+"""
+Persistent analysis cache: deep search results that outlive the agent.
+
+The game manager starts a new agent process for every game, so the
+transposition table is lost when a game ends, although tournaments play
+the same openings and middlegames over and over. An analysis file keeps
+the results of deep nodes (at least MIN_DEPTH plies of remaining depth)
+from one game to the next:
+
+    * at startup the agent memory-maps the file read-only; a node the
+      transposition table does not know is looked up in the file, and a
+      usable result costs one or two record reads instead of a search;
+    * the deep results of the game's own searches are collected in memory
+      (record) and merged into the file once, when the game ends (merge),
+      the deeper result of a position winning.
+
+Keys are the canonical keys of symmetry.py and entries are packed as in
+the slots of transposition.SharedTranspositionTable, so one record serves
+all eight orientations of a position, and since the keys come from a fixed
+seed a file stays valid across runs. Values depend on the evaluator and
+on the settings that change its values or the search's, the weights in
+use and the Multi-ProbCut calibration: the header keeps the evaluator name
+and a tag identifying those settings (see agent.analysis_tag), and a file
+written with another evaluator or other settings is ignored. A merge rewrites the file into a temporary one and renames it
+over the old one under a lock, so that the games of a parallel tournament
+can merge into one file; readers keep the mapping they opened.
+
+File format (little endian):
+    header: magic b"ACH1", board size (u16), version (u16), number of slots
+            (u32, a power of two), number of entries (u32), evaluator name
+            (16 bytes, padded with zeros), settings tag (u64)
+    slots:  one 16 byte record per slot: key (u64), packed entry (u64, see
+            transposition.pack_entry; 0 marks an empty slot)
+
+Records are placed by open addressing (linear probing) on the key, with at
+most half of the slots in use, as in opening_book.py.
+"""
+
+import mmap
+import os
+import struct
+
+try:
+    import fcntl
+except ImportError: # pragma: no cover - platforms without fcntl merge without a lock
+    fcntl = None
+
+from transposition import pack_entry, unpack_entry
+
+MAGIC = b"ACH1"
+VERSION = 2
+HEADER = struct.Struct("<4sHHII16sQ")
+RECORD = struct.Struct("<QQ")
+MIN_DEPTH = 5 # remaining depth of the results kept in the file
+
+
+class AnalysisCache(object):
+    """
+    The analysis file at path for an n x n board, the named evaluator and
+    the settings tag, and the results recorded since it was opened. A
+    missing file reads as empty and is created by the first merge.
+    """
+
+    def __init__(self, path, n, evaluator, min_depth=MIN_DEPTH, tag=0):
+        self.path = path
+        self.n = n
+        self.evaluator = evaluator
+        self.tag = tag
+        self.min_depth = min_depth
+        self.pending = {} # key -> packed entry of the results to merge
+        self.file = None
+        self.data = None
+        self.slots = 0
+        self.entries = 0
+        self.open()
+
+    def open(self):
+        """
+        Memory-map the current file, if there is one.
+        """
+        self.close()
+        if not os.path.exists(self.path) or os.path.getsize(self.path) <= HEADER.size:
+            return
+        self.file = open(self.path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, version, self.slots, self.entries, name, tag = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION or n != self.n or name.rstrip(b"\0").decode() != self.evaluator:
+            self.close()
+            raise ValueError("{} holds no {}x{} analysis for the {} evaluator".format(
+                self.path, self.n, self.n, self.evaluator))
+        if tag != self.tag:
+            self.close()
+            raise ValueError("{} was written with other weights or ProbCut settings".format(self.path))
+        self.mask = self.slots - 1
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.file.close()
+        self.file = None
+        self.data = None
+        self.slots = 0
+        self.entries = 0
+
+    def __len__(self):
+        return self.entries
+
+    def probe(self, key):
+        """
+        Return the (depth, flag, value, move, generation) entry stored in the
+        file for key, or None.
+        """
+        data = self.data
+        if data is None:
+            return None
+        index = key & self.mask
+        while True:
+            stored, entry = RECORD.unpack_from(data, HEADER.size + index * RECORD.size)
+            if not entry:
+                return None
+            if stored == key:
+                return unpack_entry(entry)
+            index = (index + 1) & self.mask
+
+    def record(self, key, depth, flag, value, move):
+        """
+        Keep a search result for the next merge if it is deep enough.
+        """
+        if depth < self.min_depth or move is None:
+            return
+        old = self.pending.get(key)
+        if old is None or (old >> 15) & 0x1FFFF <= depth:
+            self.pending[key] = pack_entry(depth, flag, value, move, 0)
+
+    def items(self):
+        """
+        Yield the (key, packed entry) records of the file.
+        """
+        if self.data is None:
+            return
+        for offset in range(HEADER.size, HEADER.size + self.slots * RECORD.size, RECORD.size):
+            key, entry = RECORD.unpack_from(self.data, offset)
+            if entry:
+                yield key, entry
+
+    def merge(self):
+        """
+        Merge the recorded results into the file (re-reading it first, since
+        another game may have merged into it) and map the result. Returns the
+        number of entries in the file.
+        """
+        if not self.pending:
+            return self.entries
+        with open(self.path + ".lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self.open()
+            except ValueError: # a file of another board size, evaluator or settings is left alone
+                self.pending.clear()
+                return 0
+            entries = dict(self.items())
+            for key, entry in self.pending.items():
+                old = entries.get(key)
+                if old is None or (old >> 15) & 0x1FFFF <= (entry >> 15) & 0x1FFFF:
+                    entries[key] = entry
+            self.close()
+            temporary = "{}.{}.tmp".format(self.path, os.getpid())
+            write_cache(temporary, self.n, self.evaluator, entries, self.tag)
+            os.replace(temporary, self.path)
+        self.pending.clear()
+        self.open()
+        return self.entries
+
+
+def write_cache(path, n, evaluator, entries, tag=0):
+    """
+    Write an analysis file. entries maps keys to packed entries.
+    """
+    slots = 1
+    while slots < 2 * len(entries) or slots < 2:
+        slots *= 2
+    mask = slots - 1
+    data = bytearray(HEADER.size + slots * RECORD.size)
+    HEADER.pack_into(data, 0, MAGIC, n, VERSION, slots, len(entries), evaluator.encode(), tag)
+    used = [False] * slots
+    for key, entry in entries.items():
+        index = key & mask
+        while used[index]:
+            index = (index + 1) & mask
+        used[index] = True
+        RECORD.pack_into(data, HEADER.size + index * RECORD.size, key, entry)
+    with open(path, "wb") as f:
+        f.write(data)
@@ -0,0 +1,122 @@
+"""
+Batched evaluation of many boards at once with NumPy.
+
+The children of a node one ply above the depth limit, and the children
+sorted by node ordering, are all evaluated by the same function. Instead of
+scanning each board in Python, they are stacked into one (k, n, n) int8
+array and every term is computed for the whole batch in a few vectorised
+operations: disc difference, corner and edge ownership and a weighted-square
+sum. utilities() gives exactly the values of compute_utility in agent.py,
+weighted_values() the values of the "weighted" evaluator.
+
+NumPy is optional: available() is False without it, and the agent then
+evaluates boards one at a time as before.
+"""
+
+import itertools
+
+try:
+    import numpy as np
+except ImportError: # pragma: no cover - depends on the environment
+    np = None
+
+from evaluation import CORNER_WEIGHT, DISK_WEIGHT, EDGE_WEIGHT
+
+X_SQUARE_WEIGHT = -CORNER_WEIGHT // 2 # diagonal neighbours of the corners
+C_SQUARE_WEIGHT = -EDGE_WEIGHT # edge neighbours of the corners
+MIN_BATCH = 4 # smaller batches are evaluated one board at a time
+
+_TABLES = {}
+
+
+def available():
+    return np is not None
+
+
+class BatchTables(object):
+    """
+    Per board size arrays: sign[color] maps square contents (0, 1, 2) to
+    (0, +1, -1) from the point of view of color, and weights is the n x n
+    array of the weighted-square evaluation (including the corner and edge
+    weights).
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.sign = [None, np.array([0, 1, -1], dtype=np.int8), np.array([0, -1, 1], dtype=np.int8)]
+        weights = np.full((n, n), DISK_WEIGHT, dtype=np.int32)
+        weights[0, :] += EDGE_WEIGHT
+        weights[-1, :] += EDGE_WEIGHT
+        weights[:, 0] += EDGE_WEIGHT
+        weights[:, -1] += EDGE_WEIGHT
+        for i, di in ((0, 1), (n - 1, -1)):
+            for j, dj in ((0, 1), (n - 1, -1)):
+                weights[i, j] = DISK_WEIGHT + CORNER_WEIGHT
+                weights[i + di, j] += C_SQUARE_WEIGHT
+                weights[i, j + dj] += C_SQUARE_WEIGHT
+                weights[i + di, j + dj] += X_SQUARE_WEIGHT
+        self.weights = weights.reshape(n * n)
+        corners = np.zeros((n, n), dtype=bool)
+        corners[[0, 0, -1, -1], [0, -1, 0, -1]] = True
+        edges = np.zeros((n, n), dtype=bool)
+        edges[[0, -1], :] = True
+        edges[:, [0, -1]] = True
+        edges &= ~corners
+        self.corners = corners.reshape(n * n)
+        self.edges = edges.reshape(n * n)
+
+
+def tables(n):
+    table = _TABLES.get(n)
+    if table is None:
+        table = _TABLES[n] = BatchTables(n)
+    return table
+
+
+def stack_boards(boards):
+    """
+    Return the tuple-of-tuples boards as one (k, n, n) int8 array.
+    """
+    n = len(boards[0])
+    flat = bytes(itertools.chain.from_iterable(itertools.chain.from_iterable(boards)))
+    return np.frombuffer(flat, dtype=np.int8).reshape(len(boards), n, n)
+
+
+def signed(batch, color):
+    """
+    Return the batch flattened to (k, n * n) with +1 for the discs of color
+    and -1 for the discs of the opponent.
+    """
+    k, n = batch.shape[0], batch.shape[1]
+    return tables(n).sign[color][batch.reshape(k, n * n)]
+
+
+def features(batch, color):
+    """
+    Return the (disc, corner, edge) differences between color and the
+    opponent for every board of the batch, as three int arrays.
+    """
+    table = tables(batch.shape[1])
+    values = signed(batch, color)
+    return (values.sum(axis=1, dtype=np.int32),
+            values[:, table.corners].sum(axis=1, dtype=np.int32),
+            values[:, table.edges].sum(axis=1, dtype=np.int32))
+
+
+def utilities(boards, color):
+    """
+    Return compute_utility(board, color) for every board, as a list.
+    """
+    return signed(stack_boards(boards), color).sum(axis=1, dtype=np.int32).tolist()
+
+
+def weighted_values(boards, color):
+    """
+    Return the weighted-square value of every board for color, as a list:
+    the sum of the square weights of the discs of color minus those of the
+    opponent. Corners are worth CORNER_WEIGHT, other edge squares
+    EDGE_WEIGHT, every disc DISK_WEIGHT, and the squares next to the corners
+    are penalised because they give the opponent access to the corner.
+    """
+    batch = stack_boards(boards)
+    return (signed(batch, color) @ tables(batch.shape[1]).weights).tolist()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the searches in agent.py.
+
+tests.py only checks that a search finishes under TIME_THRESHOLD, from a
+single run. This suite measures select_move_minimax and
+select_move_alphabeta over a fixed corpus of positions, at several depths
+and with caching and node ordering on and off, and reports for each case:
+
+    * the median wall time over several repetitions (the transposition
+      table and the move ordering tables are cleared before every search,
+      so each run does the same work);
+    * the number of nodes visited (counted by the same timer.check() calls
+      that the anytime search uses for its deadline);
+    * nodes per second;
+    * the effective branching factor, nodes per position ** (1 / depth).
+
+The corpus is SMALL_BOARDS and BIG_BOARDS from tests.py plus 8x8 middlegame
+and endgame positions generated by random play with a fixed seed. The
+endgame solver is switched off during the benchmark so that every case
+measures the search it names.
+
+The results can be saved as a JSON baseline and later runs compared with
+it: a case is reported as a regression if its median time grew by more than
+the tolerance or if it visited more nodes. For example:
+    python3 benchmarks.py -s baseline.json
+    python3 benchmarks.py -b baseline.json -t 0.1
+exits with status 1 if the second run regressed.
+"""
+
+import getopt
+import json
+import statistics
+import sys
+import time
+
+import agent
+from lazy_smp import benchmark_positions
+
+REPEATS = 5
+TOLERANCE = 0.10 # relative growth of the median time reported as a regression
+
+# (name, search function, caching, ordering)
+CONFIGS = [("minimax", "select_move_minimax", 0, 0),
+           ("minimax-c", "select_move_minimax", 1, 0),
+           ("alphabeta", "select_move_alphabeta", 0, 0),
+           ("alphabeta-c", "select_move_alphabeta", 1, 0),
+           ("alphabeta-o", "select_move_alphabeta", 0, 1),
+           ("alphabeta-co", "select_move_alphabeta", 1, 1)]
+
+# corpus name -> (depths for alpha-beta, depths for minimax)
+DEPTHS = {"small": ((2, 4, 6), (2, 4)),
+          "big": ((2, 4, 5), (2, 3)),
+          "middlegame8": ((2, 4), (2, 3)),
+          "endgame8": ((2, 4, 6), (2, 3))}
+
+
+class NodeCounter(object):
+    """
+    Stands in for the TimeManager of the search: counts the nodes visited
+    without ever stopping the search.
+    """
+
+    def __init__(self):
+        self.nodes = 0
+
+    def check(self):
+        self.nodes += 1
+
+
+def corpus():
+    """
+    Return the benchmark positions as a dict: corpus name -> list of
+    (board, color) with at least one legal move.
+    """
+    import tests
+    positions = {"small": [(board, 1) for board in tests.SMALL_BOARDS],
+                 "big": [(board, 1) for board in tests.BIG_BOARDS],
+                 "middlegame8": benchmark_positions(8, 4, 40, seed=1),
+                 "endgame8": benchmark_positions(8, 4, 16, seed=2)}
+    return {name: [(board, color) for board, color in boards if agent.get_possible_moves(board, color)]
+            for name, boards in positions.items()}
+
+
+def run_case(positions, function, depth, caching, ordering, repeats):
+    """
+    Search every position repeats times, with the endgame solver off, and
+    return the statistics of the case as a dict.
+    """
+    search = getattr(agent, function)
+    times = []
+    nodes = None
+    saved = agent.endgame_empties, agent.wld_empties
+    agent.endgame_empties = agent.wld_empties = 0
+    try:
+        for _ in range(repeats):
+            total = 0.0
+            counted = 0
+            for board, color in positions:
+                agent.cache.clear()
+                agent.clear_move_ordering()
+                agent.timer = NodeCounter()
+                started = time.perf_counter()
+                try:
+                    if function == "select_move_minimax":
+                        search(board, color, depth, caching)
+                    else:
+                        search(board, color, depth, caching, ordering)
+                finally:
+                    total += time.perf_counter() - started
+                    counted += agent.timer.nodes
+                    agent.timer = None
+            times.append(total)
+            nodes = counted
+    finally:
+        agent.endgame_empties, agent.wld_empties = saved
+    median = statistics.median(times)
+    return {"median": median, "min": min(times), "nodes": nodes,
+            "nodes_per_second": nodes / median if median > 0 else None,
+            "branching": (nodes / len(positions)) ** (1.0 / depth)}
+
+
+def run_suite(repeats=REPEATS, only=None, log=print):
+    """
+    Run every case (or those whose name contains only) and return a dict:
+    case name "corpus/config/depth" -> statistics.
+    """
+    results = {}
+    for corpus_name, positions in corpus().items():
+        alphabeta_depths, minimax_depths = DEPTHS[corpus_name]
+        for config, function, caching, ordering in CONFIGS:
+            depths = minimax_depths if function == "select_move_minimax" else alphabeta_depths
+            for depth in depths:
+                name = "{}/{}/{}".format(corpus_name, config, depth)
+                if only and only not in name:
+                    continue
+                results[name] = stats = run_case(positions, function, depth, caching, ordering, repeats)
+                log("{:28s} {:9.4f} {:10d} {:10.0f} {:6.2f}".format(
+                    name, stats["median"], stats["nodes"], stats["nodes_per_second"] or 0,
+                    stats["branching"]))
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Return a list of messages, one per case of results that regressed
+    against the baseline results.
+    """
+    regressions = []
+    for name, stats in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        if stats["median"] > old["median"] * (1 + tolerance):
+            regressions.append("{}: median time {:.4f}s -> {:.4f}s ({:+.0%})".format(
+                name, old["median"], stats["median"], stats["median"] / old["median"] - 1))
+        if stats["nodes"] > old["nodes"]:
+            regressions.append("{}: nodes {} -> {}".format(name, old["nodes"], stats["nodes"]))
+    return regressions
+
+
+def main(argv):
+    repeats = REPEATS
+    tolerance = TOLERANCE
+    save = None
+    baseline = None
+    only = None
+    usage = ("benchmarks.py [-r <repeats> -k <case filter> -s <save baseline> -b <compare with baseline> "
+             "-t <tolerance> --backend <name>]")
+    try:
+        opts, args = getopt.getopt(argv, "hr:k:s:b:t:", ["repeats=", "filter=", "save=", "baseline=",
+                                                         "tolerance=", "backend="])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            print(usage)
+            sys.exit()
+        elif opt in ("-r", "--repeats"):
+            repeats = int(arg)
+        elif opt in ("-k", "--filter"):
+            only = arg
+        elif opt in ("-s", "--save"):
+            save = arg
+        elif opt in ("-b", "--baseline"):
+            baseline = arg
+        elif opt in ("-t", "--tolerance"):
+            tolerance = float(arg)
+        elif opt == "--backend":
+            agent.set_backend(arg)
+
+    print("{:28s} {:>9s} {:>10s} {:>10s} {:>6s}".format("case", "median s", "nodes", "nodes/s", "ebf"))
+    results = run_suite(repeats, only)
+    if save:
+        settings = {"backend": agent.get_possible_moves.__module__, "evaluator": agent.evaluator,
+                    "batching": agent.batching, "repeats": repeats}
+        with open(save, "w") as f:
+            json.dump({"settings": settings, "results": results}, f, indent=1, sort_keys=True)
+        print("Baseline saved to {}".format(save))
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f)["results"], tolerance)
+        for message in regressions:
+            print("REGRESSION " + message)
+        if regressions:
+            sys.exit(1)
+        print("No regressions against {}".format(baseline))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,127 @@
+"""
+Exact endgame solver for the last few empty squares.
+
+Near the end of the game the search can reach the final position on every
+line, so the value of a move is the final disc difference and no evaluation
+is needed. The solver works on bitboard masks (see othello_bitboard.py) in
+negamax form: solve(own, opp, ...) is the final disc difference for the
+player to move, own being their discs. A player without a legal move ends
+the game (there are no passes in this version of the game), and empty
+squares are not counted in the final score, as in compute_utility.
+
+Move ordering depends on the number of empty squares:
+    * far from the end: fastest first, the moves that leave the opponent the
+      fewest replies are searched first;
+    * near the end: parity, moves in board regions (quadrants) with an odd
+      number of empty squares are searched first, so that the player to move
+      is likely to get the last move in each region;
+    * with one empty square left the final score is computed from the flip
+      count of the last move, without playing it.
+
+With the window (-1, 1) the solver only determines whether the position is
+won, lost or drawn (WLD), which prunes much more than an exact solve.
+"""
+
+from othello_bitboard import (count_moves, flips_mask, geometry, iter_squares,
+                              legal_moves_mask, popcount)
+
+EXACT_EMPTIES = 12 # solve exactly at or below this many empty squares
+FASTEST_FIRST_EMPTIES = 7 # use fastest-first ordering above this many empties
+WIN = 1 # the WLD window is (-WIN, WIN)
+
+
+class EndgameSolver(object):
+    """
+    Solver for an n x n board. If a TimeManager is given, its check() is
+    called at every node, so a solve can be aborted with SearchTimeout.
+    """
+
+    def __init__(self, n, timer=None):
+        self.n = n
+        self.full = geometry(n).full
+        self.timer = timer
+        self.nodes = 0
+        half = n // 2
+        self.regions = []
+        for columns in (range(half), range(half, n)):
+            for rows in (range(half), range(half, n)):
+                region = 0
+                for i in columns:
+                    for j in rows:
+                        region |= 1 << (i * n + j)
+                self.regions.append(region)
+
+    def odd_regions(self, empty):
+        """
+        Return the union of the regions with an odd number of empty squares.
+        """
+        odd = 0
+        for region in self.regions:
+            if popcount(empty & region) & 1:
+                odd |= region
+        return odd
+
+    def last_move(self, own, opp, square):
+        """
+        Final score for the player to move when square is the only empty
+        square left.
+        """
+        flips = popcount(flips_mask(own, opp, square, self.n))
+        diff = popcount(own) - popcount(opp)
+        if flips == 0: # no legal move, the game is over
+            return diff
+        return diff + 2 * flips + 1
+
+    def solve(self, own, opp, alpha, beta):
+        """
+        Return the final disc difference for the player to move with perfect
+        play, or a bound on it if it falls outside the window (alpha, beta):
+        at most alpha if the value is below the window, at least beta if it
+        is above.
+        """
+        self.nodes += 1
+        if self.timer is not None:
+            self.timer.check()
+        n = self.n
+        empty = self.full & ~(own | opp)
+        if empty & (empty - 1) == 0: # at most one empty square
+            if empty == 0:
+                return popcount(own) - popcount(opp)
+            return self.last_move(own, opp, empty.bit_length() - 1)
+        moves = legal_moves_mask(own, opp, n)
+        if not moves:
+            return popcount(own) - popcount(opp)
+
+        if popcount(empty) > FASTEST_FIRST_EMPTIES:
+            children = []
+            for square in iter_squares(moves):
+                flips = flips_mask(own, opp, square, n)
+                new_own = own | flips | (1 << square)
+                new_opp = opp ^ flips
+                children.append((count_moves(new_opp, new_own, n), square, new_own, new_opp))
+            children.sort()
+            order = [(new_own, new_opp) for replies, square, new_own, new_opp in children]
+        else:
+            odd = self.odd_regions(empty)
+            order = []
+            for square in list(iter_squares(moves & odd)) + list(iter_squares(moves & ~odd)):
+                flips = flips_mask(own, opp, square, n)
+                order.append((own | flips | (1 << square), opp ^ flips))
+
+        best = -self.full.bit_length() - 1
+        for new_own, new_opp in order:
+            value = -self.solve(new_opp, new_own, -beta, -alpha)
+            if value > best:
+                best = value
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+        return best
+
+    def solve_wld(self, own, opp):
+        """
+        Return 1, 0 or -1 if the player to move wins, draws or loses.
+        """
+        value = self.solve(own, opp, -WIN, WIN)
+        return (value > 0) - (value < 0)
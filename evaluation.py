@@ -0,0 +1,226 @@
+"""
+Incrementally maintained evaluation state for compute_heuristic in agent.py.
+
+EvalState keeps the board as a pair of bitboard masks together with the
+disc counts, the empty count, the corner and edge ownership counts and the
+phase weights selected by the empty count. make() and unmake() update all
+of them from the placed square and the mask of flipped discs with a few
+popcounts, so evaluating a leaf never rescans the board: the only terms
+that are not stored are mobility and stability, which are computed with
+bitboard flood fills.
+
+The weights and phase thresholds below can be replaced by tuned ones from a
+weights file written by tuner.py (see load_weights).
+"""
+
+import json
+
+from othello_bitboard import (board_to_masks, geometry, legal_moves_mask,
+                              popcount, shift)
+
+CORNER_WEIGHT = 25
+EDGE_WEIGHT = 5
+STABLE_WEIGHT = 15
+MOBILITY_WEIGHT = 10
+DISK_WEIGHT = 1
+
+# The game phase is chosen by the share of empty squares: opening above
+# OPENING_EMPTIES, midgame above ENDGAME_EMPTIES, endgame below.
+OPENING_EMPTIES = 0.5
+ENDGAME_EMPTIES = 0.2
+
+# (corner, edge, stable, mobility, disk) weights of the opening, midgame and endgame
+PHASE_WEIGHTS = ((CORNER_WEIGHT, EDGE_WEIGHT, 0, MOBILITY_WEIGHT, 0),
+                 (CORNER_WEIGHT, EDGE_WEIGHT // 2, STABLE_WEIGHT, MOBILITY_WEIGHT // 2, DISK_WEIGHT),
+                 (CORNER_WEIGHT, 0, STABLE_WEIGHT * 2, 0, DISK_WEIGHT * 2))
+
+_TABLES = {}
+_SETTINGS = {"opening": OPENING_EMPTIES, "endgame": ENDGAME_EMPTIES, "weights": PHASE_WEIGHTS}
+
+
+def game_phase(empty_squares, total_squares, opening=None, endgame=None):
+    """
+    Return the phase (0 opening, 1 midgame, 2 endgame) of a position with
+    empty_squares of the total_squares empty, with the current thresholds
+    unless others are given.
+    """
+    opening = _SETTINGS["opening"] if opening is None else opening
+    endgame = _SETTINGS["endgame"] if endgame is None else endgame
+    if empty_squares > total_squares * opening:
+        return 0
+    elif empty_squares > total_squares * endgame:
+        return 1
+    else:
+        return 2
+
+
+def phase_weights(empty_squares, total_squares):
+    """
+    Return the (corner, edge, stable, mobility, disk) weights used when
+    empty_squares of the total_squares are empty.
+    """
+    return _SETTINGS["weights"][game_phase(empty_squares, total_squares)]
+
+
+def load_weights(path):
+    """
+    Use the phase thresholds and weights of the weights file path (JSON, as
+    written by tuner.py) from now on.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    opening = float(data["opening_empties"])
+    endgame = float(data["endgame_empties"])
+    weights = tuple(tuple(int(weight) for weight in phase) for phase in data["weights"])
+    if not 0 <= endgame < opening <= 1 or len(weights) != 3 or any(len(phase) != 5 for phase in weights):
+        raise ValueError("{} holds no heuristic weights".format(path))
+    _SETTINGS.update(opening=opening, endgame=endgame, weights=weights)
+    _TABLES.clear()
+
+
+def current_weights():
+    """
+    Return the (opening, endgame, weights) settings in use.
+    """
+    return _SETTINGS["opening"], _SETTINGS["endgame"], _SETTINGS["weights"]
+
+
+def reset_weights():
+    """
+    Go back to the built-in thresholds and weights.
+    """
+    _SETTINGS.update(opening=OPENING_EMPTIES, endgame=ENDGAME_EMPTIES, weights=PHASE_WEIGHTS)
+    _TABLES.clear()
+
+
+class EvalTables(object):
+    """
+    Per board size data: the phase weights for every empty count and, for
+    each direction, the squares whose neighbour in that direction is off
+    the board.
+    """
+
+    def __init__(self, n):
+        geo = geometry(n)
+        self.geometry = geo
+        self.weights = [phase_weights(empties, geo.size) for empties in range(geo.size + 1)]
+        self.rims = []
+        for direction in geo.directions:
+            lands = 0
+            for square in range(geo.size):
+                if shift(1 << square, direction, geo.full):
+                    lands |= 1 << square
+            self.rims.append(geo.full & ~lands)
+
+
+def tables(n):
+    table = _TABLES.get(n)
+    if table is None:
+        table = _TABLES[n] = EvalTables(n)
+    return table
+
+
+def stable_mask(own, n):
+    """
+    Return the discs of own that compute_heuristic counts as stable: those
+    with an unbroken line of own discs to the edge in at least one of the
+    eight directions.
+    """
+    table = tables(n)
+    geo = table.geometry
+    directions = geo.directions
+    full = geo.full
+    stable = 0
+    for k, direction in enumerate(directions):
+        opposite = directions[(k + 4) % 8]
+        line = own & table.rims[k]
+        while True:
+            grown = line | (own & shift(line, opposite, full))
+            if grown == line:
+                break
+            line = grown
+        stable |= line
+    return stable
+
+
+class EvalState(object):
+    """
+    Evaluation state of one position. masks[player], discs[player],
+    corners[player] and edges[player] are indexed by player (1 or 2).
+    """
+
+    def __init__(self, board):
+        n = len(board)
+        self.n = n
+        self.tables = tables(n)
+        geo = self.tables.geometry
+        dark, light = board_to_masks(board)
+        self.masks = [0, dark, light]
+        self.discs = [0, popcount(dark), popcount(light)]
+        self.corners = [0, popcount(dark & geo.corners), popcount(light & geo.corners)]
+        self.edges = [0, popcount(dark & geo.edges), popcount(light & geo.edges)]
+        self.empties = geo.size - self.discs[1] - self.discs[2]
+        self.weights = self.tables.weights[self.empties]
+
+    def make(self, player, square, flips):
+        """
+        Update the state for player placing a disc on square and flipping
+        the discs in flips.
+        """
+        geo = self.tables.geometry
+        opponent = 3 - player
+        move = 1 << square
+        flipped = popcount(flips)
+        self.masks[player] |= move | flips
+        self.masks[opponent] ^= flips
+        self.discs[player] += flipped + 1
+        self.discs[opponent] -= flipped
+        if move & geo.corners: # corner discs can never be flipped
+            self.corners[player] += 1
+        edges = popcount((move | flips) & geo.edges)
+        if edges:
+            self.edges[player] += edges
+            self.edges[opponent] -= popcount(flips & geo.edges)
+        self.empties -= 1
+        self.weights = self.tables.weights[self.empties]
+
+    def unmake(self, player, square, flips):
+        """
+        Undo make(player, square, flips).
+        """
+        geo = self.tables.geometry
+        opponent = 3 - player
+        move = 1 << square
+        flipped = popcount(flips)
+        self.masks[player] &= ~(move | flips)
+        self.masks[opponent] |= flips
+        self.discs[player] -= flipped + 1
+        self.discs[opponent] += flipped
+        if move & geo.corners:
+            self.corners[player] -= 1
+        edges = popcount((move | flips) & geo.edges)
+        if edges:
+            self.edges[player] -= edges
+            self.edges[opponent] += popcount(flips & geo.edges)
+        self.empties += 1
+        self.weights = self.tables.weights[self.empties]
+
+    def heuristic(self, color):
+        """
+        Return compute_heuristic(board, color) for the current position.
+        """
+        opponent = 3 - color
+        corner_weight, edge_weight, stable_weight, mobility_weight, disk_weight = self.weights
+        value = (corner_weight * (self.corners[color] - self.corners[opponent]) +
+                 disk_weight * (self.discs[color] - self.discs[opponent]))
+        if edge_weight:
+            value += edge_weight * (self.edges[color] - self.edges[opponent])
+        own = self.masks[color]
+        opp = self.masks[opponent]
+        if stable_weight:
+            value += stable_weight * popcount(stable_mask(own, self.n))
+        if mobility_weight:
+            mobility = (popcount(legal_moves_mask(own, opp, self.n)) -
+                        popcount(legal_moves_mask(opp, own, self.n)))
+            value += mobility_weight * mobility
+        return value
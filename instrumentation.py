@@ -0,0 +1,82 @@
+"""
+Per-move search statistics for the agent.
+
+With the handshake option stats=1 (or stats=<file>), the agent counts what
+its search does for every move and writes one JSON object per move on a
+line of its own, to stderr (or appended to the file):
+
+    {"move": [2, 3], "source": "search", "time": 1.52, "nodes": 48211,
+     "leaves": 30117, "cutoffs": 9120, "first_cutoffs": 8235,
+     "first_cutoff_rate": 0.903, "probes": 18094, "hits": 4410,
+     "stores": 17990, "probcuts": 0, "depths": [[1, 0.001, 9], [2, 0.004, 41], ...],
+     "pv": [[2, 3], [2, 2], [3, 2]]}
+
+nodes are the nodes visited (the endgame solver's included), leaves the
+boards evaluated at the depth limit, cutoffs the alpha-beta cutoffs and
+first_cutoffs those caused by the first move searched (a measure of the
+node ordering). probes, hits and stores count the transposition table
+accesses, a hit being a probe that found an entry, and probcuts the nodes
+cut by Multi-ProbCut (see probcut.py). depths lists, for every
+completed depth, the depth, the seconds since the start of the move and the
+nodes visited so far; pv is the principal variation.
+
+The counters live in agent.counters, which is None when the option is off,
+so a search without statistics only pays for a few "is not None" tests.
+"""
+
+import json
+import time
+
+
+class SearchCounters(object):
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Start counting a new move.
+        """
+        self.started = time.perf_counter()
+        self.nodes = 0
+        self.leaves = 0
+        self.cutoffs = 0
+        self.first_cutoffs = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.probcuts = 0
+        self.depths = []
+
+    def cutoff(self, first):
+        self.cutoffs += 1
+        if first:
+            self.first_cutoffs += 1
+
+    def finished_depth(self, depth):
+        """
+        Record that the search of the current move completed depth.
+        """
+        self.depths.append([depth, round(time.perf_counter() - self.started, 6), self.nodes])
+
+    def record(self, move, source, pv):
+        """
+        Return the statistics of the move as a dict. source tells where the
+        move came from ("search", "book" or "ponder"), pv is the principal
+        variation.
+        """
+        return {"move": move, "source": source,
+                "time": round(time.perf_counter() - self.started, 6),
+                "nodes": self.nodes, "leaves": self.leaves,
+                "cutoffs": self.cutoffs, "first_cutoffs": self.first_cutoffs,
+                "first_cutoff_rate": round(self.first_cutoffs / self.cutoffs, 3) if self.cutoffs else None,
+                "probes": self.probes, "hits": self.hits, "stores": self.stores,
+                "probcuts": self.probcuts, "depths": self.depths, "pv": pv}
+
+
+def write_record(stream, record):
+    """
+    Write record to stream as one line of JSON.
+    """
+    stream.write(json.dumps(record, separators=(",", ":")) + "\n")
+    stream.flush()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Lazy SMP: a parallel version of the anytime search in agent.py.
+
+The agent starts workers - 1 helper processes once, at the beginning of the
+game. For every move, each helper runs the same iterative deepening search
+as the agent on the same root, with two differences that spread the
+processes over different parts of the tree: every other helper starts one
+ply deeper, and each helper searches the root moves after the best one in
+its own random order. The processes never talk to each other during the
+search; they only share the transposition table, a SharedTranspositionTable
+in shared memory without locks (see transposition.py), so that each one
+finds the results of the others. When the agent's own search is over it
+sets the stop flag of the table and collects the deepest iteration each
+helper completed (see select_move_parallel in agent.py).
+
+The shared memory block is unlinked as soon as all helpers are attached, so
+nothing is left behind when the game manager kills the agent, and helpers
+exit by themselves when the agent process is gone.
+
+Run this file to measure the scaling of the parallel search, for example:
+    python3 lazy_smp.py -d 8 -w 4 -l 6 -t 9
+prints, for 1 to 4 processes, the time to complete depth 6 and the number
+of nodes searched per second on a fixed set of positions.
+"""
+
+import getopt
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import time
+
+from transposition import SharedTranspositionTable
+
+POLL_SECONDS = 1.0 # helpers check this often whether the agent is still alive
+READY_TIMEOUT = 30.0 # seconds to wait for the helpers to attach
+RESULT_TIMEOUT = 2.0 # seconds to wait for a stopped helper to report
+
+
+class LazySMP(object):
+    """
+    The helper processes of a parallel search sharing the given table, with
+    the move generation backend and evaluator they should use, and the
+    Multi-ProbCut calibration and pattern weight files they should load, if
+    any.
+    """
+
+    def __init__(self, workers, table, backend="tuple", evaluator="utility", probcut=None, weights=None):
+        context = multiprocessing.get_context()
+        self.table = table
+        self.results = context.Queue()
+        self.jobs = []
+        self.processes = []
+        self.job_id = 0
+        for index in range(1, workers):
+            jobs = context.Queue()
+            process = context.Process(target=helper_main, daemon=True,
+                                      args=(index, table.name, jobs, self.results, os.getpid(),
+                                            backend, evaluator, probcut, weights))
+            process.start()
+            self.jobs.append(jobs)
+            self.processes.append(process)
+        for _ in self.processes:
+            self.results.get(timeout=READY_TIMEOUT)
+        table.unlink()
+
+    def start(self, board, color, time_limit, limit, ordering, generation):
+        """
+        Make every helper search board for color.
+        """
+        self.job_id += 1
+        self.table.stop = False
+        for jobs in self.jobs:
+            jobs.put((self.job_id, board, color, time_limit, limit, ordering, generation))
+
+    def finish(self):
+        """
+        Stop the helpers and return their (depth, move, nodes) results. A
+        helper that does not answer in time is left out.
+        """
+        self.table.stop = True
+        results = []
+        deadline = time.perf_counter() + RESULT_TIMEOUT
+        while len(results) < len(self.jobs):
+            try:
+                result = self.results.get(timeout=max(deadline - time.perf_counter(), 0))
+            except queue.Empty:
+                break
+            if result[0] == self.job_id:
+                results.append(result[1:])
+        return results
+
+    def close(self):
+        for jobs in self.jobs:
+            jobs.put(None)
+        for process in self.processes:
+            process.join(RESULT_TIMEOUT)
+        self.table.close()
+
+
+def helper_main(index, name, jobs, results, parent, backend, evaluator, probcut=None, weights=None):
+    """
+    Body of a helper process: attach to the table, then search every job
+    until told to stop (None) or the agent process is gone.
+    """
+    import agent
+    agent.cache = SharedTranspositionTable(name=name)
+    agent.set_backend(backend)
+    agent.set_evaluator(evaluator)
+    agent.set_weights(weights)
+    if probcut is not None:
+        agent.probcut = agent.load_probcut(probcut)
+    agent.stop_signal = lambda: agent.cache.stop
+    results.put((0, index))
+    while True:
+        try:
+            job = jobs.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            if os.getppid() != parent:
+                return
+            continue
+        if job is None:
+            return
+        job_id, board, color, time_limit, limit, ordering, generation = job
+        agent.cache.follow(generation)
+        agent.select_move_iterative(board, color, time_limit, limit, 1, ordering,
+                                    start_depth=1 + index % 2, seed=index)
+        stats = agent.search_stats
+        results.put((job_id, stats["depth"], stats["move"], stats["nodes"]))
+
+
+############ SCALING BENCHMARK #####################
+def benchmark_positions(n, count, empties, seed=0):
+    """
+    Return count (board, color) positions with the given number of empty
+    squares, reached by random play from the initial board.
+    """
+    import agent
+    from othello_game import OthelloGameManager
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = OthelloGameManager(n).create_initial_board()
+        color = 1
+        while sum(row.count(0) for row in board) > empties:
+            moves = agent.get_possible_moves(board, color)
+            if not moves:
+                break
+            move = rng.choice(moves)
+            board = agent.play_move(board, color, move[0], move[1])
+            color = 3 - color
+        if agent.get_possible_moves(board, color):
+            positions.append((board, color))
+    return positions
+
+
+def measure(workers, positions, limit, time_limit, backend, megabytes=32):
+    """
+    Search every position to the depth limit with the given number of
+    processes. Return (seconds, nodes, deepest depth completed on average).
+    """
+    import agent
+    agent.set_backend(backend)
+    agent.cache = SharedTranspositionTable(megabytes)
+    agent.smp = LazySMP(workers, agent.cache, backend, agent.evaluator)
+    seconds = 0.0
+    nodes = 0
+    depth = 0
+    try:
+        for board, color in positions:
+            agent.cache.clear()
+            started = time.perf_counter()
+            agent.select_move_parallel(board, color, time_limit, limit, 1)
+            seconds += time.perf_counter() - started
+            nodes += agent.search_stats["nodes"]
+            depth += agent.search_stats["depth"]
+    finally:
+        agent.smp.close()
+        agent.smp = None
+    return seconds, nodes, depth / len(positions)
+
+
+def main(argv):
+    size = 8
+    workers = os.cpu_count() or 1
+    limit = 6
+    time_limit = 9.0
+    count = 4
+    backend = "bitboard"
+    usage = "lazy_smp.py -d <dimension> -w <max workers> -l <depth> [-t <seconds> -n <positions> --backend <name>]"
+    try:
+        opts, args = getopt.getopt(argv, "hd:w:l:t:n:", ["dimension=", "workers=", "limit=", "time=",
+                                                          "positions=", "backend="])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            print(usage)
+            sys.exit()
+        elif opt in ("-d", "--dimension"):
+            size = int(arg)
+        elif opt in ("-w", "--workers"):
+            workers = int(arg)
+        elif opt in ("-l", "--limit"):
+            limit = int(arg)
+        elif opt in ("-t", "--time"):
+            time_limit = float(arg)
+        elif opt in ("-n", "--positions"):
+            count = int(arg)
+        elif opt == "--backend":
+            backend = arg
+    positions = benchmark_positions(size, count, size * size // 2)
+    print("workers  seconds  speedup  nodes/s  depth")
+    base = None
+    for processes in range(1, workers + 1):
+        seconds, nodes, depth = measure(processes, positions, limit, time_limit, backend)
+        base = base or seconds
+        print("{:7d}  {:7.2f}  {:7.2f}  {:7.0f}  {:5.1f}".format(
+            processes, seconds, base / seconds, nodes / seconds, depth))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
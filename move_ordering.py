@@ -0,0 +1,132 @@
+"""
+Search-learned move ordering: killer moves and the history heuristic.
+
+Sorting the children of a node by the utility of their boards means playing
+every move before searching any of them, and the disc difference of a
+board says little about which move will cause a cutoff. Instead, the moves
+are ranked by what the search itself learned, without trial moves:
+
+    * killer moves: the last KILLER_SLOTS moves that caused a cutoff at the
+      same remaining depth (within one search, the same ply), which are
+      often good in the sibling positions too;
+    * history: for each colour and square, the sum of depth * depth over all
+      the cutoffs that move caused anywhere in the tree; halved at the start
+      of every search, so old experience fades;
+    * a static square prior, corners first and the squares next to the
+      corners last, which ranks the moves nothing is known about yet.
+
+The table for a board size is shared by all searches of the process (see
+move_ordering(n)), so that the history learned on one move of a game helps
+the next; agent.py sorts with order() and reports cutoffs with cutoff(),
+and clears the table before a node function called directly, outside the
+select_move functions, so that such a call is deterministic.
+"""
+
+KILLER_SLOTS = 2
+KILLER_SCORE = 1 << 40 # above any history score
+PRIOR_LEVELS = 8 # history scores are multiplied by this, the prior ranks within a level
+
+_TABLES = {}
+
+
+def square_priorities(n):
+    """
+    Return the static prior of every square (index i * n + j), from 0 (worst)
+    to PRIOR_LEVELS - 1: corners, then edges, then the centre, then the edge
+    squares next to a corner, then the diagonal neighbours of the corners.
+    """
+    priorities = []
+    last = n - 1
+    for i in range(n):
+        for j in range(n):
+            edge_i = i in (0, last)
+            edge_j = j in (0, last)
+            near_i = i in (1, last - 1)
+            near_j = j in (1, last - 1)
+            if edge_i and edge_j:
+                priority = 7
+            elif (edge_i and near_j) or (near_i and edge_j):
+                priority = 1
+            elif near_i and near_j:
+                priority = 0
+            elif edge_i or edge_j:
+                priority = 5
+            else:
+                priority = 3
+            priorities.append(priority)
+    return priorities
+
+
+class MoveOrdering(object):
+    """
+    Killer and history tables for an n x n board.
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.prior = square_priorities(n)
+        self.history = [None, [0] * (n * n), [0] * (n * n)]
+        self.killers = {}
+
+    def new_search(self):
+        """
+        Forget the killers and age the history before a new search.
+        """
+        self.killers.clear()
+        for table in self.history[1:]:
+            for square in range(len(table)):
+                table[square] >>= 1
+
+    def clear(self):
+        self.killers.clear()
+        self.history = [None, [0] * (self.n * self.n), [0] * (self.n * self.n)]
+
+    def order(self, children, player, limit):
+        """
+        Return the (move, flips, board) children of a node where player is
+        to move, searched with the given limit, best first.
+        """
+        n = self.n
+        history = self.history[player]
+        prior = self.prior
+        killers = self.killers.get(limit, ())
+        scores = {}
+        for child in children:
+            i, j = child[0]
+            square = i * n + j
+            score = history[square] * PRIOR_LEVELS + prior[square]
+            if child[0] in killers:
+                score += KILLER_SCORE >> killers.index(child[0])
+            scores[child[0]] = score
+        return sorted(children, key=lambda child: scores[child[0]], reverse=True)
+
+    def cutoff(self, player, move, limit):
+        """
+        Record that move, played by player at a node searched with the given
+        limit, caused a cutoff.
+        """
+        depth = limit if limit > 0 else 1
+        self.history[player][move[0] * self.n + move[1]] += depth * depth
+        killers = self.killers.get(limit)
+        if killers is None:
+            self.killers[limit] = [move]
+        elif killers[0] != move:
+            if move in killers:
+                killers.remove(move)
+            killers.insert(0, move)
+            del killers[KILLER_SLOTS:]
+
+
+def clear_tables():
+    """
+    Clear the tables of every board size.
+    """
+    for table in _TABLES.values():
+        table.clear()
+
+
+def move_ordering(n):
+    table = _TABLES.get(n)
+    if table is None:
+        table = _TABLES[n] = MoveOrdering(n)
+    return table
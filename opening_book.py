@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Opening book for the agent: an offline builder and a memory-mapped reader.
+
+Every game starts from the position built by
+OthelloGameManager.create_initial_board, so the first moves of every game
+can be searched once, offline, and looked up at play time instead.
+
+File format (little endian):
+    header: magic b"OBK1", board size (u16), version (u16), number of slots
+            (u32, a power of two), number of entries (u32)
+    slots:  one 16 byte record per slot: Zobrist key (u64), best move as
+            square index + 1 (u16, 0 marks an empty slot), score for the side
+            to move (i16), search depth (u8), 3 bytes of padding
+
+Records are placed by open addressing (linear probing) on the key, with at
+most half of the slots in use, so a lookup reads one or two records straight
+from the memory map. Keys are the canonical keys of symmetry.py for the side
+to move, scored for the side to move, and moves are stored in the canonical
+orientation, so one record serves all eight rotations and reflections of a
+position. Those keys are generated from a fixed seed, so a book stays valid
+across runs.
+
+Build a book with, for example:
+    python3 opening_book.py -d 8 -p 6 -l 5 -o book8.bin
+"""
+
+import getopt
+import mmap
+import struct
+import sys
+import time
+
+from symmetry import canonical_key, symmetry
+
+MAGIC = b"OBK1"
+VERSION = 2
+HEADER = struct.Struct("<4sHHII")
+RECORD = struct.Struct("<QHhBxxx")
+
+
+class OpeningBook(object):
+    """
+    Read-only view of a book file. probe() costs one hash computation and
+    (on average) one or two record reads from the memory map.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.n, version, self.slots, self.entries = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("{} is not an opening book".format(path))
+        self.mask = self.slots - 1
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.entries
+
+    def probe_key(self, key):
+        """
+        Return the (square, score, depth) record stored for key, or None.
+        """
+        data = self.data
+        index = key & self.mask
+        while True:
+            stored, move, score, depth = RECORD.unpack_from(data, HEADER.size + index * RECORD.size)
+            if move == 0:
+                return None
+            if stored == key:
+                return move - 1, score, depth
+            index = (index + 1) & self.mask
+
+    def probe(self, board, color):
+        """
+        Return the book entry for board with color to move as a tuple
+        ((column, row), score, depth), or None if the position is not in the
+        book (or the board has a different size).
+        """
+        if len(board) != self.n:
+            return None
+        key, transform = book_key(board, color)
+        record = self.probe_key(key)
+        if record is None:
+            return None
+        square, score, depth = record
+        return symmetry(self.n).restore_move(transform, divmod(square, self.n)), score, depth
+
+
+def book_key(board, color):
+    """
+    Return (canonical key, transform) of board with color to move.
+    """
+    return canonical_key(board, color, color)
+
+
+def write_book(path, n, entries):
+    """
+    Write a book file. entries maps keys to (square, score, depth) tuples.
+    """
+    slots = 1
+    while slots < 2 * len(entries) or slots < 2:
+        slots *= 2
+    mask = slots - 1
+    data = bytearray(HEADER.size + slots * RECORD.size)
+    HEADER.pack_into(data, 0, MAGIC, n, VERSION, slots, len(entries))
+    used = [False] * slots
+    for key, (square, score, depth) in entries.items():
+        index = key & mask
+        while used[index]:
+            index = (index + 1) & mask
+        used[index] = True
+        score = max(min(int(score), 32767), -32768)
+        RECORD.pack_into(data, HEADER.size + index * RECORD.size, key, square + 1, score, min(depth, 255))
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def build_book(n, plies, depth, width=0, evaluator="heuristic", log=print):
+    """
+    Expand the opening tree from the initial position for the given number
+    of plies and score every position with a depth-limited alpha-beta search
+    (caching and node ordering on). If width is positive, only the width best
+    moves of each position are expanded further; otherwise all are.
+    Returns the entries for write_book.
+    """
+    import agent
+    from othello_game import OthelloGameManager
+
+    agent.set_backend("bitboard")
+    agent.set_evaluator(evaluator)
+    board = OthelloGameManager(n).create_initial_board()
+    frontier = [(board, 1)]
+    seen = set()
+    entries = {}
+    for ply in range(plies):
+        started = time.perf_counter()
+        next_frontier = []
+        for board, color in frontier:
+            key, transform = book_key(board, color)
+            if key in seen:
+                continue
+            seen.add(key)
+            moves = agent.get_possible_moves(board, color)
+            if not moves:
+                continue
+            scored = []
+            for move in moves:
+                new_board = agent.play_move(board, color, move[0], move[1])
+                value = agent.alphabeta_min_node(new_board, color, float("-inf"), float("inf"),
+                                                 depth - 1, 1, 1)[1]
+                scored.append((value, move, new_board))
+            scored.sort(key=lambda item: item[0], reverse=True)
+            best_value, best_move = scored[0][0], scored[0][1]
+            best_move = symmetry(n).transform_move(transform, best_move)
+            entries[key] = (best_move[0] * n + best_move[1], best_value, depth)
+            if width > 0:
+                scored = scored[:width]
+            for value, move, new_board in scored:
+                next_frontier.append((new_board, 3 - color))
+        log("ply {}: {} positions, {} entries, {:.1f}s".format(
+            ply + 1, len(frontier), len(entries), time.perf_counter() - started))
+        frontier = next_frontier
+    return entries
+
+
+def main(argv):
+    size = 8
+    plies = 6
+    depth = 5
+    width = 0
+    evaluator = "heuristic"
+    output = None
+    usage = "opening_book.py -d <dimension> -p <plies> -l <search depth> [-w <width> -e <evaluator>] -o <file>"
+    try:
+        opts, args = getopt.getopt(argv, "hd:p:l:w:e:o:",
+                                   ["dimension=", "plies=", "limit=", "width=", "eval=", "output="])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            print(usage)
+            sys.exit()
+        elif opt in ("-d", "--dimension"):
+            size = int(arg)
+        elif opt in ("-p", "--plies"):
+            plies = int(arg)
+        elif opt in ("-l", "--limit"):
+            depth = int(arg)
+        elif opt in ("-w", "--width"):
+            width = int(arg)
+        elif opt in ("-e", "--eval"):
+            evaluator = arg
+        elif opt in ("-o", "--output"):
+            output = arg
+    if output is None:
+        output = "book{}.bin".format(size)
+    entries = build_book(size, plies, depth, width, evaluator)
+    write_book(output, size, entries)
+    print("wrote {} entries to {}".format(len(entries), output))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
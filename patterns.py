@@ -0,0 +1,321 @@
+"""
+Pattern-table evaluation: the "patterns" evaluator of agent.py.
+
+Instead of scanning the board for corners, edges, stable discs and
+mobility, the value of a position is the sum of a few dozen table lookups.
+A pattern is a fixed list of squares, and its contents read as a base-3
+number (0 empty, 1 dark, 2 light: the square values of the board
+themselves) index a table of weights. The pattern families are:
+
+    * edge: the n squares of an edge (4 instances);
+    * corner2x5: the 2 x 5 block along an edge at a corner (8 instances);
+    * corner3x3: the 3 x 3 block at a corner (4 instances);
+    * diagonal: the n squares of a main diagonal (2 instances).
+
+A table has 3 ** k entries for a pattern of k squares, so the lines are
+cut to MAX_LINE squares on boards larger than that: an edge pattern is
+then the MAX_LINE squares of an edge from a corner (8 instances, which
+cover the edges up to 2 * MAX_LINE squares) and a diagonal pattern the
+MAX_LINE squares of a diagonal from a corner (4 instances).
+
+The instances of a family are the images of one list of squares under the
+rotations and reflections of the board, and they share one table, so the
+value of a position is the same in all eight orientations, as the
+symmetry-reduced cache keys need. There is one table per family and game
+phase (PHASES ranges of empty squares), stored as an array.array of ints;
+weights are for dark, and the value for light is their negation.
+
+PatternState keeps the index of every instance up to date move by move,
+like evaluation.EvalState, so that evaluating a leaf is one lookup per
+instance (18 on 8x8).
+
+Weights are read from a file if there is one for the board size, and seeded
+from the weights of compute_heuristic otherwise: every square is worth its
+corner, edge and disc weights for the phase, and the squares next to a
+corner lose CORNER_WEIGHT / 2 (diagonal) or EDGE_WEIGHT (edge) while the
+corner is empty.
+
+File format (little endian):
+    header:  magic b"PTN1", board size (u16), phases (u16), entries per
+             phase (u32)
+    weights: phases * entries int32, phase 0 (the end of the game) first,
+             then the tables of each phase in the order of FAMILIES
+"""
+
+import os
+import struct
+import sys
+from array import array
+
+from evaluation import phase_weights
+
+MAGIC = b"PTN1"
+HEADER = struct.Struct("<4sHHI")
+PHASES = 4 # game phases, by share of empty squares
+FAMILIES = ("edge", "corner2x5", "corner3x3", "diagonal")
+MAX_LINE = 8 # squares of the longest edge and diagonal patterns (3 ** 8 = 6561 entries)
+
+_TABLES = {}
+_PATHS = {"weights": None} # weight file of every size ("{}" for the size), see set_weights_path
+
+
+def phase(n, empties):
+    """
+    Game phase of a position with the given number of empty squares: 0 at
+    the end of the game, PHASES - 1 at the start.
+    """
+    return min(empties * PHASES // (n * n), PHASES - 1)
+
+
+def family_squares(family, n):
+    """
+    Return the squares (row, column) of the first instance of family on an
+    n x n board. The corner blocks list their corner last, as the most
+    significant digit of the index.
+    """
+    if family == "edge":
+        return [(0, j) for j in range(min(n, MAX_LINE))]
+    if family == "diagonal":
+        return [(k, k) for k in range(min(n, MAX_LINE))]
+    rows, columns = (2, min(5, n)) if family == "corner2x5" else (3, 3)
+    return [(i, j) for i in range(rows) for j in range(columns) if (i, j) != (0, 0)] + [(0, 0)]
+
+
+def symmetries(n):
+    """
+    The eight rotations and reflections of an n x n board, as functions of
+    (row, column), the rotations first.
+    """
+    last = n - 1
+    return [lambda i, j: (i, j), lambda i, j: (j, last - i),
+            lambda i, j: (last - i, last - j), lambda i, j: (last - j, i),
+            lambda i, j: (i, last - j), lambda i, j: (last - i, j),
+            lambda i, j: (j, i), lambda i, j: (last - j, last - i)]
+
+
+def family_instances(family, n):
+    """
+    Return the instances of family on an n x n board: the distinct images
+    of its first instance, each as a list of squares in matching order.
+    """
+    base = family_squares(family, n)
+    seen = set()
+    instances = []
+    for transform in symmetries(n):
+        squares = [transform(i, j) for i, j in base]
+        if frozenset(squares) not in seen:
+            seen.add(frozenset(squares))
+            instances.append(squares)
+    return instances
+
+
+def seed_table(family, n, phase_index):
+    """
+    Return the seed weights of family in the given phase (see the module
+    docstring) as a list indexed by the base-3 pattern index.
+    """
+    size = n * n
+    corner_weight, edge_weight, _, _, disk_weight = phase_weights((2 * phase_index + 1) * size // (2 * PHASES), size)
+    coverage = [[0] * n for _ in range(n)]
+    for name in FAMILIES:
+        for squares in family_instances(name, n):
+            for i, j in squares:
+                coverage[i][j] += 1
+    last = n - 1
+
+    def square_value(i, j):
+        value = disk_weight
+        if i in (0, last) and j in (0, last):
+            value += corner_weight
+        elif i in (0, last) or j in (0, last):
+            value += edge_weight
+        return value / coverage[i][j]
+
+    def build(squares, penalties):
+        table = [0.0]
+        for i, j in squares:
+            value = square_value(i, j) + penalties.get((i, j), 0)
+            table = table + [weight + value for weight in table] + [weight - value for weight in table]
+        return table
+
+    squares = family_squares(family, n)
+    if family != "corner3x3":
+        table = build(squares, {})
+    else: # the penalties of the squares next to the corner only apply while it is empty
+        penalties = {(1, 1): -(corner_weight // 2), (0, 1): -edge_weight, (1, 0): -edge_weight}
+        empty = build(squares[:-1], penalties)
+        taken = build(squares[:-1], {})
+        corner = square_value(0, 0)
+        table = empty + [weight + corner for weight in taken] + [weight - corner for weight in taken]
+    return table
+
+
+class PatternTables(object):
+    """
+    Patterns and weights for an n x n board. instances lists, for every
+    instance, the offset of its family's table and its squares with their
+    powers of 3; squares maps every square index (as in othello_bitboard:
+    board[i][j] is square j * n + i) to the (instance, power) pairs of the
+    instances that read it; weights[phase] is the array of all the tables
+    of the phase.
+    """
+
+    def __init__(self, n, weights=None):
+        self.n = n
+        self.instances = []
+        self.offsets = {}
+        offset = 0
+        for family in FAMILIES:
+            self.offsets[family] = offset
+            for squares in family_instances(family, n):
+                self.instances.append((offset, [(i, j, 3 ** k) for k, (i, j) in enumerate(squares)]))
+            offset += 3 ** len(family_squares(family, n))
+        self.entries = offset
+        self.squares = [[] for _ in range(n * n)]
+        for index, (offset, cells) in enumerate(self.instances):
+            for i, j, power in cells:
+                self.squares[j * n + i].append((index, power))
+        self.squares = [tuple(cells) for cells in self.squares]
+        if weights is None:
+            weights = []
+            for phase_index in range(PHASES):
+                tables = array("i")
+                for family in FAMILIES:
+                    tables.extend(int(round(weight)) for weight in seed_table(family, n, phase_index))
+                weights.append(tables)
+        self.weights = weights
+
+    def indices(self, board):
+        """
+        Return the index of every instance on board, offset included.
+        """
+        indices = []
+        for offset, cells in self.instances:
+            for i, j, power in cells:
+                offset += board[i][j] * power
+            indices.append(offset)
+        return indices
+
+    def value(self, board, color):
+        """
+        Return the pattern value of board for color.
+        """
+        empties = sum(row.count(0) for row in board)
+        weights = self.weights[phase(self.n, empties)]
+        total = sum(weights[index] for index in self.indices(board))
+        return total if color == 1 else -total
+
+
+def load_weights(path, n):
+    """
+    Read the weights for an n x n board from path. Returns the list of
+    arrays, one per phase.
+    """
+    with open(path, "rb") as f:
+        magic, size, phases, entries = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or size != n or phases != PHASES:
+            raise ValueError("{} holds no pattern weights for {}x{}".format(path, n, n))
+        weights = []
+        for _ in range(phases):
+            tables = array("i")
+            tables.fromfile(f, entries)
+            if sys.byteorder == "big":
+                tables.byteswap()
+            weights.append(tables)
+    if entries != PatternTables(n, weights).entries:
+        raise ValueError("{} does not match the patterns of {}x{}".format(path, n, n))
+    return weights
+
+
+def save_weights(path, table):
+    """
+    Write the weights of the PatternTables table to path.
+    """
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, table.n, len(table.weights), table.entries))
+        for tables in table.weights:
+            if sys.byteorder == "big":
+                tables = array("i", tables)
+                tables.byteswap()
+            tables.tofile(f)
+
+
+def set_weights_path(path):
+    """
+    Read the weights from path ("{}" is replaced by the board size) from
+    now on, or use the seed weights if path is None or has no file.
+    """
+    _PATHS["weights"] = path
+    _TABLES.clear()
+
+
+def tables(n):
+    table = _TABLES.get(n)
+    if table is None:
+        path = _PATHS["weights"]
+        path = path.format(n) if path is not None else None
+        if path is not None and os.path.exists(path):
+            table = PatternTables(n, load_weights(path, n))
+            table.source = path
+        else:
+            table = PatternTables(n)
+            table.source = "seed"
+        _TABLES[n] = table
+    return table
+
+
+class PatternState(object):
+    """
+    Pattern indices of one position, updated by make() and unmake() as
+    EvalState is.
+    """
+
+    def __init__(self, board):
+        n = len(board)
+        self.n = n
+        self.tables = tables(n)
+        self.indices = self.tables.indices(board)
+        self.empties = sum(row.count(0) for row in board)
+
+    def make(self, player, square, flips):
+        """
+        Update the indices for player placing a disc on square and flipping
+        the discs in flips.
+        """
+        indices = self.indices
+        squares = self.tables.squares
+        for index, power in squares[square]:
+            indices[index] += player * power
+        change = 1 if player == 2 else -1 # a flipped disc turns from 3 - player to player
+        while flips:
+            low = flips & -flips
+            for index, power in squares[low.bit_length() - 1]:
+                indices[index] += change * power
+            flips ^= low
+        self.empties -= 1
+
+    def unmake(self, player, square, flips):
+        """
+        Undo make(player, square, flips).
+        """
+        indices = self.indices
+        squares = self.tables.squares
+        for index, power in squares[square]:
+            indices[index] -= player * power
+        change = 1 if player == 2 else -1
+        while flips:
+            low = flips & -flips
+            for index, power in squares[low.bit_length() - 1]:
+                indices[index] -= change * power
+            flips ^= low
+        self.empties += 1
+
+    def value(self, color):
+        """
+        Return the pattern value of the current position for color.
+        """
+        weights = self.tables.weights[phase(self.n, self.empties)]
+        total = 0
+        for index in self.indices:
+            total += weights[index]
+        return total if color == 1 else -total
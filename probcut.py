@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Multi-ProbCut: selective search for the agent, and its offline calibration.
+
+A search to depth D and a much cheaper search of the same position to a
+shallow depth d are strongly correlated: the deep value v_D is close to
+a * v_d + b, with residuals of standard deviation sigma. So before
+searching a node to depth D, a null-window shallow search can show that the
+deep value is, with high confidence, at least beta (v_d >= (beta + t *
+sigma - b) / a) or at most alpha (v_d <= (alpha - t * sigma - b) / a), and
+the node is cut without the deep search. t (THRESHOLD) trades safety for
+speed. As in Buro's Multi-ProbCut, the regression is fitted separately for
+every board size, game phase (PHASES ranges of empty squares) and deep
+depth, each deep depth with its own shallow depth (shallow_depth).
+
+Calibration searches a corpus of positions reached by random play (see
+lazy_smp.benchmark_positions) to both depths with plain alpha-beta and
+writes the coefficients as JSON, per evaluator:
+    {"threshold": 1.0,
+     "models": {"heuristic": {"8": {"2": {"6": [2, 1.02, -4.1, 38.5, 1.01, 30.2, 39.0], ...}}}}}
+read as models[evaluator][board size][phase][deep depth] = [shallow depth,
+a, b, sigma] and, for evaluators whose values for the two sides are not
+negations of each other (the heuristic counts stable discs for color only),
+the a, b and sigma of a second fit for the nodes of agent.negamax_node
+where the side to move is not color. For the other evaluators (SYMMETRIC)
+the fit of the side to move holds at every node. For example, to calibrate depths 3 to 6 on 8x8 with 24
+positions per phase:
+    python3 probcut.py -d 8 -l 3,4,5,6 -n 24 -e heuristic -o probcut.json
+The agent loads the file given by the handshake option probcut (see
+agent.py); sizes, phases and depths missing from it are searched in full.
+"""
+
+import getopt
+import json
+import math
+import random
+import sys
+import time
+
+THRESHOLD = 1.0 # cut when the deep value is this many sigmas outside the window
+PHASES = 4 # game phases, by share of empty squares
+MIN_DEPTH = 3 # shallower searches are never cut
+SYMMETRIC = ("utility", "weighted", "patterns") # evaluators whose value for one side is minus the other's
+
+
+def shallow_depth(depth):
+    """
+    Depth of the shallow search that predicts a search to depth: about half
+    of it, with the same parity, since the evaluator's values swing with
+    the side that moved last.
+    """
+    shallow = depth // 2
+    if (depth - shallow) % 2:
+        shallow -= 1
+    return max(shallow, 1)
+
+
+def phase(n, empties):
+    """
+    Game phase of a position with the given number of empty squares: 0 at
+    the end of the game, PHASES - 1 at the start.
+    """
+    return min(empties * PHASES // (n * n), PHASES - 1)
+
+
+class ProbCutModel(object):
+    """
+    The coefficients of one evaluator, as read from a calibration file.
+    With symmetric false, nodes where the side to move is not color are
+    only cut with a fit of their own.
+    """
+
+    def __init__(self, models, threshold=THRESHOLD, symmetric=True):
+        self.threshold = threshold
+        self.cuts = {}
+        for n, phases in models.items():
+            for phase_index, depths in phases.items():
+                for depth, fitted in depths.items():
+                    key = (int(n), int(phase_index), int(depth))
+                    shallow, slope, intercept, sigma = fitted[:4]
+                    self.cuts[key + (1,)] = (shallow, slope, intercept, threshold * sigma)
+                    if len(fitted) == 7:
+                        slope, intercept, sigma = fitted[4:]
+                    elif not symmetric:
+                        continue
+                    self.cuts[key + (-1,)] = (shallow, slope, intercept, threshold * sigma)
+
+    def __len__(self):
+        return sum(1 for key in self.cuts if key[3] == 1)
+
+    def lookup(self, n, empties, depth, sign=1):
+        """
+        Return (shallow depth, a, b, t * sigma) for a search of depth on an
+        n x n board with the given number of empty squares, or None. sign
+        is -1 for a node where the side to move is not color (player !=
+        color in agent.negamax_node).
+        """
+        return self.cuts.get((n, phase(n, empties), depth, sign))
+
+    def upper_cut(self, cut, beta):
+        """
+        Return the bound a shallow search must reach for the deep value to
+        be at least beta with high confidence.
+        """
+        shallow, slope, intercept, margin = cut
+        return math.ceil((beta + margin - intercept) / slope)
+
+    def lower_cut(self, cut, alpha):
+        """
+        Return the bound a shallow search must stay under for the deep
+        value to be at most alpha with high confidence.
+        """
+        shallow, slope, intercept, margin = cut
+        return math.floor((alpha - margin - intercept) / slope)
+
+
+class EmptyCount(object):
+    """
+    The number of empty squares of the position being searched, kept up to
+    date by make() and unmake() like evaluation.EvalState: the tracker of
+    agent.py for the evaluators without one of their own when ProbCut is
+    on, so that a node finds its game phase without scanning the board.
+    """
+
+    def __init__(self, board):
+        self.empties = sum(row.count(0) for row in board)
+
+    def make(self, player, square, flips):
+        self.empties -= 1
+
+    def unmake(self, player, square, flips):
+        self.empties += 1
+
+
+def load_model(path, evaluator):
+    """
+    Read the coefficients of evaluator from the calibration file path.
+    Returns the ProbCutModel, or None if the file has none for evaluator.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    models = data.get("models", {}).get(evaluator)
+    if not models:
+        return None
+    return ProbCutModel(models, data.get("threshold", THRESHOLD), evaluator in SYMMETRIC)
+
+
+def fit(pairs):
+    """
+    Least-squares fit of deep = a * shallow + b over the (shallow, deep)
+    value pairs. Returns (a, b, sigma), sigma being the standard deviation
+    of the residuals.
+    """
+    count = len(pairs)
+    mean_x = sum(x for x, y in pairs) / count
+    mean_y = sum(y for x, y in pairs) / count
+    sxx = sum((x - mean_x) ** 2 for x, y in pairs)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in pairs)
+    slope = sxy / sxx if sxx > 0 else 1.0
+    if slope <= 0: # no usable correlation: predict the shallow value itself
+        slope = 1.0
+    intercept = mean_y - slope * mean_x
+    sigma = math.sqrt(sum((y - slope * x - intercept) ** 2 for x, y in pairs) / count)
+    return slope, intercept, sigma
+
+
+def calibration_positions(n, count, seed=0):
+    """
+    Return count (board, color) positions for every phase of an n x n
+    board, each with a number of empty squares drawn from its phase.
+    """
+    from lazy_smp import benchmark_positions
+    rng = random.Random(seed)
+    positions = {}
+    for index in range(PHASES):
+        low = max(index * n * n // PHASES, 1)
+        high = min((index + 1) * n * n // PHASES, n * n - 4) - 1
+        positions[index] = []
+        for _ in range(count):
+            empties = rng.randint(low, max(low, high))
+            positions[index].extend(benchmark_positions(n, 1, empties, rng.randrange(1 << 30)))
+    return positions
+
+
+def calibrate(n, depths, count, evaluator="heuristic", seed=0, log=print):
+    """
+    Fit the coefficients of every phase and deep depth on an n x n board
+    from count positions per phase. Returns {phase: {depth: [shallow, a, b,
+    sigma]}} with string keys, as stored in the file, followed by the a, b
+    and sigma of the other side's nodes unless evaluator is SYMMETRIC.
+    """
+    import agent
+    agent.set_backend("bitboard")
+    agent.set_evaluator(evaluator)
+    agent.probcut = None
+    inf = float("inf")
+    sides = (1,) if evaluator in SYMMETRIC else (1, -1)
+    result = {}
+    for index, positions in calibration_positions(n, count, seed).items():
+        started = time.perf_counter()
+        values = {}
+        for board, color in positions:
+            empties = sum(row.count(0) for row in board)
+            agent.cache.clear()
+            for depth in sorted(set(depths) | {shallow_depth(depth) for depth in depths}):
+                if depth <= empties:
+                    for side in sides: # values for color to move, as at the nodes of that sign
+                        values[(board, color, depth, side)] = agent.negamax_node(
+                            board, color if side == 1 else 3 - color, color, -inf, inf, depth, 1, 1)[1]
+        result[str(index)] = models = {}
+        for depth in depths:
+            fitted = [shallow_depth(depth)]
+            for side in sides:
+                pairs = [(values[(board, color, shallow_depth(depth), side)], values[(board, color, depth, side)])
+                         for board, color in positions if (board, color, depth, side) in values]
+                if evaluator != "utility": # proven results (scaled by TERMINAL_SCALE) are outliers of the fit
+                    pairs = [(x, y) for x, y in pairs if max(abs(x), abs(y)) < agent.TERMINAL_SCALE]
+                if len(pairs) < 2:
+                    break
+                slope, intercept, sigma = fit(pairs)
+                fitted += [round(slope, 4), round(intercept, 3), round(sigma, 3)]
+                log("{0}x{0} phase {1} depth {2} from {3}{8}: a {4:.3f} b {5:.2f} sigma {6:.2f} ({7} positions)".format(
+                    n, index, depth, shallow_depth(depth), slope, intercept, sigma, len(pairs),
+                    "" if side == 1 else ", other side"))
+            else:
+                models[str(depth)] = fitted
+        log("{0}x{0} phase {1}: {2:.1f}s".format(n, index, time.perf_counter() - started))
+    return result
+
+
+def write_calibration(path, evaluator, sizes, threshold=THRESHOLD):
+    """
+    Store the fitted sizes ({n: calibrate(...)}) of evaluator in path,
+    keeping the entries of other evaluators and sizes already in the file.
+    """
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    data["threshold"] = threshold
+    models = data.setdefault("models", {}).setdefault(evaluator, {})
+    for n, phases in sizes.items():
+        models[str(n)] = phases
+    with open(path, "w") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+
+
+def main(argv):
+    sizes = [8]
+    depths = [3, 4, 5, 6]
+    count = 24
+    evaluator = "heuristic"
+    threshold = THRESHOLD
+    seed = 0
+    output = "probcut.json"
+    usage = ("probcut.py -d <sizes> -l <deep depths> -n <positions per phase> "
+             "[-e <evaluator> -t <threshold> -s <seed>] -o <file>")
+    try:
+        opts, args = getopt.getopt(argv, "hd:l:n:e:t:s:o:", ["dimensions=", "limits=", "positions=", "eval=",
+                                                            "threshold=", "seed=", "output="])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            print(usage)
+            sys.exit()
+        elif opt in ("-d", "--dimensions"):
+            sizes = [int(size) for size in arg.split(",")]
+        elif opt in ("-l", "--limits"):
+            depths = [int(depth) for depth in arg.split(",") if int(depth) >= MIN_DEPTH]
+        elif opt in ("-n", "--positions"):
+            count = int(arg)
+        elif opt in ("-e", "--eval"):
+            evaluator = arg
+        elif opt in ("-t", "--threshold"):
+            threshold = float(arg)
+        elif opt in ("-s", "--seed"):
+            seed = int(arg)
+        elif opt in ("-o", "--output"):
+            output = arg
+    fitted = {n: calibrate(n, depths, count, evaluator, seed) for n in sizes}
+    write_calibration(output, evaluator, fitted, threshold)
+    print("wrote {} to {}".format(", ".join("{0}x{0}".format(n) for n in sizes), output))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
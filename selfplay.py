@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Self-play training data: games of the agent against itself, labelled with
+search scores and final results, written as fixed-width binary records.
+
+A pool of worker processes plays the games in-process, with the search of
+agent.py (negamax_node with caching and node ordering, to a fixed depth)
+and no AI subprocesses. Every game starts with a number of random opening
+plies, and after them each move is the searched one except with
+probability epsilon, when a random move is played instead, so the games do
+not all follow the same line. As in the game manager, a game ends as soon
+as the side to move has no move. Every position of the searched plies
+becomes a record: the board, the side to move, the search depth and
+score, the searched move and the final disc difference, both for the side
+to move. The result is only known at the end of a game, so the records of a
+game are appended to the shard together when it ends.
+
+Each task of the pool fills a shard of its own, so shards are append-only
+and never written by two processes. New runs on the same directory start
+after the last shard, with the shard number in the seed. A record cut short
+by a crash is ignored by the readers.
+
+File format of a shard (little endian):
+    header:  magic b"SPR1", board size (u16), version (u16), record size
+             (u32)
+    records: dark and light discs (ceil(n * n / 8) bytes each, the masks of
+             othello_bitboard), side to move (u8), search depth (u8, so the
+             depth limit is from 1 to MAX_DEPTH), score
+             for the side to move (i32), final disc difference for the side
+             to move (i16), searched move as a square index of
+             othello_bitboard (u16)
+
+iter_records() reads a shard as Python values; with NumPy, load_shard()
+memory-maps it as a structured array (see record_dtype) and boards() turns its
+disc masks into an (k, n, n) int8 array of board values, without parsing.
+
+Example: 10000 games of depth 4 on 8x8, 200 games per shard, 8 processes:
+    python3 selfplay.py -d 8 -g 10000 -k 200 -l 4 -r 6 -x 0.1 -e heuristic -j 8 -o data
+"""
+
+import getopt
+import glob
+import multiprocessing
+import os
+import random
+import struct
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError: # pragma: no cover - depends on the environment
+    np = None
+
+from othello_bitboard import board_to_masks, masks_to_board
+
+MAGIC = b"SPR1"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+GAMES_PER_SHARD = 100
+MAX_DEPTH = 255 # largest depth limit of the u8 depth field
+
+
+def mask_bytes(n):
+    """
+    Bytes used by one disc mask of an n x n board.
+    """
+    return (n * n + 7) // 8
+
+
+def record_struct(n):
+    return struct.Struct("<{0}s{0}sBBihH".format(mask_bytes(n)))
+
+
+def record_dtype(n):
+    """
+    NumPy dtype of the records of an n x n board (packed, as in the file).
+    """
+    size = mask_bytes(n)
+    return np.dtype([("dark", "u1", (size,)), ("light", "u1", (size,)), ("player", "u1"), ("depth", "u1"),
+                     ("score", "<i4"), ("result", "<i2"), ("move", "<u2")])
+
+
+def shard_path(directory, n, index):
+    return os.path.join(directory, "{0}x{0}-{1:05d}.spr".format(n, index))
+
+
+def shard_paths(directory, n):
+    """
+    Return the shards of n x n games in directory, in order.
+    """
+    return sorted(glob.glob(os.path.join(directory, "{0}x{0}-*.spr".format(n))))
+
+
+def read_header(path):
+    """
+    Return (board size, record size) of the shard at path.
+    """
+    with open(path, "rb") as f:
+        magic, n, version, size = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("{} is not a self-play shard".format(path))
+    return n, size
+
+
+def iter_records(path):
+    """
+    Yield the records of the shard at path as tuples (board, player, depth,
+    score, result, move), board as a tuple of tuples and move as (i, j).
+    """
+    n, size = read_header(path)
+    record = record_struct(n)
+    with open(path, "rb") as f:
+        f.seek(HEADER.size)
+        while True:
+            data = f.read(size)
+            if len(data) < size:
+                return
+            dark, light, player, depth, score, result, move = record.unpack(data)
+            board = masks_to_board(int.from_bytes(dark, "little"), int.from_bytes(light, "little"), n)
+            yield board, player, depth, score, result, divmod(move, n)
+
+
+def load_shard(path):
+    """
+    Memory-map the shard at path. Returns (n, structured array of records).
+    """
+    if np is None:
+        raise ImportError("Reading shards as arrays needs NumPy")
+    n, size = read_header(path)
+    count = (os.path.getsize(path) - HEADER.size) // size
+    if count == 0:
+        return n, np.zeros(0, dtype=record_dtype(n))
+    return n, np.memmap(path, dtype=record_dtype(n), mode="r", offset=HEADER.size, shape=(count,))
+
+
+def boards(records, n):
+    """
+    Return the boards of records (from load_shard) as a (k, n, n) int8
+    array: 0 empty, 1 dark, 2 light, indexed [row][column] as the boards
+    of othello_shared.
+    """
+    dark = np.unpackbits(records["dark"], axis=1, bitorder="little")[:, :n * n]
+    light = np.unpackbits(records["light"], axis=1, bitorder="little")[:, :n * n]
+    values = (dark + 2 * light).astype(np.int8)
+    return values.reshape(-1, n, n).transpose(0, 2, 1) # square j * n + i is board[i][j]
+
+
+def check_limit(limit):
+    """
+    Raise ValueError unless limit is a depth limit the records can hold.
+    Self-play searches to a fixed depth: the unlimited searches of the
+    agent (a negative limit) are not supported.
+    """
+    if not 1 <= limit <= MAX_DEPTH:
+        raise ValueError("the depth limit must be from 1 to {}, not {}".format(MAX_DEPTH, limit))
+
+
+def play_selfplay_game(n, limit, plies, epsilon, rng):
+    """
+    Play one game of the agent against itself and return its records,
+    packed.
+    """
+    import agent
+    from othello_game import OthelloGameManager
+    inf = float("inf")
+    record = record_struct(n)
+    size = mask_bytes(n)
+    board = OthelloGameManager(n).create_initial_board()
+    board = tuple(tuple(row) for row in board)
+    color = 1
+    positions = []
+    ply = 0
+    while True:
+        moves = agent.get_possible_moves(board, color)
+        if not moves:
+            break
+        if ply < plies:
+            move = rng.choice(moves)
+        else:
+            agent.start_tracking(board)
+            try:
+                best, score = agent.negamax_node(board, color, color, -inf, inf, limit, 1, 1)
+            finally:
+                agent.stop_tracking()
+            best = best or moves[0]
+            positions.append((board, color, score, best))
+            move = rng.choice(moves) if rng.random() < epsilon else best
+        board = agent.play_move(board, color, move[0], move[1])
+        color = 3 - color
+        ply += 1
+    dark_score, light_score = agent.get_score(board)
+    records = []
+    for position, player, score, move in positions:
+        dark, light = board_to_masks(position)
+        result = dark_score - light_score if player == 1 else light_score - dark_score
+        records.append(record.pack(dark.to_bytes(size, "little"), light.to_bytes(size, "little"), player,
+                                   limit, int(score), result, move[0] * n + move[1]))
+    return records
+
+
+def setup_worker(backend, evaluator):
+    """
+    Initializer of the pool processes: choose the backend and evaluator of
+    the agent's search.
+    """
+    import agent
+    agent.set_backend(backend)
+    agent.set_evaluator(evaluator)
+
+
+def play_shard(task):
+    """
+    Play the games of one shard (run in a pool process) and append their
+    records to it game by game. task is a tuple (path, shard index, n,
+    games, depth limit, opening plies, epsilon, seed). Returns (shard
+    index, records written).
+    """
+    path, index, n, games, limit, plies, epsilon, seed = task
+    check_limit(limit)
+    rng = random.Random("{}-{}".format(seed, index))
+    written = 0
+    with open(path, "ab") as f:
+        if f.tell() == 0:
+            f.write(HEADER.pack(MAGIC, n, VERSION, record_struct(n).size))
+        for _ in range(games):
+            records = play_selfplay_game(n, limit, plies, epsilon, rng)
+            f.write(b"".join(records))
+            f.flush()
+            written += len(records)
+    return index, written
+
+
+def generate(directory, n, games, per_shard=GAMES_PER_SHARD, limit=4, plies=6, epsilon=0.1,
+             evaluator="heuristic", jobs=None, seed=0, log=print):
+    """
+    Play games games on an n x n board into new shards of directory, per_shard
+    games each. Returns the number of records written.
+    """
+    check_limit(limit)
+    os.makedirs(directory, exist_ok=True)
+    first = len(shard_paths(directory, n))
+    tasks = []
+    for shard in range((games + per_shard - 1) // per_shard):
+        index = first + shard
+        count = min(per_shard, games - shard * per_shard)
+        tasks.append((shard_path(directory, n, index), index, n, count, limit, plies, epsilon, seed))
+    written = 0
+    started = time.perf_counter()
+    with multiprocessing.Pool(jobs, initializer=setup_worker, initargs=("bitboard", evaluator)) as pool:
+        for done, (index, records) in enumerate(pool.imap_unordered(play_shard, tasks), 1):
+            written += records
+            elapsed = time.perf_counter() - started
+            log("{}/{} shards, {} records, {:.0f} records/s".format(done, len(tasks), written, written / elapsed))
+    return written
+
+
+def main(argv):
+    n = 8
+    games = 100
+    per_shard = GAMES_PER_SHARD
+    limit = 4
+    plies = 6
+    epsilon = 0.1
+    evaluator = "heuristic"
+    jobs = None
+    seed = 0
+    directory = "selfplay"
+    usage = ("selfplay.py -d <dimension> -g <games> [-k <games per shard> -l <depth-limit> -r <opening plies> "
+             "-x <random move probability> -e <evaluator> -j <processes> -s <seed>] -o <directory>")
+    try:
+        opts, args = getopt.getopt(argv, "hd:g:k:l:r:x:e:j:s:o:", ["dimension=", "games=", "shard=", "limit=",
+                                                                  "random-plies=", "epsilon=", "eval=", "jobs=",
+                                                                  "seed=", "output="])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            print(usage)
+            sys.exit()
+        elif opt in ("-d", "--dimension"):
+            n = int(arg)
+        elif opt in ("-g", "--games"):
+            games = int(arg)
+        elif opt in ("-k", "--shard"):
+            per_shard = int(arg)
+        elif opt in ("-l", "--limit"):
+            limit = int(arg)
+        elif opt in ("-r", "--random-plies"):
+            plies = int(arg)
+        elif opt in ("-x", "--epsilon"):
+            epsilon = float(arg)
+        elif opt in ("-e", "--eval"):
+            evaluator = arg
+        elif opt in ("-j", "--jobs"):
+            jobs = int(arg)
+        elif opt in ("-s", "--seed"):
+            seed = int(arg)
+        elif opt in ("-o", "--output"):
+            directory = arg
+    try:
+        check_limit(limit)
+    except ValueError as error:
+        print(error)
+        sys.exit(2)
+    written = generate(directory, n, games, per_shard, limit, plies, epsilon, evaluator, jobs, seed)
+    print("{} records in {}".format(written, directory))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
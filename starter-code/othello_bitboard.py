@@ -0,0 +1,346 @@
+"""
+Bitboard implementation of the functions in othello_shared.
+
+Each colour is stored as one integer mask with one bit per square. Square
+(i, j) (column i, row j) is bit i * n + j, so iterating the bits of a mask
+in increasing order visits squares in the same column-major order that
+othello_shared.get_possible_moves uses. Legal moves and flips are computed
+with shift-and-mask flood fills in the eight directions, which works for
+any board size because Python integers are unbounded.
+
+find_lines, get_possible_moves, play_move, get_score, get_flips,
+get_moves_and_flips, apply_move and flips_to_mask accept and return the
+usual tuple-of-tuples boards and can be used as a drop-in replacement for
+the functions in othello_shared (flip sets are masks instead of lists). The mask level functions below them
+can be used directly by code that keeps its positions as masks, and
+pack_board / unpack_board convert boards to and from one integer for use as
+keys.
+"""
+
+_GEOMETRY = {}
+_ROW_MASKS = {}
+ROW_CACHE_LIMIT = 1 << 16
+
+
+class Geometry(object):
+    """
+    Precomputed masks for one board size. directions is a list of
+    (xdir, ydir, shift, source_mask) in the same order as find_lines: a
+    disc on a square in source_mask moves to the square xdir, ydir away
+    when the mask is shifted by shift bits.
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.size = n * n
+        self.full = (1 << self.size) - 1
+        not_first_row = 0
+        not_last_row = 0
+        for i in range(n):
+            for j in range(n):
+                if j > 0:
+                    not_first_row |= 1 << (i * n + j)
+                if j < n - 1:
+                    not_last_row |= 1 << (i * n + j)
+        self.directions = []
+        for xdir, ydir in [[0, 1], [1, 1], [1, 0], [1, -1], [0, -1], [-1, -1],
+                           [-1, 0], [-1, 1]]:
+            if ydir == 1:
+                source = not_last_row
+            elif ydir == -1:
+                source = not_first_row
+            else:
+                source = self.full
+            self.directions.append((xdir, ydir, xdir * n + ydir, source))
+        corners = [(0, 0), (0, n - 1), (n - 1, 0), (n - 1, n - 1)]
+        self.corners = 0
+        for i, j in corners:
+            self.corners |= 1 << (i * n + j)
+        self.edges = 0
+        for k in range(1, n - 1):
+            for i, j in [(0, k), (n - 1, k), (k, 0), (k, n - 1)]:
+                self.edges |= 1 << (i * n + j)
+
+
+def geometry(n):
+    """
+    Return the (cached) Geometry for an n x n board.
+    """
+    geo = _GEOMETRY.get(n)
+    if geo is None:
+        geo = _GEOMETRY[n] = Geometry(n)
+    return geo
+
+
+def shift(mask, direction, full):
+    """
+    Move every bit of mask one step in direction, dropping bits that leave
+    the board.
+    """
+    xdir, ydir, s, source = direction
+    mask &= source
+    if s > 0:
+        return (mask << s) & full
+    return mask >> -s
+
+
+if hasattr(int, "bit_count"):
+    def popcount(mask):
+        return mask.bit_count()
+else:
+    def popcount(mask):
+        return bin(mask).count("1")
+
+
+def iter_squares(mask):
+    """
+    Yield the indices of the set bits of mask in increasing order.
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def square_index(i, j, n):
+    return i * n + j
+
+
+def square_coords(square, n):
+    """
+    Return the (column, row) tuple for a square index.
+    """
+    return divmod(square, n)
+
+
+############ CONVERSION ############################
+def board_to_masks(board):
+    """
+    Return the (dark, light) masks of a tuple-of-tuples board.
+    """
+    dark = 0
+    light = 0
+    for j, row in enumerate(board):
+        masks = _ROW_MASKS.get(row)
+        if masks is None:
+            masks = _row_masks(row)
+        dark |= masks[0] << j
+        light |= masks[1] << j
+    return dark, light
+
+
+def _row_masks(row):
+    n = len(row)
+    dark = 0
+    light = 0
+    for i, square in enumerate(row):
+        if square == 1:
+            dark |= 1 << (i * n)
+        elif square == 2:
+            light |= 1 << (i * n)
+    masks = (dark, light)
+    if isinstance(row, tuple):
+        if len(_ROW_MASKS) >= ROW_CACHE_LIMIT:
+            _ROW_MASKS.clear()
+        _ROW_MASKS[row] = masks
+    return masks
+
+
+def masks_to_board(dark, light, n):
+    """
+    Return the tuple-of-tuples board for a pair of masks.
+    """
+    final = []
+    for j in range(n):
+        row = []
+        for i in range(n):
+            bit = 1 << (i * n + j)
+            if dark & bit:
+                row.append(1)
+            elif light & bit:
+                row.append(2)
+            else:
+                row.append(0)
+        final.append(tuple(row))
+    return tuple(final)
+
+
+def pack_board(board):
+    """
+    Return the packed form of a tuple-of-tuples board: one integer holding
+    the dark mask in its low n * n bits and the light mask above them.
+    Packed boards hash in constant time and take a few dozen bytes, where a
+    tuple board takes n + 1 tuples.
+    """
+    dark, light = board_to_masks(board)
+    return dark | light << (len(board) * len(board))
+
+
+def unpack_board(packed, n):
+    """
+    Return the tuple-of-tuples board of a packed n x n board.
+    """
+    size = n * n
+    return masks_to_board(packed & ((1 << size) - 1), packed >> size, n)
+
+
+def player_masks(board, player):
+    """
+    Return the (own, opponent) masks of board for player.
+    """
+    dark, light = board_to_masks(board)
+    if player == 1:
+        return dark, light
+    return light, dark
+
+
+############ MASK LEVEL FUNCTIONS ##################
+def legal_moves_mask(own, opp, n):
+    """
+    Return the mask of empty squares where the owner of own can play.
+    """
+    geo = geometry(n)
+    full = geo.full
+    empty = ~(own | opp) & full
+    moves = 0
+    steps = n - 3
+    for direction in geo.directions:
+        t = shift(own, direction, full) & opp
+        for _ in range(steps):
+            t |= shift(t, direction, full) & opp
+        moves |= shift(t, direction, full) & empty
+    return moves
+
+
+def flips_mask(own, opp, square, n):
+    """
+    Return the mask of opponent discs flipped when the owner of own plays
+    square. The result is 0 if the move is not legal.
+    """
+    geo = geometry(n)
+    full = geo.full
+    move = 1 << square
+    flips = 0
+    for direction in geo.directions:
+        line = 0
+        x = shift(move, direction, full)
+        while x & opp:
+            line |= x
+            x = shift(x, direction, full)
+        if x & own:
+            flips |= line
+    return flips
+
+
+def moves_and_flips(own, opp, n):
+    """
+    Return a list of (square, flips) pairs, one for each legal move of the
+    owner of own.
+    """
+    return [(square, flips_mask(own, opp, square, n))
+            for square in iter_squares(legal_moves_mask(own, opp, n))]
+
+
+def count_moves(own, opp, n):
+    """
+    Return the number of legal moves for the owner of own.
+    """
+    return popcount(legal_moves_mask(own, opp, n))
+
+
+############ DROP-IN FUNCTIONS #####################
+def find_lines(board, i, j, player):
+    """
+    Find all the uninterupted lines of stones that would be captured if player
+    plays column i and row j.
+    """
+    n = len(board)
+    own, opp = player_masks(board, player)
+    full = geometry(n).full
+    lines = []
+    for direction in geometry(n).directions:
+        xdir, ydir = direction[0], direction[1]
+        line = []
+        u = i + xdir
+        v = j + ydir
+        x = shift(1 << (i * n + j), direction, full)
+        while x & opp:
+            line.append((u, v))
+            u += xdir
+            v += ydir
+            x = shift(x, direction, full)
+        if x & own and line:
+            lines.append(line)
+    return lines
+
+
+def get_possible_moves(board, player):
+    """
+    Return a list of all possible (column,row) tuples that player can play on
+    the current board.
+    """
+    n = len(board)
+    own, opp = player_masks(board, player)
+    return [divmod(square, n) for square in iter_squares(legal_moves_mask(own, opp, n))]
+
+
+def get_flips(board, i, j, player):
+    """
+    Return the mask of discs that are flipped if player plays column i and
+    row j. The mask is 0 if the move is not legal.
+    """
+    n = len(board)
+    own, opp = player_masks(board, player)
+    return flips_mask(own, opp, i * n + j, n)
+
+
+def get_moves_and_flips(board, player):
+    """
+    Return a list of ((column,row), flips) pairs, one for each possible move
+    of player, in the same order as get_possible_moves. flips is the mask of
+    discs the move flips, so the move can be played with apply_move without
+    finding its lines again.
+    """
+    n = len(board)
+    own, opp = player_masks(board, player)
+    return [(divmod(square, n), flips_mask(own, opp, square, n))
+            for square in iter_squares(legal_moves_mask(own, opp, n))]
+
+
+def apply_move(board, player, i, j, flips):
+    """
+    Return the board after player plays column i and row j, given the mask
+    of discs it flips (from get_flips or get_moves_and_flips). Only the rows
+    that change are rebuilt.
+    """
+    n = len(board)
+    rows = {}
+    for square in iter_squares(flips | (1 << (i * n + j))):
+        u, v = divmod(square, n)
+        row = rows.get(v)
+        if row is None:
+            row = rows[v] = list(board[v])
+        row[u] = player
+    final = list(board)
+    for v, row in rows.items():
+        final[v] = tuple(row)
+    return tuple(final)
+
+
+def flips_to_mask(flips, n):
+    """
+    Flip sets of this backend already are masks.
+    """
+    return flips
+
+
+def play_move(board, player, i, j):
+    """
+    Return the board after player plays column i and row j.
+    """
+    return apply_move(board, player, i, j, get_flips(board, i, j, player))
+
+
+def get_score(board):
+    dark, light = board_to_masks(board)
+    return popcount(dark), popcount(light)
@@ -7,9 +7,19 @@ players.
 Thanks to original author Daniel Bauer, Columbia University
 """
 import sys
+import queue
 import subprocess
+import threading
+import time
 from threading import Timer
-from othello_shared import find_lines, get_possible_moves, play_move, get_score
+import othello_shared
+import othello_bitboard
+import othello_protocol
+
+# Move generation backends that the game manager (and agents) can choose from.
+# Both modules provide find_lines, get_possible_moves, play_move, get_score,
+# get_flips, get_moves_and_flips and apply_move with the same signatures.
+BACKENDS = {"tuple": othello_shared, "bitboard": othello_bitboard}
 
 class InvalidMoveError(RuntimeError):
     pass
@@ -27,26 +37,42 @@ class Player(object):
     def get_move(self, manager):
         pass  
 
+def handshake(color, limit, minimax, caching, ordering, options, protocol):
+    """
+    Return the handshake line (without newline) that starts a game for an
+    AI: its color, depth limit and search flags, then the options.
+    """
+    #convert params to numbers 
+    m = 1 if minimax == True else 0
+    c = 1 if caching == True else 0
+    o = 1 if ordering == True else 0
+    options = dict(options or {})
+    if protocol != othello_protocol.TEXT:
+        options[othello_protocol.CAPABILITY] = protocol
+    # Extra options are appended to the handshake as key=value fields.
+    # AIs that only read the first five fields simply ignore them.
+    extra = ""
+    if options:
+        extra = "".join(",{}={}".format(key, value) for key, value in options.items())
+    return str(color) + "," + str(limit) + "," + str(m) + "," + str(c) + "," + str(o) + extra
+
 class AiPlayerInterface(Player):
 
     TIMEOUT = 10 
+    FINAL_TIMEOUT = 5 # seconds an AI has to exit after the FINAL line
 
-    def __init__(self, filename, color, limit, minimax = False, caching = False, ordering = False):
+    def __init__(self, filename, color, limit, minimax = False, caching = False, ordering = False, options = None, verbose = True):
         
-        #convert params to numbers 
-        m = 0 
-        if minimax == True: m = 1
-        c = 0 
-        if caching == True: c = 1
-        o = 0 
-        if ordering == True: o = 1
-
         self.color = color
+        self.verbose = verbose
         self.process = subprocess.Popen(['python3',filename], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-        name = self.process.stdout.readline().decode("ASCII").strip()
-        print("AI introduced itself as: {}".format(name))
+        name, protocols = othello_protocol.parse_introduction(self.process.stdout.readline().decode("ASCII"))
+        if verbose: print("AI introduced itself as: {}".format(name))
         self.name = name
-        self.process.stdin.write((str(color) + "," + str(limit) + "," + str(m) + "," + str(c) + "," + str(o) + "\n").encode("ASCII"))
+        # Boards are sent in the most compact encoding the AI advertised
+        # (see othello_protocol); the choice is confirmed in the handshake.
+        self.protocol = othello_protocol.negotiate(protocols)
+        self.process.stdin.write((handshake(color, limit, minimax, caching, ordering, options, self.protocol) + "\n").encode("ASCII"))
         self.process.stdin.flush()
 
     def timeout(self): 
@@ -55,11 +81,11 @@ class AiPlayerInterface(Player):
         self.timed_out = True
 
     def get_move(self, manager):
-        white_score, dark_score = get_score(manager.board)
-        print((white_score, dark_score))
+        white_score, dark_score = manager.get_score()
+        if self.verbose: print((white_score, dark_score))
         self.process.stdin.write("SCORE {} {}\n".format(white_score, dark_score).encode("ASCII"))
         self.process.stdin.flush()
-        self.process.stdin.write("{}\n".format(str(manager.board)).encode("ASCII"))
+        self.process.stdin.write("{}\n".format(othello_protocol.encode_board(manager.board, self.protocol)).encode("ASCII"))
         self.process.stdin.flush()
 
         timer = Timer(AiPlayerInterface.TIMEOUT, lambda: self.timeout())
@@ -77,18 +103,192 @@ class AiPlayerInterface(Player):
         return i,j 
     
     def kill(self,manager):
-        white_score, dark_score = get_score(manager.board)
-        self.process.stdin.write("FINAL {} {}\n".format(white_score, dark_score).encode("ASCII"))
+        white_score, dark_score = manager.get_score()
+        try:
+            self.process.stdin.write("FINAL {} {}\n".format(white_score, dark_score).encode("ASCII"))
+            self.process.stdin.close()
+            # The AI may save what it learned (e.g. agent.py's analysis cache) before it exits.
+            self.process.wait(AiPlayerInterface.FINAL_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired): # the AI is already gone or does not exit
+            pass
         self.process.kill() 
+        self.process.wait()
+
+
+class AiServer(object):
+    """
+    One agent process started in server mode (python3 <filename> --server)
+    that plays any number of games, one after the other or at the same time,
+    so that the interpreter start, the imports and the agent's tables are
+    paid once. Lines to and from the process carry the id of their game
+    (see othello_protocol.server_line); a reader thread hands every reply to
+    the game it belongs to. Players of its games are ServerPlayerInterface
+    objects.
+    The server answers the requests of all its games one at a time, in the
+    order they were sent, so the time limit of a request starts when the
+    server gets to it (when the reply to the request before it arrives),
+    not when it is sent: a game does not lose its time waiting for the
+    moves of the others.
+    """
+
+    def __init__(self, filename, verbose = True):
+        self.process = subprocess.Popen(['python3', filename, '--server'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.name, fields = othello_protocol.capabilities(self.process.stdout.readline().decode("ASCII"))
+        if fields.get(othello_protocol.SERVER) != "1":
+            self.process.kill()
+            self.process.wait()
+            raise RuntimeError("{} has no server mode".format(filename))
+        if verbose: print("AI server introduced itself as: {}".format(self.name))
+        self.verbose = verbose
+        self.protocol = othello_protocol.negotiate(fields.get(othello_protocol.CAPABILITY, "").split("+"))
+        self.lock = threading.Lock()
+        self.replies = {} # game id -> queue of the replies of the game
+        self.requests = [] # [game id, time the server started it or None] of the unanswered requests, in order
+        self.games = 0
+        self.reader = threading.Thread(target=self.read, daemon=True)
+        self.reader.start()
+
+    def read(self):
+        for line in self.process.stdout:
+            try:
+                game_id, message = othello_protocol.parse_server_line(line.decode("ASCII"))
+            except (UnicodeDecodeError, ValueError): # not a reply, e.g. a stray print of the agent
+                if self.verbose: print("AI server sent a line of no game: {!r}".format(line))
+                continue
+            with self.lock:
+                for index, request in enumerate(self.requests):
+                    if request[0] == game_id:
+                        del self.requests[index]
+                        if request[1] is None: # answered out of order
+                            request[1] = time.monotonic()
+                        break
+                if self.requests and self.requests[0][1] is None:
+                    self.requests[0][1] = time.monotonic()
+            replies = self.replies.get(game_id)
+            if replies is not None: # replies of abandoned games are dropped
+                replies.put(message)
+        for replies in list(self.replies.values()): # the process is gone
+            replies.put(None)
+
+    def send(self, game_id, message):
+        with self.lock:
+            self.process.stdin.write((othello_protocol.server_line(game_id, message) + "\n").encode("ASCII"))
+            self.process.stdin.flush()
+
+    def request(self, game_id, message):
+        """
+        Send message, which the server answers, for the given game. Returns
+        the request, to pass to time_left.
+        """
+        with self.lock:
+            request = [game_id, None if self.requests else time.monotonic()]
+            self.requests.append(request)
+        self.send(game_id, message)
+        return request
+
+    def time_left(self, request):
+        """
+        Return the seconds left to answer request: the TIMEOUT of
+        AiPlayerInterface from the moment the server started it or, while
+        it waits for the requests before it, the time left to the one the
+        server is on.
+        """
+        with self.lock:
+            current = self.requests[0] if self.requests else request
+        return current[1] + AiPlayerInterface.TIMEOUT - time.monotonic()
+
+    def new_game(self, handshake_line):
+        """
+        Start a game with the given handshake line. Returns its id.
+        """
+        with self.lock:
+            self.games += 1
+            game_id = self.games
+            self.replies[game_id] = queue.Queue()
+        self.send(game_id, "NEW " + handshake_line)
+        return game_id
+
+    def end_game(self, game_id, message):
+        self.replies.pop(game_id, None)
+        try:
+            self.send(game_id, message)
+        except OSError: # the server is gone
+            pass
+
+    def close(self):
+        """
+        Let the server finish (e.g. merge its analysis cache) and stop it.
+        """
+        try:
+            self.process.stdin.close()
+            self.process.wait(AiPlayerInterface.FINAL_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        self.process.kill()
+        self.process.wait()
+
+
+class ServerPlayerInterface(Player):
+    """
+    A player whose moves come from a game of an AiServer. It is used like
+    AiPlayerInterface; kill() only ends its game, not the server.
+    """
+
+    def __init__(self, server, color, limit, minimax = False, caching = False, ordering = False, options = None, verbose = True):
+        self.server = server
+        self.color = color
+        self.verbose = verbose
+        self.name = server.name
+        self.protocol = server.protocol
+        self.game_id = server.new_game(handshake(color, limit, minimax, caching, ordering, options, self.protocol))
+
+    def get_move(self, manager):
+        dark_score, light_score = manager.get_score()
+        if self.verbose: print((dark_score, light_score))
+        replies = self.server.replies.get(self.game_id)
+        move_s = None
+        try:
+            request = self.server.request(self.game_id, "SCORE {} {} {}".format(
+                dark_score, light_score, othello_protocol.encode_board(manager.board, self.protocol)))
+            while True:
+                timeout = self.server.time_left(request)
+                if timeout <= 0: # the server is too slow
+                    break
+                try:
+                    move_s = replies.get(timeout=timeout)
+                    break
+                except queue.Empty: # the server may have only now got to the request
+                    pass
+        except OSError: # the server is gone
+            pass
+        if move_s is None:
+            raise AiTimeoutError
+        i_s, j_s = move_s.strip().split()
+        return int(i_s), int(j_s)
+
+    def kill(self, manager):
+        dark_score, light_score = manager.get_score()
+        self.server.end_game(self.game_id, "FINAL {} {}".format(dark_score, light_score))
 
 
 class OthelloGameManager(object):
+    """
+    Keeps the board and, updated once per move, the game state derived from
+    it: the disc counts (scores[1] dark, scores[2] light), the legal moves
+    of the side to move with the discs each one flips (moves, from the
+    backend's get_moves_and_flips) and whether the game is over (terminal:
+    the side to move has no move). Nothing is rescanned to validate a move,
+    count the discs or list the moves.
+    """
 
-    def __init__(self, dimension = 6):
+    def __init__(self, dimension = 6, backend = "tuple"):
 
         self.dimension = dimension
+        self.backend = BACKENDS[backend]
         self.board = self.create_initial_board()
         self.current_player = 1
+        self.scores = [None, 2, 2]
+        self.update_moves()
             
     def create_initial_board(self):
         board = []
@@ -113,43 +313,85 @@ class OthelloGameManager(object):
         for row in self.board: 
             print(" ".join([str(x) for x in row]))
                    
+    def update_moves(self):
+        """
+        Find the moves of the side to move and the discs each one flips.
+        """
+        self.moves = dict(self.backend.get_moves_and_flips(self.board, self.current_player))
+        self.terminal = not self.moves
+
     def play(self, i,j):
-        if self.board[j][i] != 0:
-           raise InvalidMoveError("Occupied square.")
-        lines = find_lines(self.board, i,j, self.current_player)
-        if not lines:  
+        flips = self.moves.get((i, j))
+        if flips is None:
+           if not (0 <= i < self.dimension and 0 <= j < self.dimension) or self.board[j][i] != 0:
+               raise InvalidMoveError("Occupied square.")
            raise InvalidMoveError("Invalid Move.")
-     
-        self.board = play_move(self.board, self.current_player, i, j) 
-        self.current_player = 1 if self.current_player == 2 else 2
+
+        player = self.current_player
+        flipped = len(flips) if isinstance(flips, list) else othello_bitboard.popcount(flips)
+        self.board = self.backend.apply_move(self.board, player, i, j, flips)
+        self.scores[player] += flipped + 1
+        self.scores[3 - player] -= flipped
+        self.current_player = 1 if player == 2 else 2
+        self.update_moves()
 
     def get_possible_moves(self):
-        return get_possible_moves(self.board, self.current_player)
+        return list(self.moves)
+
+    def get_score(self):
+        """
+        Return the disc counts (dark, light), as get_score(board) does.
+        """
+        return self.scores[1], self.scores[2]
 
-def play_game(game, player1, player2):
+def play_game(game, player1, player2, verbose = True):
+    """
+    Play game to the end between player1 (dark) and player2 (light) and
+    return a record of the result: the final scores, the winner (1 or 2, 0
+    for a draw), the player that forfeited by timing out or playing an
+    invalid move (None if nobody did), the moves played and, for each
+    player, the seconds it took to answer each move.
+    """
 
     players = [None, player1, player2]
+    result = {"dark": player1.name, "light": player2.name, "moves": [],
+              "latencies": {1: [], 2: []}, "forfeit": None, "reason": None}
 
     while True: 
         player_obj = players[game.current_player]
-        possible_moves = game.get_possible_moves() 
-        if not possible_moves: 
-            p1score, p2score = get_score(game.board)
-            print("FINAL: {} (dark) {}:{} {} (light)".format(player1.name, p1score, p2score, player2.name))
+        if game.terminal: 
+            p1score, p2score = game.get_score()
+            if verbose: print("FINAL: {} (dark) {}:{} {} (light)".format(player1.name, p1score, p2score, player2.name))
             player1.kill(game)
             player2.kill(game)
             break 
         else: 
             color = "dark" if game.current_player == 1 else "light"
             try: 
+                started = time.perf_counter()
                 i, j = player_obj.get_move(game)
-                print("{} ({}) plays {},{}".format(player_obj.name, color, i,j))
+                result["latencies"][game.current_player].append(time.perf_counter() - started)
+                if verbose: print("{} ({}) plays {},{}".format(player_obj.name, color, i,j))
                 game.play(i,j)
-            except AiTimeoutError:
-                print("{} ({}) timed out!".format(player_obj.name, color))
-                print("FINAL: {} (dark) {}:{} {} (light)".format(player_obj.name, p1score, p2score, player2.name))
+                result["moves"].append((i, j))
+            except (AiTimeoutError, InvalidMoveError, ValueError) as error:
+                p1score, p2score = game.get_score()
+                result["forfeit"] = game.current_player
+                result["reason"] = "timeout" if isinstance(error, AiTimeoutError) else "invalid move"
+                if verbose:
+                    print("{} ({}) {}!".format(player_obj.name, color,
+                          "timed out" if result["reason"] == "timeout" else "played an invalid move"))
+                    print("FINAL: {} (dark) {}:{} {} (light)".format(player1.name, p1score, p2score, player2.name))
                 player1.kill(game)
                 player2.kill(game)
                 break
 
+    result["dark_score"] = p1score
+    result["light_score"] = p2score
+    if result["forfeit"] is not None:
+        result["winner"] = 3 - result["forfeit"]
+    else:
+        result["winner"] = 1 if p1score > p2score else 2 if p2score > p1score else 0
+    return result
+
 
@@ -11,7 +11,6 @@ from tkinter import *
 from tkinter import scrolledtext
 
 from othello_game import OthelloGameManager, AiPlayerInterface, Player, InvalidMoveError, AiTimeoutError
-from othello_shared import get_possible_moves, get_score
 
 class OthelloGui(object):
 
@@ -53,7 +52,7 @@ class OthelloGui(object):
             self.log("{}: {},{}".format(player, i,j))
             self.game.play(i, j)
             self.draw_board()
-            if not get_possible_moves(self.game.board, self.game.current_player):
+            if self.game.terminal:
                 self.shutdown("Game Over")
             elif isinstance(self.players[self.game.current_player], AiPlayerInterface):
                 self.root.unbind("<Button-1>")
@@ -78,7 +77,7 @@ class OthelloGui(object):
             self.log("{}: {},{}".format(player, i,j))
             self.game.play(i,j)
             self.draw_board()
-            if not get_possible_moves(self.game.board, self.game.current_player):
+            if self.game.terminal:
                 self.shutdown("Game Over")
             elif isinstance(self.players[self.game.current_player], AiPlayerInterface):
                 self.root.after(1, lambda: self.ai_move())
@@ -100,7 +99,7 @@ class OthelloGui(object):
         self.draw_disks()
         player = "Dark" if self.game.current_player == 1 else "Light"
         self.move_label["text"]= player
-        self.score_label["text"]= "Dark {} : {} Light".format(*get_score(self.game.board)) 
+        self.score_label["text"]= "Dark {} : {} Light".format(*self.game.get_score()) 
    
     def log(self, msg, newline = True): 
         self.text.insert("end","{}{}".format(msg, "\n" if newline else ""))
@@ -134,15 +133,21 @@ def main(argv):
     minimax = False        
     agent1 = None
     agent2 = None
+    backend = "tuple"
+    time_limit = None
+    ponder = False
+    workers = 1
+    stats = None
+    probcut = None
 
     try:
-        opts, args = getopt.getopt(argv,"hcmol:d:a:b:",["limit=","dimension=","agent1=","agent2="])
+        opts, args = getopt.getopt(argv,"hcmol:d:a:b:t:",["limit=","dimension=","agent1=","agent2=","backend=","time=","ponder","workers=","stats=","probcut="])
     except getopt.GetoptError:
-        print('othello_gui.py -d <dimension> [-a <agentA> -b <agentB> -l <depth-limit> -c -o -m]')
+        print('othello_gui.py -d <dimension> [-a <agentA> -b <agentB> -l <depth-limit> -c -o -m -t <seconds> --backend <tuple|bitboard> --ponder --workers <processes> --stats <1|file> --probcut <1|file>]')
         sys.exit(2)
     for opt, arg in opts:
         if opt == '-h':
-            print('othello_gui.py -d <dimension> -a <agentA> [-b <agentB> -l <depth-limit> -c -o]')
+            print('othello_gui.py -d <dimension> -a <agentA> [-b <agentB> -l <depth-limit> -c -o -t <seconds> --backend <tuple|bitboard> --ponder --workers <processes> --stats <1|file> --probcut <1|file>]')
             sys.exit()
         elif opt in ("-d", "--dimension"):
             size = int(arg)
@@ -158,23 +163,47 @@ def main(argv):
             ordering = True   
         elif opt in ("-l", "--limit"):
             limit = int(arg)  
+        elif opt == "--backend":
+            backend = arg
+        elif opt in ("-t", "--time"):
+            time_limit = float(arg)
+        elif opt == "--ponder":
+            ponder = True
+        elif opt == "--workers":
+            workers = int(arg)
+        elif opt == "--stats":
+            stats = arg
+        elif opt == "--probcut":
+            probcut = arg
 
     if size <= 0: #if no dimension provided
         print('Please provide a board size.')
         print('othello_gui.py -d <dimension> [-a <agentA> -b <agentB> -l <depth-limit> -c -o]')
         sys.exit(2)  
 
+    options = {"backend": backend}
+    if time_limit:
+        options["time"] = time_limit
+    if ponder:
+        options["ponder"] = 1
+    if workers > 1:
+        options["workers"] = workers
+    if stats:
+        options["stats"] = stats
+    if probcut:
+        options["probcut"] = probcut
+
     if agent1 != None and agent2 != None and size > 0:
-        p1 = AiPlayerInterface(agent1,1,limit,minimax,caching,ordering)
-        p2 = AiPlayerInterface(agent2,2,limit,minimax,caching,ordering)        
+        p1 = AiPlayerInterface(agent1,1,limit,minimax,caching,ordering,options)
+        p2 = AiPlayerInterface(agent2,2,limit,minimax,caching,ordering,options)        
     elif agent1 != None and size > 0:
         p1 = Player(1)
-        p2 = AiPlayerInterface(agent1,2,limit,minimax,caching,ordering)
+        p2 = AiPlayerInterface(agent1,2,limit,minimax,caching,ordering,options)
     else: 
         p1 = Player(1)
         p2 = Player(2)
         
-    game = OthelloGameManager(size)
+    game = OthelloGameManager(size, backend)
     gui = OthelloGui(game, p1, p2) 
     gui.run()
 
@@ -0,0 +1,136 @@
+"""
+Board encodings for the pipe between the game manager and the AIs.
+
+By default the manager sends every board as the text of the Python tuple
+(str(board)), which the AI parses back. Both sides can agree on a compact
+encoding instead:
+
+    1. The AI advertises the encodings it can read on its name line, after
+       a semicolon: "Othello AI;proto=hex".
+    2. The manager picks one and confirms it in the handshake line as the
+       extra field "proto=hex". Managers that know nothing about this show
+       the whole name line and never confirm, and AIs that advertise nothing
+       are never sent anything but text.
+
+An agent started with --server advertises "server=1" as well and plays many
+games over one pair of pipes: every line then starts with the id of the
+game it belongs to (see server_line).
+
+In the "hex" encoding a board is one line made of a fixed-size header (the
+board size as two hex digits) followed by the dark and light bitmasks of
+othello_bitboard, each as a fixed number of hex digits: 34 characters for
+an 8x8 board instead of about 200, decoded with two int() calls.
+"""
+
+from othello_bitboard import board_to_masks, masks_to_board
+
+TEXT = "text"
+HEX = "hex"
+PROTOCOLS = (HEX, TEXT) # in order of preference
+CAPABILITY = "proto"
+SERVER = "server" # capability of an agent server (see othello_game.AiServer)
+
+_DELETE = str.maketrans("", "", "()[], ")
+
+
+def advertise(name, protocols=(HEX,), server=False):
+    """
+    Return the name line of an AI that can read the given encodings (and,
+    with server, of an agent server that plays many games at once).
+    """
+    line = "{};{}={}".format(name, CAPABILITY, "+".join(protocols))
+    if server:
+        line += ";{}=1".format(SERVER)
+    return line
+
+
+def capabilities(line):
+    """
+    Return the name of a name line and its capabilities as a dict.
+    """
+    name, _, fields = line.partition(";")
+    result = {}
+    for field in fields.split(";"):
+        key, _, value = field.partition("=")
+        if key.strip():
+            result[key.strip()] = value.strip()
+    return name.strip(), result
+
+
+def parse_introduction(line):
+    """
+    Split a name line into (name, list of advertised encodings).
+    """
+    name, fields = capabilities(line)
+    protocols = fields[CAPABILITY].split("+") if CAPABILITY in fields else []
+    return name, protocols
+
+
+def server_line(game_id, message):
+    """
+    Return a line between the manager and an agent server: the id of the
+    game it belongs to, then the message (the lines of the ordinary protocol,
+    with the board on the SCORE line, or the move).
+    """
+    return "{} {}".format(game_id, message)
+
+
+def parse_server_line(line):
+    """
+    Split a line of the agent server protocol into (game id, message).
+    """
+    game_id, _, message = line.strip().partition(" ")
+    return int(game_id), message
+
+
+def negotiate(protocols):
+    """
+    Return the preferred encoding among the advertised ones (text if none).
+    """
+    for protocol in PROTOCOLS:
+        if protocol in protocols:
+            return protocol
+    return TEXT
+
+
+def hex_digits(n):
+    return (n * n + 3) // 4
+
+
+def encode_board(board, protocol=TEXT):
+    """
+    Return the line (without newline) that sends board in the encoding.
+    """
+    if protocol == HEX:
+        n = len(board)
+        dark, light = board_to_masks(board)
+        width = hex_digits(n)
+        return "{:02x}{:0{w}x}{:0{w}x}".format(n, dark, light, w=width)
+    return str(board)
+
+
+def decode_board(line, protocol=TEXT):
+    """
+    Return the tuple-of-tuples board sent as line in the encoding.
+    """
+    line = line.strip()
+    if protocol == HEX:
+        n = int(line[:2], 16)
+        width = hex_digits(n)
+        dark = int(line[2:2 + width], 16)
+        light = int(line[2 + width:2 + 2 * width], 16)
+        return masks_to_board(dark, light, n)
+    return parse_text_board(line)
+
+
+def parse_text_board(line):
+    """
+    Parse the text of a board (a tuple or list of rows of 0, 1 and 2) without
+    evaluating it as Python code.
+    """
+    cells = line.translate(_DELETE)
+    n = int(len(cells) ** 0.5 + 0.5)
+    if n * n != len(cells) or cells.strip("012"):
+        raise ValueError("Not a board: {}".format(line))
+    values = [int(cell) for cell in cells]
+    return tuple(tuple(values[row * n:(row + 1) * n]) for row in range(n))
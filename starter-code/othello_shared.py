@@ -50,20 +50,60 @@ def get_possible_moves(board, player):
                     result.append((i,j))
     return result
 
-def play_move(board, player, i, j):
-    new_board = []
-    for row in board: 
-        new_board.append(list(row[:]))
-    lines = find_lines(board, i,j, player)
-    new_board[j][i] = player
-    for line in lines: 
-        for u,v in line: 
-           new_board[v][u] = player 
-    final = []
-    for row in new_board: 
-        final.append(tuple(row))
+def get_flips(board, i, j, player):
+    """
+    Return the list of (column,row) squares that are flipped if player plays
+    column i and row j. The list is empty if the move is not legal.
+    """
+    return [square for line in find_lines(board, i, j, player) for square in line]
+
+def get_moves_and_flips(board, player):
+    """
+    Return a list of ((column,row), flips) pairs, one for each possible move
+    of player, in the same order as get_possible_moves. flips is the list of
+    squares the move flips, so the move can be played with apply_move without
+    finding its lines again.
+    """
+    result = []
+    for i in range(len(board)):
+        for j in range(len(board)):
+            if board[j][i] == 0:
+                flips = get_flips(board, i, j, player)
+                if flips:
+                    result.append(((i,j), flips))
+    return result
+
+def apply_move(board, player, i, j, flips):
+    """
+    Return the board after player plays column i and row j, given the squares
+    it flips (from get_flips or get_moves_and_flips). Only the rows that
+    change are rebuilt.
+    """
+    rows = {j: list(board[j])}
+    rows[j][i] = player
+    for u,v in flips: 
+        row = rows.get(v)
+        if row is None:
+            row = rows[v] = list(board[v])
+        row[u] = player 
+    final = list(board)
+    for v, row in rows.items():
+        final[v] = tuple(row)
     return tuple(final) 
 
+def flips_to_mask(flips, n):
+    """
+    Return the flipped squares as a bitmask in the layout of othello_bitboard
+    (square (u,v) is bit u * n + v).
+    """
+    mask = 0
+    for u,v in flips:
+        mask |= 1 << (u * n + v)
+    return mask
+
+def play_move(board, player, i, j):
+    return apply_move(board, player, i, j, get_flips(board, i, j, player))
+
 def get_score(board):
     p1_count = 0
     p2_count = 0
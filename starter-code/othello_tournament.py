@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Headless tournament between two AIs, built on othello_game.play_game.
+
+Games are played in pairs: both games of a pair start from the same
+position, with the colours swapped, so that neither AI profits from a
+better opening or from moving first. The starting position is the initial
+board followed by a number of random opening plies (seeded, so the same
+command plays the same openings). Games run in parallel in a process pool;
+each one starts its own two AI processes, unless the AIs are played in
+server mode (--server-a, --server-b): then every pool process starts one
+agent server per AI (see othello_game.AiServer) and plays all its games
+with it.
+
+Results are written as JSON: one record per game (from play_game, with the
+board size, the opening and which AI played dark) and a summary per board
+size from the point of view of AI A: wins, draws, losses, mean disc
+margin, forfeits by timeout or invalid move and per-move latency
+percentiles for both AIs, plus the number of games played per second.
+A game that could not be played (e.g. an AI that dies during the
+handshake) is recorded with its error and winner None, and only counted as
+an error: it is left out of the results and the margin.
+
+Example: 200 games on 6x6 and 8x8 with 4 random opening plies, 8 at a time:
+    python3 othello_tournament.py -a ../agent.py -b randy_ai.py -d 6,8 -g 200 -r 4 -j 8 -l 4 -c -o
+"""
+
+import getopt
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+from othello_game import AiPlayerInterface, AiServer, OthelloGameManager, ServerPlayerInterface, play_game
+
+PERCENTILES = (50, 90, 99)
+
+_SERVERS = {} # label of an AI played in server mode -> its AiServer in this pool process
+
+
+def random_opening(size, plies, seed):
+    """
+    Return a list of up to plies random legal moves from the initial board
+    (fewer if the game would end).
+    """
+    rng = random.Random(seed)
+    game = OthelloGameManager(size)
+    moves = []
+    for _ in range(plies):
+        possible_moves = game.get_possible_moves()
+        if not possible_moves:
+            break
+        move = rng.choice(possible_moves)
+        game.play(move[0], move[1])
+        moves.append(move)
+    return moves
+
+
+def agent_server(spec):
+    """
+    Return the AiServer of this pool process for the AI spec, started on
+    first use. It lives as long as the process and ends when its pipes
+    close.
+    """
+    server = _SERVERS.get(spec["label"])
+    if server is None:
+        server = _SERVERS[spec["label"]] = AiServer(spec["file"], verbose=False)
+    return server
+
+
+def play_match(task):
+    """
+    Play one game of the tournament (run in a pool process). task is a tuple
+    (game number, size, opening moves, AI for dark, AI for light), each AI a
+    dict with its label, file and search settings.
+    """
+    number, size, opening, dark, light = task
+    game = OthelloGameManager(size, dark["options"].get("backend", "tuple"))
+    for i, j in opening:
+        game.play(i, j)
+    players = []
+    try:
+        for color, spec in ((1, dark), (2, light)):
+            if spec.get("server"):
+                players.append(ServerPlayerInterface(agent_server(spec), color, spec["limit"], spec["minimax"],
+                                                     spec["caching"], spec["ordering"], spec["options"],
+                                                     verbose=False))
+            else:
+                players.append(AiPlayerInterface(spec["file"], color, spec["limit"], spec["minimax"],
+                                                 spec["caching"], spec["ordering"], spec["options"], verbose=False))
+        result = play_game(game, players[0], players[1], verbose=False)
+    except Exception as error: # an AI that fails to start must not stop the tournament
+        for player in players:
+            if isinstance(player, ServerPlayerInterface):
+                player.kill(game)
+            else:
+                player.process.kill()
+                player.process.wait()
+        p1score, p2score = game.get_score()
+        result = {"dark": dark["file"], "light": light["file"], "moves": [],
+                  "latencies": {1: [], 2: []}, "forfeit": None, "reason": "error: {}".format(error),
+                  "error": str(error), "dark_score": p1score, "light_score": p2score, "winner": None}
+    result.update(game=number, size=size, opening=opening, dark_label=dark["label"], light_label=light["label"])
+    return result
+
+
+def percentile(values, p):
+    """
+    Return the p-th percentile of values (nearest rank), or None if empty.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(round(p / 100.0 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize(results, seconds):
+    """
+    Summarize the results of AI A (label "A") against AI B by board size.
+    """
+    summary = {}
+    for size in sorted(set(result["size"] for result in results)):
+        games = [result for result in results if result["size"] == size]
+        stats = {"games": len(games), "wins": 0, "draws": 0, "losses": 0, "errors": 0, "margin": 0.0,
+                 "forfeits": {"A": 0, "B": 0}, "timeouts": {"A": 0, "B": 0}, "latency": {}}
+        latencies = {"A": [], "B": []}
+        for result in games:
+            if result.get("error") is not None: # not played: neither a result nor a margin
+                stats["errors"] += 1
+                continue
+            a_color = 1 if result["dark_label"] == "A" else 2
+            scores = (result["dark_score"], result["light_score"])
+            stats["margin"] += scores[a_color - 1] - scores[2 - a_color]
+            if result["winner"] == 0:
+                stats["draws"] += 1
+            elif result["winner"] == a_color:
+                stats["wins"] += 1
+            else:
+                stats["losses"] += 1
+            if result["forfeit"] is not None:
+                label = "A" if result["forfeit"] == a_color else "B"
+                stats["forfeits"][label] += 1
+                if result["reason"] == "timeout":
+                    stats["timeouts"][label] += 1
+            latencies["A"].extend(result["latencies"][a_color])
+            latencies["B"].extend(result["latencies"][3 - a_color])
+        stats["margin"] /= max(len(games) - stats["errors"], 1)
+        for label, values in latencies.items():
+            stats["latency"][label] = {"p{}".format(p): percentile(values, p) for p in PERCENTILES}
+            stats["latency"][label]["max"] = max(values) if values else None
+        summary[size] = stats
+    return {"by_size": summary, "games": len(results), "seconds": seconds,
+            "games_per_second": len(results) / seconds if seconds > 0 else None}
+
+
+def run_tournament(agent_a, agent_b, sizes, games, plies=0, jobs=None, seed=0, log=print):
+    """
+    Play games games per board size between agent_a and agent_b (dicts as
+    in play_match, without the label), alternating colours, and return
+    (results, summary).
+    """
+    agent_a = dict(agent_a, label="A")
+    agent_b = dict(agent_b, label="B")
+    tasks = []
+    for size in sizes:
+        for number in range(games):
+            pair = number // 2
+            opening = random_opening(size, plies, "{}-{}-{}".format(seed, size, pair))
+            if number % 2 == 0:
+                tasks.append((len(tasks), size, opening, agent_a, agent_b))
+            else:
+                tasks.append((len(tasks), size, opening, agent_b, agent_a))
+    results = []
+    started = time.perf_counter()
+    with multiprocessing.Pool(jobs) as pool:
+        for result in pool.imap_unordered(play_match, tasks):
+            results.append(result)
+            if len(results) % max(len(tasks) // 20, 1) == 0 or len(results) == len(tasks):
+                elapsed = time.perf_counter() - started
+                log("{}/{} games, {:.2f} games/s".format(len(results), len(tasks), len(results) / elapsed))
+    results.sort(key=lambda result: result["game"])
+    return results, summarize(results, time.perf_counter() - started)
+
+
+def parse_agent_options(text):
+    """
+    Parse "key=value,key=value" into the handshake options of an AI.
+    """
+    options = {}
+    for field in text.split(","):
+        if "=" in field:
+            key, value = field.split("=", 1)
+            options[key.strip()] = value.strip()
+    return options
+
+
+def main(argv):
+    agent_a = None
+    agent_b = None
+    sizes = [6]
+    games = 10
+    plies = 0
+    jobs = None
+    seed = 0
+    output = "tournament.json"
+    limit = -1
+    minimax = False
+    caching = False
+    ordering = False
+    options = {"A": {}, "B": {}}
+    servers = {"A": False, "B": False}
+    usage = ("othello_tournament.py -a <agentA> -b <agentB> [-d <sizes> -g <games per size> -r <opening plies> "
+             "-j <processes> -s <seed> -f <results file> -l <depth-limit> -c -o -m "
+             "--options-a <key=value,...> --options-b <key=value,...> --server-a --server-b]")
+    try:
+        opts, args = getopt.getopt(argv, "ha:b:d:g:r:j:s:f:l:cmo",
+                                   ["agentA=", "agentB=", "dimensions=", "games=", "random-plies=", "jobs=",
+                                    "seed=", "file=", "limit=", "caching", "minimax", "ordering",
+                                    "options-a=", "options-b=", "server-a", "server-b"])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            print(usage)
+            sys.exit()
+        elif opt in ("-a", "--agentA"):
+            agent_a = arg
+        elif opt in ("-b", "--agentB"):
+            agent_b = arg
+        elif opt in ("-d", "--dimensions"):
+            sizes = [int(size) for size in arg.split(",")]
+        elif opt in ("-g", "--games"):
+            games = int(arg)
+        elif opt in ("-r", "--random-plies"):
+            plies = int(arg)
+        elif opt in ("-j", "--jobs"):
+            jobs = int(arg)
+        elif opt in ("-s", "--seed"):
+            seed = int(arg)
+        elif opt in ("-f", "--file"):
+            output = arg
+        elif opt in ("-l", "--limit"):
+            limit = int(arg)
+        elif opt in ("-c", "--caching"):
+            caching = True
+        elif opt in ("-m", "--minimax"):
+            minimax = True
+        elif opt in ("-o", "--ordering"):
+            ordering = True
+        elif opt == "--options-a":
+            options["A"] = parse_agent_options(arg)
+        elif opt == "--options-b":
+            options["B"] = parse_agent_options(arg)
+        elif opt == "--server-a":
+            servers["A"] = True
+        elif opt == "--server-b":
+            servers["B"] = True
+    if agent_a is None or agent_b is None:
+        print(usage)
+        sys.exit(2)
+
+    settings = {"limit": limit, "minimax": minimax, "caching": caching, "ordering": ordering}
+    spec_a = dict(settings, file=agent_a, options=options["A"], server=servers["A"])
+    spec_b = dict(settings, file=agent_b, options=options["B"], server=servers["B"])
+    results, summary = run_tournament(spec_a, spec_b, sizes, games, plies, jobs, seed)
+    with open(output, "w") as f:
+        json.dump({"agents": {"A": spec_a, "B": spec_b}, "summary": summary, "results": results}, f, indent=1)
+    for size, stats in summary["by_size"].items():
+        print("{0}x{0}: A {1} wins, {2} draws, {3} losses, margin {4:+.1f}, timeouts A {5} B {6}, errors {7}".format(
+            size, stats["wins"], stats["draws"], stats["losses"], stats["margin"],
+            stats["timeouts"]["A"], stats["timeouts"]["B"], stats["errors"]))
+    print("{} games in {:.1f}s ({:.2f} games/s), results in {}".format(
+        summary["games"], summary["seconds"], summary["games_per_second"] or 0, output))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -14,6 +14,7 @@ import time
 
 # You can also use the functions in othello_shared to write your AI 
 from othello_shared import find_lines, get_possible_moves
+from othello_protocol import CAPABILITY, TEXT, advertise, decode_board
 
 def select_move(board, color):
     """
@@ -38,7 +39,7 @@ def run_ai():
     Then it repeatedly receives the current score and current board state
     until the game is over. 
     """
-    print("Randy") # First line is the name of this AI  
+    print(advertise("Randy")) # First line is the name of this AI (and the board encodings it reads)
 
     arguments = input().split(",")
     color = int(arguments[0]) # We read the color: 1 for dark (goes first), 2 for light. 
@@ -48,6 +49,11 @@ def run_ai():
     minimax = int(arguments[2]) #minimax or alpha beta?
     caching = int(arguments[3]) #caching or no?
     ordering = int(arguments[4]) #node-ordering (for alpha-beta) or no?
+    protocol = TEXT # board encoding, unless the manager confirms another one
+    for field in arguments[5:]:
+        key, _, value = field.partition("=")
+        if key.strip() == CAPABILITY:
+            protocol = value.strip()
     
     while True: # This is the main loop 
         # Read in the current game status, for example:
@@ -59,14 +65,14 @@ def run_ai():
         light_score = int(light_score_s)
 
         if status == "FINAL": # Game is over. 
-            print 
+            break 
         else: 
-            board = eval(input()) # Read in the input and turn it into a Python
-                                  # object. The format is a list of rows. The 
-                                  # squares in each row are represented by 
-                                  # 0 : empty square
-                                  # 1 : dark disk (player 1)
-                                  # 2 : light disk (player 2)
+            # Read in the input and turn it into a Python object (see othello_protocol).
+            # The format is a list of rows. The squares in each row are represented by
+            # 0 : empty square
+            # 1 : dark disk (player 1)
+            # 2 : light disk (player 2)
+            board = decode_board(input(), protocol)
                     
             # Select the move and send it to the manager 
             movei, movej = select_move(board, color)
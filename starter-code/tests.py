@@ -396,3 +396,938 @@ def minimax_max_node_2_test(minimax_max_node, name=""):
     max_score = 2 * len(answers)
     return score, details, max_score
 
+
+def backend_equal_test(backend, name=""):
+    # backend is a module providing the othello_shared functions, e.g. othello_bitboard
+    import othello_shared
+    correct = 0
+    details = ""
+    boards = SMALL_BOARDS + BIG_BOARDS
+    for i, board in enumerate(boards):
+        try:
+            same = True
+            for color in (1, 2):
+                moves = othello_shared.get_possible_moves(board, color)
+                same = same and backend.get_possible_moves(board, color) == moves
+                for move in moves:
+                    same = same and (backend.find_lines(board, move[0], move[1], color) ==
+                                     othello_shared.find_lines(board, move[0], move[1], color))
+                    same = same and (backend.play_move(board, color, move[0], move[1]) ==
+                                     othello_shared.play_move(board, color, move[0], move[1]))
+                fused = backend.get_moves_and_flips(board, color)
+                same = same and [move for move, flips in fused] == moves
+                for move, flips in fused:
+                    same = same and (backend.apply_move(board, color, move[0], move[1], flips) ==
+                                     othello_shared.play_move(board, color, move[0], move[1]))
+                    same = same and (backend.flips_to_mask(flips, len(board)) ==
+                                     othello_shared.flips_to_mask(othello_shared.get_flips(
+                                         board, move[0], move[1], color), len(board)))
+            same = same and backend.get_score(board) == othello_shared.get_score(board)
+            same = same and backend.unpack_board(backend.pack_board(board), len(board)) == board
+        except Exception as e:
+            details += f"Board {i}: Exception {e}\n"
+            continue
+        if same:
+            correct += 1
+        else:
+            details += f"Board {i}: backend results differ from othello_shared\n"
+    max_score = len(boards)
+    return correct, details, max_score
+
+def game_state_test(manager_class, name=""):
+    # The state the game manager keeps move by move (disc counts, moves with
+    # their flips, game over) must match a rescan of its board, on both
+    # backends, over random games.
+    import random
+    import othello_shared
+    from othello_game import InvalidMoveError
+    correct = 0
+    details = ""
+    games = [(backend, size, seed) for backend in ("tuple", "bitboard") for size in (4, 6, 8, 10) for seed in range(2)]
+    for backend, size, seed in games:
+        rng = random.Random(seed)
+        try:
+            game = manager_class(size, backend)
+            same = True
+            while True:
+                board, player = game.board, game.current_player
+                moves = othello_shared.get_possible_moves(board, player)
+                same = same and game.get_possible_moves() == moves and game.terminal == (not moves)
+                same = same and game.get_score() == othello_shared.get_score(board)
+                if not moves:
+                    break
+                try:
+                    game.play(*next(m for m in [(size, 0), (0, 0)] if m not in moves))
+                    same = False
+                except InvalidMoveError:
+                    pass
+                i, j = rng.choice(moves)
+                game.play(i, j)
+                same = same and game.board == othello_shared.play_move(board, player, i, j)
+        except Exception as e:
+            details += f"{backend} {size}x{size} game {seed}: Exception {e}\n"
+            continue
+        if same:
+            correct += 1
+        else:
+            details += f"{backend} {size}x{size} game {seed}: game state differs from a rescan\n"
+    max_score = len(games)
+    return correct, details, max_score
+
+def cache_reuse_test(alphabeta_max_node, name=""):
+    # The cache is not cleared between depths, windows and colors: stored
+    # entries must only be reused when their depth, bound and color allow it.
+    correct = 0
+    details = ""
+    if hasattr(agent, 'cache'):
+        agent.cache.clear()
+    windows = [(float("-Inf"), float("Inf")), (-2, 2), (0, 1)]
+    for i, board in enumerate(BIG_BOARDS):
+        try:
+            same = True
+            for limit in [1, 2, 3, 4]:
+                for (alpha, beta), color in [(window, color) for window in windows for color in (1, 2)]:
+                    plain = alphabeta_max_node(board, color, alpha, beta, limit, 0, 0)[1]
+                    cached = alphabeta_max_node(board, color, alpha, beta, limit, 1, 0)[1]
+                    if alpha < plain < beta or alpha < cached < beta:
+                        same = same and plain == cached
+                    else:
+                        same = same and (plain <= alpha) == (cached <= alpha)
+        except Exception as e:
+            details += f"Board {i}: Exception {e}\n"
+            continue
+        if same:
+            correct += 1
+        else:
+            details += f"Board {i}: cached values differ from uncached values\n"
+    max_score = len(BIG_BOARDS)
+    return correct, details, max_score
+
+def iterative_deepening_test(select_move_alphabeta, name=""):
+    # With a time limit the search must return a legal move within the budget.
+    import time
+    from othello_shared import get_possible_moves
+    time_limit = 0.5
+    correct = 0
+    details = ""
+    for i, board in enumerate(BIG_BOARDS):
+        try:
+            start_time = time.perf_counter()
+            move = select_move_alphabeta(board, 1, -1, 1, 1, time_limit)
+            elapsed = time.perf_counter() - start_time
+        except Exception as e:
+            details += f"Board {i}: Exception {e}\n"
+            continue
+        if move not in get_possible_moves(board, 1):
+            details += f"Board {i}: illegal move {move}\n"
+        elif elapsed > time_limit + TIME_THRESHOLD:
+            details += f"Board {i}: took {elapsed:.2f}s with a {time_limit}s limit\n"
+        else:
+            correct += 1
+    max_score = len(BIG_BOARDS)
+    return correct, details, max_score
+
+def compute_heuristic_test(compute_heuristic, name=""):
+    # Values of the original square-by-square implementation, for both colors,
+    # on SMALL_BOARDS followed by BIG_BOARDS. Each board is also replayed move
+    # by move through an incrementally updated EvalState.
+    from evaluation import EvalState
+    import othello_bitboard
+    from othello_shared import get_possible_moves, play_move
+    correctvalues_1 = [5, -45, 25, -15, 246, 32, 15, 5, -5, -20, -50]
+    correctvalues_2 = [-5, 45, -25, 120, 144, 88, -15, -5, 5, 20, 50]
+    correct = 0
+    details = ""
+    for i, board in enumerate(SMALL_BOARDS + BIG_BOARDS):
+        try:
+            value1 = compute_heuristic(board, 1)
+            value2 = compute_heuristic(board, 2)
+            state = EvalState(board)
+            incremental = True
+            for color in (1, 2):
+                for move in get_possible_moves(board, color):
+                    n = len(board)
+                    own, opp = othello_bitboard.player_masks(board, color)
+                    square = move[0] * n + move[1]
+                    flips = othello_bitboard.flips_mask(own, opp, square, n)
+                    state.make(color, square, flips)
+                    new_board = play_move(board, color, move[0], move[1])
+                    incremental = incremental and state.heuristic(1) == compute_heuristic(new_board, 1)
+                    state.unmake(color, square, flips)
+        except Exception as e:
+            details += f"Board {i}: Exception {e}\n"
+            continue
+        if value1 == correctvalues_1[i] and value2 == correctvalues_2[i] and incremental:
+            correct += 1
+        elif not incremental:
+            details += f"Board {i}: incremental values differ from compute_heuristic\n"
+        else:
+            details += (f"Board {i}: expected ({correctvalues_1[i]}, {correctvalues_2[i]}), "
+                        f"got ({value1}, {value2})\n")
+    max_score = len(correctvalues_1)
+    return correct, details, max_score
+
+def opening_book_test(write_book, name=""):
+    # A book written for BIG_BOARDS (dark to move) must return every stored
+    # move through the memory map, for every rotation and reflection of the
+    # board, and nothing for light to move.
+    import tempfile
+    from opening_book import OpeningBook, book_key
+    from symmetry import symmetry
+    table = symmetry(6)
+    correct = 0
+    details = ""
+    entries = {}
+    for i, board in enumerate(BIG_BOARDS):
+        key, transform = book_key(board, 1)
+        move = table.transform_move(transform, divmod(i, 6))
+        entries[key] = (move[0] * 6 + move[1], 10 * i - 30, 4)
+    path = os.path.join(tempfile.mkdtemp(), "book6.bin")
+    try:
+        write_book(path, 6, entries)
+        book = OpeningBook(path)
+    except Exception as e:
+        details += f"Exception {e}\n"
+        return correct, details, len(BIG_BOARDS)
+    for i, board in enumerate(BIG_BOARDS):
+        entry = book.probe(board, 1)
+        images = [(book.probe(table.transform_board(t, board), 1), table.transform_move(t, divmod(i, 6)))
+                  for t in range(8)]
+        if entry != (divmod(i, 6), 10 * i - 30, 4):
+            details += f"Board {i}: probe returned {entry}\n"
+        elif any(image is None or image[0] != move for image, move in images):
+            details += f"Board {i}: a rotated or reflected board is not found\n"
+        elif book.probe(board, 2) is not None:
+            details += f"Board {i}: found an entry for the wrong side to move\n"
+        else:
+            correct += 1
+    book.close()
+    os.remove(path)
+    max_score = len(BIG_BOARDS)
+    return correct, details, max_score
+
+def symmetry_test(alphabeta_max_node, name=""):
+    # All eight rotations and reflections of a board share one canonical key,
+    # have the mapped legal moves and the same value, with or without caching.
+    from othello_shared import get_possible_moves
+    from symmetry import canonical_key, symmetry
+    correct = 0
+    details = ""
+    if hasattr(agent, 'cache'):
+        agent.cache.clear()
+    for i, board in enumerate(BIG_BOARDS):
+        table = symmetry(len(board))
+        try:
+            key = canonical_key(board, 1, 1)[0]
+            moves = set(get_possible_moves(board, 1))
+            value = alphabeta_max_node(board, 1, float("-Inf"), float("Inf"), 3, 0, 0)[1]
+            same = True
+            for t in range(8):
+                image = table.transform_board(t, board)
+                same = same and canonical_key(image, 1, 1)[0] == key
+                same = same and set(get_possible_moves(image, 1)) == {table.transform_move(t, m) for m in moves}
+                same = same and alphabeta_max_node(image, 1, float("-Inf"), float("Inf"), 3, 1, 0)[1] == value
+        except Exception as e:
+            details += f"Board {i}: Exception {e}\n"
+            continue
+        if same:
+            correct += 1
+        else:
+            details += f"Board {i}: rotated or reflected boards differ\n"
+    max_score = len(BIG_BOARDS)
+    return correct, details, max_score
+
+def endgame_test(select_move_alphabeta, name=""):
+    # Without a depth limit, the endgame solver must choose the same moves as
+    # the plain alpha-beta search and find the same exact values.
+    from endgame import EndgameSolver
+    import othello_bitboard
+    correct = 0
+    details = ""
+    for i, board in enumerate(SMALL_BOARDS):
+        try:
+            saved = agent.endgame_empties
+            agent.endgame_empties = 0
+            expected = [select_move_alphabeta(board, color, -1) for color in (1, 2)]
+            values = [agent.alphabeta_max_node(board, color, float("-Inf"), float("Inf"), -1)[1]
+                      for color in (1, 2)]
+            agent.endgame_empties = 16
+            moves = [select_move_alphabeta(board, color, -1) for color in (1, 2)]
+            agent.endgame_empties = saved
+            solver = EndgameSolver(len(board))
+            solved = [solver.solve(*othello_bitboard.player_masks(board, color), -100, 100)
+                      for color in (1, 2)]
+        except Exception as e:
+            details += f"Board {i}: Exception {e}\n"
+            continue
+        if moves != expected:
+            details += f"Board {i}: expected moves {expected}, got {moves}\n"
+        elif solved != values:
+            details += f"Board {i}: expected values {values}, got {solved}\n"
+        else:
+            correct += 1
+    max_score = len(SMALL_BOARDS)
+    return correct, details, max_score
+
+def batch_evaluation_test(utilities, name=""):
+    # Batched utilities must equal compute_utility, and searches with and
+    # without batching must return the same moves and values.
+    import batch_evaluation
+    if not batch_evaluation.available():
+        return len(BIG_BOARDS), "NumPy is not installed, batched evaluation skipped\n", len(BIG_BOARDS)
+    correct = 0
+    details = ""
+    saved = agent.batching
+    for i, board in enumerate(BIG_BOARDS):
+        try:
+            children = [agent.play_move(board, 1, move[0], move[1]) for move in agent.get_possible_moves(board, 1)]
+            same = True
+            for color in (1, 2):
+                same = same and utilities(children + [board], color) == \
+                    [agent.compute_utility(child, color) for child in children + [board]]
+            results = []
+            for batching in (False, True):
+                agent.batching = batching
+                results.append([agent.alphabeta_max_node(board, 1, alpha, beta, 4, 0, 1)
+                                for alpha, beta in [(float("-Inf"), float("Inf")), (-2, 2)]])
+            same = same and results[0] == results[1]
+        except Exception as e:
+            details += f"Board {i}: Exception {e}\n"
+            continue
+        finally:
+            agent.batching = saved
+        if same:
+            correct += 1
+        else:
+            details += f"Board {i}: batched results differ\n"
+    max_score = len(BIG_BOARDS)
+    return correct, details, max_score
+
+def protocol_test(decode_board, name=""):
+    # Boards must survive both encodings of othello_protocol unchanged, and
+    # text that is not a board must be rejected rather than evaluated.
+    from othello_protocol import HEX, TEXT, encode_board
+    correct = 0
+    details = ""
+    boards = SMALL_BOARDS + BIG_BOARDS
+    for i, board in enumerate(boards):
+        try:
+            same = all(decode_board(encode_board(board, protocol), protocol) == board
+                       for protocol in (TEXT, HEX))
+            same = same and decode_board(str([list(row) for row in board])) == board
+        except Exception as e:
+            details += f"Board {i}: Exception {e}\n"
+            continue
+        if same:
+            correct += 1
+        else:
+            details += f"Board {i}: decoded board differs\n"
+    try:
+        decode_board("__import__('os').getcwd()")
+        details += "Code was accepted as a board\n"
+    except ValueError:
+        correct += 1
+    max_score = len(boards) + 1
+    return correct, details, max_score
+
+def pondering_test(start_pondering, name=""):
+    # The ponder thread must stop promptly when asked to, and the moves it
+    # found for the opponent's replies must be legal.
+    from othello_shared import get_possible_moves
+    from othello_bitboard import unpack_board
+    correct = 0
+    details = ""
+    for i, board in enumerate(BIG_BOARDS):
+        try:
+            start_pondering(board, 2, 1)
+            time.sleep(0.2)
+            start_time = time.perf_counter()
+            agent.stop_pondering()
+            elapsed = time.perf_counter() - start_time
+            results = dict(agent.ponder_results)
+        except Exception as e:
+            details += f"Board {i}: Exception {e}\n"
+            continue
+        if elapsed > TIME_THRESHOLD:
+            details += f"Board {i}: took {elapsed:.2f}s to stop\n"
+        elif not results or any(move not in get_possible_moves(unpack_board(reply, len(board)), 2)
+                                 for reply, (depth, move) in results.items()):
+            details += f"Board {i}: no results or illegal moves\n"
+        else:
+            correct += 1
+    max_score = len(BIG_BOARDS)
+    return correct, details, max_score
+
+def lazy_smp_test(select_move_parallel, name=""):
+    # A parallel search with a helper process must pick a move whose value is
+    # the best one at the depth limit.
+    from lazy_smp import LazySMP
+    from othello_shared import get_possible_moves, play_move
+    from transposition import SharedTranspositionTable
+    correct = 0
+    details = ""
+    saved = agent.cache
+    try:
+        agent.cache = SharedTranspositionTable(4)
+        agent.smp = LazySMP(2, agent.cache)
+    except Exception as e:
+        agent.cache = saved
+        return correct, f"Exception {e}\n", len(BIG_BOARDS)
+    try:
+        for i, board in enumerate(BIG_BOARDS):
+            try:
+                move = select_move_parallel(board, 1, 9, 4, 1)
+                values = {m: agent.alphabeta_min_node(play_move(board, 1, m[0], m[1]), 1, float("-Inf"),
+                                                      float("Inf"), 3)[1]
+                          for m in get_possible_moves(board, 1)}
+            except Exception as e:
+                details += f"Board {i}: Exception {e}\n"
+                continue
+            if move in values and values[move] == max(values.values()):
+                correct += 1
+            else:
+                details += f"Board {i}: {move} is not a best move\n"
+    finally:
+        agent.smp.close()
+        agent.smp = None
+        agent.cache = saved
+    max_score = len(BIG_BOARDS)
+    return correct, details, max_score
+
+def tournament_test(play_match, name=""):
+    # Both games of a pair must start from the same opening with the colours
+    # swapped, and every record must be consistent with the game it reports.
+    import os
+    from othello_tournament import random_opening
+    correct = 0
+    details = ""
+    randy = os.path.join(os.path.dirname(os.path.abspath(__file__)), "randy_ai.py")
+    spec = {"file": randy, "limit": -1, "minimax": False, "caching": False, "ordering": False, "options": {}}
+    for i, size in enumerate((4, 6)):
+        opening = random_opening(size, 2, i)
+        try:
+            results = [play_match((0, size, opening, dict(spec, label="A"), dict(spec, label="B"))),
+                       play_match((1, size, opening, dict(spec, label="B"), dict(spec, label="A")))]
+        except Exception as e:
+            details += f"Size {size}: Exception {e}\n"
+            continue
+        for result in results:
+            scores = (result["dark_score"], result["light_score"])
+            expected = 1 if scores[0] > scores[1] else 2 if scores[1] > scores[0] else 0
+            moves = len(result["latencies"][1]) + len(result["latencies"][2])
+            if (result["forfeit"] is None and result["winner"] == expected and moves == len(result["moves"])
+                    and result["opening"] == opening and sum(scores) <= size * size):
+                correct += 1
+            else:
+                details += f"Size {size}: inconsistent record {result}\n"
+        if results[0]["dark_label"] == results[1]["dark_label"]:
+            details += f"Size {size}: colours were not swapped\n"
+            correct -= 1
+    # Games that could not be played (an AI that exits at once) are errors,
+    # not draws, and add nothing to the margin.
+    import tempfile
+    from othello_tournament import summarize
+    with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as broken:
+        broken.write("import sys\nsys.exit(0)\n")
+    try:
+        results = [play_match((number, 4, [], dict(spec, label="A"), dict(spec, file=broken.name, label="B")))
+                   for number in range(2)]
+        stats = summarize(results, 1.0)["by_size"][4]
+        if (stats["errors"] == 2 and stats["wins"] + stats["draws"] + stats["losses"] == 0 and stats["margin"] == 0
+                and all(result["winner"] is None for result in results)):
+            correct += 1
+        else:
+            details += f"Broken AI: {stats}\n"
+    except Exception as e:
+        details += f"Broken AI: Exception {e}\n"
+    finally:
+        os.remove(broken.name)
+    max_score = 5
+    return correct, details, max_score
+
+def benchmark_test(run_case, name=""):
+    # The benchmark must count the nodes of every search, and alpha-beta must
+    # never visit more nodes than minimax at the same depth.
+    correct = 0
+    details = ""
+    positions = [(board, 1) for board in SMALL_BOARDS + BIG_BOARDS if agent.get_possible_moves(board, 1)]
+    for depth in (1, 2, 3):
+        try:
+            minimax = run_case(positions, "select_move_minimax", depth, 0, 0, 1)
+            alphabeta = run_case(positions, "select_move_alphabeta", depth, 0, 1, 1)
+        except Exception as e:
+            details += f"Depth {depth}: Exception {e}\n"
+            continue
+        if 0 < alphabeta["nodes"] <= minimax["nodes"] and minimax["branching"] > 1:
+            correct += 1
+        else:
+            details += f"Depth {depth}: minimax {minimax['nodes']} nodes, alpha-beta {alphabeta['nodes']}\n"
+    # Repeats of a case must do the same work, whatever the searches before
+    # them learned (move ordering history included).
+    try:
+        nodes = [run_case(positions, "select_move_alphabeta", 4, 1, 1, 1)["nodes"] for _ in range(3)]
+        if len(set(nodes)) == 1:
+            correct += 1
+        else:
+            details += f"Repeats: {nodes} nodes\n"
+    except Exception as e:
+        details += f"Repeats: Exception {e}\n"
+    max_score = 4
+    return correct, details, max_score
+
+def search_statistics_test(select_move_alphabeta, name=""):
+    # Counting must not change the move chosen, and the counters must be
+    # consistent with each other.
+    from instrumentation import SearchCounters
+    correct = 0
+    details = ""
+    for i, board in enumerate(BIG_BOARDS):
+        try:
+            expected = select_move_alphabeta(board, 1, 4, 1, 1)
+            agent.cache.clear()
+            agent.counters = SearchCounters()
+            move = select_move_alphabeta(board, 1, 4, 1, 1)
+            counters = agent.counters
+        except Exception as e:
+            details += f"Board {i}: Exception {e}\n"
+            continue
+        finally:
+            agent.counters = None
+        if move != expected:
+            details += f"Board {i}: {move} instead of {expected} with statistics on\n"
+        elif not (counters.nodes >= counters.leaves > 0 and counters.cutoffs >= counters.first_cutoffs
+                  and counters.probes >= counters.hits and counters.stores > 0):
+            details += f"Board {i}: inconsistent counters {vars(counters)}\n"
+        else:
+            correct += 1
+    max_score = len(BIG_BOARDS)
+    return correct, details, max_score
+
+def move_ordering_test(MoveOrdering, name=""):
+    # Killer and history ordering must not change the values of the search,
+    # and a move that caused a cutoff must be tried first at the same depth.
+    correct = 0
+    details = ""
+    for i, board in enumerate(BIG_BOARDS):
+        try:
+            value = agent.alphabeta_max_node(board, 1, float("-Inf"), float("Inf"), 4, 0, 0)[1]
+            ordered = agent.alphabeta_max_node(board, 1, float("-Inf"), float("Inf"), 4, 0, 1)[1]
+            table = MoveOrdering(len(board))
+            children = agent.expand(board, 1)
+            last = children[-1][0]
+            table.cutoff(1, last, 3)
+            first = table.order(children, 1, 3)[0][0]
+            table.new_search()
+            aged = not table.killers and table.history[1][last[0] * len(board) + last[1]] == 9 // 2
+        except Exception as e:
+            details += f"Board {i}: Exception {e}\n"
+            continue
+        if value != ordered:
+            details += f"Board {i}: value {ordered} with ordering, {value} without\n"
+        elif first != last or not aged:
+            details += f"Board {i}: killer or history not applied\n"
+        else:
+            correct += 1
+    max_score = len(BIG_BOARDS)
+    return correct, details, max_score
+
+def negamax_test(mtdf, name=""):
+    # The principal variation search and MTD(f) must find the minimax value,
+    # and MTD(f) a move that has it.
+    from othello_shared import play_move
+    correct = 0
+    details = ""
+    for i, board in enumerate(BIG_BOARDS):
+        try:
+            value = agent.minimax_max_node(board, 1, 3, 0)[1]
+            pvs = agent.negamax_node(board, 1, 1, float("-Inf"), float("Inf"), 3, 1, 1)[1]
+            agent.cache.clear()
+            move, mtdf_value = mtdf(board, 1, 3, 0, 1)
+            move_value = agent.minimax_min_node(play_move(board, 1, move[0], move[1]), 1, 2, 0)[1]
+        except Exception as e:
+            details += f"Board {i}: Exception {e}\n"
+            continue
+        if value == pvs == mtdf_value == move_value:
+            correct += 1
+        else:
+            details += f"Board {i}: minimax {value}, PVS {pvs}, MTD(f) {mtdf_value} with {move} ({move_value})\n"
+    max_score = len(BIG_BOARDS)
+    return correct, details, max_score
+
+
+def probcut_test(probcut_model, name=""):
+    # A Multi-ProbCut model whose margin is too wide to ever cut must not
+    # change the value of the search, one that cuts as much as it can must
+    # still return legal moves, and fit must recover an exact line.
+    from probcut import PHASES, SYMMETRIC, calibrate, fit, phase, shallow_depth
+    correct = 0
+    details = ""
+    saved = agent.probcut
+    for i, board in enumerate(BIG_BOARDS):
+        def model(sigma):
+            depths = {str(depth): [shallow_depth(depth), 1.0, 0.0, sigma] for depth in (3, 4)}
+            return probcut_model({str(len(board)): {str(phase): depths for phase in range(PHASES)}})
+        try:
+            agent.probcut = None
+            agent.cache.clear()
+            value = agent.negamax_node(board, 1, 1, float("-Inf"), float("Inf"), 4, 1, 1)[1]
+            agent.probcut = model(1e9)
+            agent.cache.clear()
+            wide = agent.negamax_node(board, 1, 1, float("-Inf"), float("Inf"), 4, 1, 1)[1]
+            agent.probcut = model(0.0)
+            agent.cache.clear()
+            move = agent.select_move_alphabeta(board, 1, 4, 1, 1)
+        except Exception as e:
+            details += f"Board {i}: Exception {e}\n"
+            continue
+        finally:
+            agent.probcut = saved
+            agent.cache.clear()
+        if value == wide and move in agent.get_possible_moves(board, 1):
+            correct += 1
+        else:
+            details += f"Board {i}: value {value}, with a wide margin {wide}, move {move}\n"
+    slope, intercept, sigma = fit([(x, 2 * x - 3) for x in range(-5, 6)])
+    if abs(slope - 2) < 1e-9 and abs(intercept + 3) < 1e-9 and sigma < 1e-9:
+        correct += 1
+    else:
+        details += f"fit: a {slope}, b {intercept}, sigma {sigma}\n"
+    # negamax_node values are for the side to move: with the utility they do
+    # not depend on color, so the fit of the side to move holds at every
+    # node, while the heuristic (stable discs count for color only) gets a
+    # fit of its own for the nodes where the side to move is not color.
+    saved_evaluator = agent.evaluator
+    saved_backend = next(name for name, module in agent.BACKENDS.items()
+                         if module.get_possible_moves is agent.get_possible_moves)
+    try:
+        agent.set_evaluator("utility")
+        same = all(agent.negamax_node(board, color, 3 - color, float("-Inf"), float("Inf"), 3, 0, 0)[1] ==
+                   agent.negamax_node(board, 3 - color, 3 - color, float("-Inf"), float("Inf"), 3, 0, 0)[1]
+                   for board in BIG_BOARDS for color in (1, 2))
+        fitted = {}
+        for evaluator in ("utility", "heuristic"):
+            fitted[evaluator] = {"6": calibrate(6, [3], 2, evaluator, log=lambda *args: None)}
+        for evaluator, sizes in fitted.items():
+            model = probcut_model(sizes, symmetric=evaluator in SYMMETRIC)
+            entries = [(int(index), depths["3"]) for index, depths in sizes["6"].items() if "3" in depths]
+            same = same and len(entries) > 0
+            for index, entry in entries:
+                empties = next(empties for empties in range(1, 37) if phase(6, empties) == index)
+                own, other = model.lookup(6, empties, 3), model.lookup(6, empties, 3, -1)
+                if evaluator in SYMMETRIC:
+                    same = same and len(entry) == 4 and other == own
+                else:
+                    same = same and len(entry) == 7 and own[1:3] == tuple(entry[1:3]) and other[1:3] == tuple(entry[4:6])
+    except Exception as e:
+        same = False
+        details += f"calibrate: Exception {e}\n"
+    finally:
+        agent.set_evaluator(saved_evaluator)
+        agent.set_backend(saved_backend)
+        agent.probcut = saved
+        agent.cache.clear()
+    if same:
+        correct += 1
+    else:
+        details += "calibrate: fits of the side to move and of the other side do not match the evaluator\n"
+    max_score = len(BIG_BOARDS) + 2
+    return correct, details, max_score
+
+
+def patterns_test(pattern_state, name=""):
+    # The incrementally updated pattern value must equal the value computed
+    # from the board after every move, and be the same in all eight
+    # orientations of the board.
+    import patterns
+    from othello_shared import flips_to_mask, get_flips
+    correct = 0
+    details = ""
+    for i, board in enumerate(BIG_BOARDS):
+        n = len(board)
+        table = patterns.tables(n)
+        try:
+            state = pattern_state(board)
+            same = state.value(1) == table.value(board, 1) == -state.value(2)
+            for move in agent.get_possible_moves(board, 1):
+                square = move[0] * n + move[1]
+                mask = flips_to_mask(get_flips(board, move[0], move[1], 1), n)
+                state.make(1, square, mask)
+                same = same and state.value(1) == table.value(agent.play_move(board, 1, move[0], move[1]), 1)
+                state.unmake(1, square, mask)
+            values = set()
+            for transform in patterns.symmetries(n):
+                image = [[0] * n for _ in range(n)]
+                for r in range(n):
+                    for c in range(n):
+                        row, column = transform(r, c)
+                        image[row][column] = board[r][c]
+                values.add(table.value(tuple(tuple(row) for row in image), 1))
+            same = same and len(values) == 1 and state.value(1) == table.value(board, 1)
+        except Exception as e:
+            details += f"Board {i}: Exception {e}\n"
+            continue
+        if same:
+            correct += 1
+        else:
+            details += f"Board {i}: pattern values differ\n"
+    # Lines longer than MAX_LINE are cut, so the tables of a large board
+    # are no bigger than those of 8x8.
+    if patterns.tables(16).entries == patterns.tables(8).entries:
+        correct += 1
+    else:
+        details += f"16x16: {patterns.tables(16).entries} pattern entries\n"
+    max_score = len(BIG_BOARDS) + 1
+    return correct, details, max_score
+
+
+def selfplay_test(play_shard, name=""):
+    # Every record of a self-play shard must read back as written: a legal
+    # move of a position of the game, a final result that is the same
+    # for the whole game from the side to move's point of view, and, with
+    # NumPy, the same boards from the memory-mapped records.
+    import shutil
+    import tempfile
+    import selfplay
+    correct = 0
+    details = ""
+    directory = tempfile.mkdtemp()
+    try:
+        for i, size in enumerate((4, 6)):
+            path = selfplay.shard_path(directory, size, 0)
+            try:
+                index, written = play_shard((path, 0, size, 2, 2, 2, 0.2, i))
+                records = list(selfplay.iter_records(path))
+                same = written == len(records) > 0
+                results = set()
+                for board, player, depth, score, result, move in records:
+                    same = same and depth == 2 and move in agent.get_possible_moves(board, player)
+                    results.add(result if player == 1 else -result)
+                same = same and len(results) <= 2 # one result per game
+                if selfplay.np is not None:
+                    n, array = selfplay.load_shard(path)
+                    boards = selfplay.boards(array, n)
+                    same = same and all(boards[k].tolist() == [list(row) for row in record[0]]
+                                        for k, record in enumerate(records))
+            except Exception as e:
+                details += f"Size {size}: Exception {e}\n"
+                continue
+            if same:
+                correct += 1
+            else:
+                details += f"Size {size}: shard does not read back as written\n"
+        # The depth is stored as a u8: unlimited searches must be refused.
+        try:
+            play_shard((selfplay.shard_path(directory, 4, 1), 1, 4, 1, -1, 2, 0.2, 0))
+            details += "Depth limit -1 accepted\n"
+        except ValueError:
+            correct += 1
+    finally:
+        shutil.rmtree(directory)
+    max_score = 3
+    return correct, details, max_score
+
+
+def tuner_test(features, name=""):
+    # The tuner's features, weighted by the phase weights, must give the
+    # values of compute_heuristic, and a weights file must round-trip
+    # through evaluation.load_weights.
+    import batch_evaluation
+    if not batch_evaluation.available():
+        return len(BIG_BOARDS) + 1, "NumPy is not installed, tuner skipped\n", len(BIG_BOARDS) + 1
+    import os
+    import tempfile
+    import numpy as np
+    import evaluation
+    import tuner
+    correct = 0
+    details = ""
+    for i, board in enumerate(BIG_BOARDS):
+        try:
+            matrix = features(np.array([board, board], dtype=np.int8), np.array([1, 2], dtype=np.int8))
+            weights = evaluation.phase_weights(sum(row.count(0) for row in board), len(board) ** 2)
+            values = [int(row @ np.array(weights)) for row in matrix]
+        except Exception as e:
+            details += f"Board {i}: Exception {e}\n"
+            continue
+        expected = [agent.compute_heuristic(board, 1), agent.compute_heuristic(board, 2)]
+        if values == expected:
+            correct += 1
+        else:
+            details += f"Board {i}: features give {values}, compute_heuristic {expected}\n"
+    handle, path = tempfile.mkstemp(suffix=".json")
+    os.close(handle)
+    weights = [[1, 2, 3, 4, 5], [6, 7, 8, 9, 10], [11, 12, 13, 14, 15]]
+    try:
+        tuner.write_weights(path, 0.6, 0.25, weights, "mse", 0)
+        evaluation.load_weights(path)
+        loaded = [evaluation.phase_weights(empties, 100) for empties in (61, 26, 25)]
+        if loaded == [tuple(phase) for phase in weights]:
+            correct += 1
+        else:
+            details += f"Weights file: loaded {loaded}\n"
+    except Exception as e:
+        details += f"Weights file: Exception {e}\n"
+    finally:
+        evaluation.reset_weights()
+        os.remove(path)
+    max_score = len(BIG_BOARDS) + 1
+    return correct, details, max_score
+
+def analysis_cache_test(AnalysisCache, name=""):
+    # Deep results merged into an analysis file at the end of a game must
+    # give the same values in the next game, for fewer nodes, and a merge
+    # must keep the deeper result of a position.
+    import os
+    import tempfile
+    from instrumentation import SearchCounters
+    correct = 0
+    details = ""
+    directory = tempfile.mkdtemp()
+    inf = float("inf")
+    for i, board in enumerate(BIG_BOARDS):
+        path = os.path.join(directory, "analysis{}.bin".format(i))
+        try:
+            agent.cache.clear()
+            agent.analysis = AnalysisCache(path, len(board), agent.evaluator, min_depth=2)
+            expected = agent.alphabeta_max_node(board, 1, -inf, inf, 4, 1, 0)[1]
+            agent.analysis.merge()
+            agent.cache.clear()
+            agent.analysis = AnalysisCache(path, len(board), agent.evaluator, min_depth=2)
+            agent.counters = SearchCounters()
+            value = agent.alphabeta_max_node(board, 1, -inf, inf, 4, 1, 0)[1]
+            nodes = agent.counters.nodes
+        except Exception as e:
+            details += f"Board {i}: Exception {e}\n"
+            continue
+        finally:
+            agent.counters = None
+            if agent.analysis is not None:
+                agent.analysis.close()
+            agent.analysis = None
+        if value != expected:
+            details += f"Board {i}: {value} from the analysis file instead of {expected}\n"
+        elif nodes > 1:
+            details += f"Board {i}: {nodes} nodes searched again\n"
+        else:
+            correct += 1
+    path = os.path.join(directory, "merge.bin")
+    try:
+        first = AnalysisCache(path, 4, "utility", min_depth=2)
+        second = AnalysisCache(path, 4, "utility", min_depth=2)
+        first.record(1, 3, 0, 10, (0, 1))
+        first.record(2, 5, 0, 20, (1, 0))
+        first.merge()
+        second.record(1, 4, 0, 11, (2, 3))
+        second.record(2, 4, 0, 21, (3, 2))
+        second.record(3, 1, 0, 30, (1, 1)) # too shallow to keep
+        second.merge()
+        merged = [AnalysisCache(path, 4, "utility").probe(key) for key in (1, 2, 3)]
+        if merged != [(4, 0, 11, (2, 3), 0), (5, 0, 20, (1, 0), 0), None]:
+            details += f"Merge: {merged}\n"
+        else:
+            rejected = 0
+            for evaluator, tag in (("heuristic", 0), ("utility", 1)):
+                try:
+                    AnalysisCache(path, 4, evaluator, tag=tag)
+                except ValueError:
+                    rejected += 1
+            if rejected == 2:
+                correct += 1
+            else:
+                details += "Merge: file of another evaluator or other settings accepted\n"
+    except Exception as e:
+        details += f"Merge: Exception {e}\n"
+    max_score = len(BIG_BOARDS) + 1
+    return correct, details, max_score
+
+def agent_server_test(AiServer, name=""):
+    # Games played by one agent server, interleaved or one after the other,
+    # must get the moves the agent finds on its own, and a whole game
+    # between two players of the server must end normally.
+    import os
+    from types import SimpleNamespace
+    from othello_game import OthelloGameManager, ServerPlayerInterface, play_game
+    from othello_shared import get_score
+    correct = 0
+    details = ""
+    here = os.path.dirname(os.path.abspath(__file__))
+    agent_file = os.path.join(os.path.dirname(here), "agent.py")
+    path = os.environ.get("PYTHONPATH")
+    os.environ["PYTHONPATH"] = os.pathsep.join([here] + ([path] if path else [])) # agent.py imports othello_shared
+    try:
+        server = AiServer(agent_file, verbose=False)
+    finally:
+        if path is None:
+            del os.environ["PYTHONPATH"]
+        else:
+            os.environ["PYTHONPATH"] = path
+    try:
+        managers = [SimpleNamespace(board=board, get_score=lambda board=board: get_score(board)) for board in BIG_BOARDS]
+        expected = [agent.select_move_alphabeta(board, 1, 3) for board in BIG_BOARDS]
+        for i, board in enumerate(BIG_BOARDS):
+            try:
+                players = [ServerPlayerInterface(server, 1, 3, verbose=False) for _ in range(2)]
+                interleaved = [player.get_move(managers[i]) for player in players]
+                for player in players:
+                    player.kill(managers[i])
+                player = ServerPlayerInterface(server, 1, 3, verbose=False)
+                alone = player.get_move(managers[i])
+                player.kill(managers[i])
+            except Exception as e:
+                details += f"Board {i}: Exception {e}\n"
+                continue
+            if interleaved + [alone] != [expected[i]] * 3:
+                details += f"Board {i}: moves {interleaved + [alone]} instead of {expected[i]}\n"
+            else:
+                correct += 1
+        try:
+            game = OthelloGameManager(4)
+            result = play_game(game, ServerPlayerInterface(server, 1, 2, caching=True, verbose=False),
+                               ServerPlayerInterface(server, 2, 2, caching=True, verbose=False), verbose=False)
+            if result["forfeit"] is None and game.terminal:
+                correct += 1
+            else:
+                details += f"Game: {result}\n"
+        except Exception as e:
+            details += f"Game: Exception {e}\n"
+        # A game with another evaluator must not reuse the values the cache
+        # holds from the games before it.
+        try:
+            saved = agent.evaluator
+            agent.set_evaluator("heuristic")
+            agent.cache.clear()
+            expected = [agent.select_move_alphabeta(board, 1, 3, 1) for board in BIG_BOARDS]
+        finally:
+            agent.set_evaluator(saved)
+            agent.cache.clear()
+        moves = []
+        for evaluator in ("utility", "heuristic"):
+            players = [ServerPlayerInterface(server, 1, 3, caching=True, options={"eval": evaluator}, verbose=False)
+                       for board in BIG_BOARDS]
+            moves = [player.get_move(manager) for player, manager in zip(players, managers)]
+            for player, manager in zip(players, managers):
+                player.kill(manager)
+        if moves == expected:
+            correct += 1
+        else:
+            details += f"Evaluator change: moves {moves} instead of {expected}\n"
+    finally:
+        server.close()
+    # A line of no game from the server is dropped, and the replies after it
+    # still reach their games.
+    import io
+    import queue
+    import threading
+    reader = AiServer.__new__(AiServer)
+    reader.process = SimpleNamespace(stdout=io.BytesIO(b"debugging output\n1 2 3\n"))
+    reader.verbose = False
+    reader.lock = threading.Lock()
+    reader.requests = [[1, 0.0]]
+    reader.replies = {1: queue.Queue()}
+    reader.read()
+    if [reader.replies[1].get_nowait() for _ in range(2)] == ["2 3", None] and not reader.requests:
+        correct += 1
+    else:
+        details += "Reader: replies lost after a line of no game\n"
+    max_score = len(BIG_BOARDS) + 3
+    return correct, details, max_score
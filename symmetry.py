@@ -0,0 +1,181 @@
+"""
+The eight symmetries of the square board (rotations and reflections) and
+position keys that are the same for all eight images of a position.
+
+A symmetry key packs eight 64-bit Zobrist keys into one integer, one lane
+per transform: lane t holds the Zobrist key (see transposition.py) of the
+board mapped through transform t. Lane 0 is the ordinary key of the board.
+Like a Zobrist key, a symmetry key is updated move by move with XORs, and
+since all eight lanes are updated by the same XOR it costs no more than a
+single key. The canonical key of a position is its smallest lane, so the
+eight equivalent positions share one canonical key; the transform of that
+lane is used to map moves into the canonical frame before storing them and
+back out of it after probing.
+"""
+
+from othello_bitboard import board_to_masks, iter_squares, masks_to_board
+from transposition import zobrist
+
+TRANSFORMS = 8
+LANE_BITS = 64
+LANE_MASK = (1 << LANE_BITS) - 1
+
+_SYMMETRY = {}
+
+
+def transform_coords(transform, i, j, n):
+    """
+    Return the image of square (i, j) under transform (0 to 7): bit 4
+    transposes the board, then bit 1 mirrors the columns and bit 2 mirrors
+    the rows. Transform 0 is the identity.
+    """
+    if transform & 4:
+        i, j = j, i
+    if transform & 1:
+        i = n - 1 - i
+    if transform & 2:
+        j = n - 1 - j
+    return i, j
+
+
+def replicate(value):
+    """
+    Return a symmetry key with value in every lane.
+    """
+    lanes = 0
+    for transform in range(TRANSFORMS):
+        lanes |= value << (transform * LANE_BITS)
+    return lanes
+
+
+class Symmetry(object):
+    """
+    Square permutations and symmetry keys for an n x n board.
+    images[t][square] is the square that square maps to under transform t,
+    preimages[t] is the inverse permutation. squares, flip, to_move,
+    perspective and turn mirror the fields of Zobrist with one lane per
+    transform.
+    """
+
+    def __init__(self, n):
+        keys = zobrist(n)
+        size = n * n
+        self.n = n
+        self.images = []
+        self.preimages = []
+        for transform in range(TRANSFORMS):
+            images = []
+            for square in range(size):
+                i, j = transform_coords(transform, square // n, square % n, n)
+                images.append(i * n + j)
+            preimages = [0] * size
+            for square, image in enumerate(images):
+                preimages[image] = square
+            self.images.append(images)
+            self.preimages.append(preimages)
+        self.squares = [None]
+        for player in (1, 2):
+            lanes = []
+            for square in range(size):
+                value = 0
+                for transform in range(TRANSFORMS):
+                    image = self.images[transform][square]
+                    value |= keys.squares[player][image] << (transform * LANE_BITS)
+                lanes.append(value)
+            self.squares.append(lanes)
+        self.flip = [self.squares[1][sq] ^ self.squares[2][sq] for sq in range(size)]
+        self.to_move = [0, replicate(keys.to_move[1]), replicate(keys.to_move[2])]
+        self.perspective = [0, replicate(keys.perspective[1]), replicate(keys.perspective[2])]
+        self.turn = self.to_move[1] ^ self.to_move[2]
+
+    def key(self, board, to_move, color):
+        """
+        Compute the symmetry key of a tuple-of-tuples board from scratch.
+        """
+        dark, light = board_to_masks(board)
+        return self.masks_key(dark, light, to_move, color)
+
+    def masks_key(self, dark, light, to_move, color):
+        """
+        Compute the symmetry key of a board given as a pair of bitboard
+        masks (dark, light).
+        """
+        key = self.to_move[to_move] ^ self.perspective[color]
+        squares = self.squares[1]
+        for square in iter_squares(dark):
+            key ^= squares[square]
+        squares = self.squares[2]
+        for square in iter_squares(light):
+            key ^= squares[square]
+        return key
+
+    def play(self, key, player, square, flips):
+        """
+        Return the symmetry key after player places a disc on square and
+        flips the discs in the mask flips (see Zobrist.play).
+        """
+        key ^= self.squares[player][square] ^ self.turn
+        flip = self.flip
+        for square in iter_squares(flips):
+            key ^= flip[square]
+        return key
+
+    def canonical(self, key):
+        """
+        Return (canonical key, transform): the smallest lane of a symmetry
+        key and the transform that maps the board into the canonical frame.
+        """
+        best = key & LANE_MASK
+        best_transform = 0
+        for transform in range(1, TRANSFORMS):
+            key >>= LANE_BITS
+            lane = key & LANE_MASK
+            if lane < best:
+                best = lane
+                best_transform = transform
+        return best, best_transform
+
+    def transform_move(self, transform, move):
+        """
+        Map a (column, row) move into the frame of transform.
+        """
+        return divmod(self.images[transform][move[0] * self.n + move[1]], self.n)
+
+    def restore_move(self, transform, move):
+        """
+        Map a (column, row) move back from the frame of transform.
+        """
+        return divmod(self.preimages[transform][move[0] * self.n + move[1]], self.n)
+
+    def transform_mask(self, transform, mask):
+        images = self.images[transform]
+        result = 0
+        for square in iter_squares(mask):
+            result |= 1 << images[square]
+        return result
+
+    def transform_board(self, transform, board):
+        """
+        Return the tuple-of-tuples image of board under transform.
+        """
+        dark, light = board_to_masks(board)
+        return masks_to_board(self.transform_mask(transform, dark),
+                              self.transform_mask(transform, light), self.n)
+
+
+def symmetry(n):
+    """
+    Return the (cached) symmetry tables for an n x n board.
+    """
+    table = _SYMMETRY.get(n)
+    if table is None:
+        table = _SYMMETRY[n] = Symmetry(n)
+    return table
+
+
+def canonical_key(board, to_move, color):
+    """
+    Return (canonical key, transform) of a tuple-of-tuples board.
+    """
+    table = symmetry(len(board))
+    return table.canonical(table.key(board, to_move, color))
@@ -0,0 +1,97 @@
+"""
+Per-move time management for the anytime (iterative deepening) search in
+agent.py.
+
+The game manager kills an AI that takes longer than
+AiPlayerInterface.TIMEOUT (10 seconds) to answer, so the requested budget
+is capped at that limit minus a safety margin for pipes and Python's own
+overhead. A TimeManager enforces the budget in two ways: a hard deadline
+that aborts the running iteration, and a soft check before each new
+iteration that skips it if it is predicted not to finish.
+"""
+
+import time
+
+MOVE_TIME_LIMIT = 10.0 # seconds, same as AiPlayerInterface.TIMEOUT
+SAFETY_MARGIN = 1.0 # seconds kept in reserve for communication overhead
+MIN_BUDGET = 0.05 # never search for less than this
+CHECK_INTERVAL = 256 # nodes between two clock reads
+
+# A new iteration is always started while less than this fraction of the
+# budget is used, even if it is not predicted to finish: the previous best
+# move is searched first, so an unfinished iteration can still improve it.
+START_FRACTION = 0.4
+
+# Bounds for the predicted ratio between the times of two consecutive
+# iterations (the effective branching factor of one extra ply).
+MIN_GROWTH = 2.0
+MAX_GROWTH = 8.0
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the hard deadline has passed.
+    """
+    pass
+
+
+class TimeManager(object):
+
+    def __init__(self, budget=MOVE_TIME_LIMIT, safety_margin=SAFETY_MARGIN, should_stop=None):
+        self.start = time.perf_counter()
+        self.budget = max(min(budget, MOVE_TIME_LIMIT - safety_margin), MIN_BUDGET)
+        self.deadline = self.start + self.budget
+        self.nodes = 0
+        self.iteration_times = []
+        self.stopped = False
+        self.should_stop = should_stop # polled with the clock, ends the search if it returns True
+
+    def stop(self):
+        """
+        Make the next check() raise SearchTimeout, whatever the time. Used
+        from another thread to end a search early (see pondering in agent.py).
+        """
+        self.stopped = True
+
+    def check(self):
+        """
+        Count a node and raise SearchTimeout if the deadline has passed or
+        the search was stopped. The clock (and should_stop) are only read
+        every CHECK_INTERVAL nodes.
+        """
+        self.nodes += 1
+        if self.stopped:
+            raise SearchTimeout()
+        if self.nodes % CHECK_INTERVAL == 0:
+            if time.perf_counter() >= self.deadline or (self.should_stop is not None and self.should_stop()):
+                raise SearchTimeout()
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def finished_iteration(self, started):
+        """
+        Record the duration of an iteration that began at time started.
+        """
+        self.iteration_times.append(time.perf_counter() - started)
+
+    def growth(self):
+        """
+        Predicted ratio between the time of the next iteration and the last.
+        """
+        times = self.iteration_times
+        if len(times) < 2 or times[-2] <= 0:
+            return MIN_GROWTH
+        return min(max(times[-1] / times[-2], MIN_GROWTH), MAX_GROWTH)
+
+    def can_start_iteration(self):
+        """
+        Return True if the next iteration is worth starting.
+        """
+        if not self.iteration_times:
+            return True
+        elapsed = self.elapsed()
+        if elapsed < self.budget * START_FRACTION:
+            return True
+        predicted = self.iteration_times[-1] * self.growth()
+        return elapsed + predicted < self.budget
@@ -0,0 +1,349 @@
+"""
+Zobrist hashing and a fixed-size transposition table for the searches in
+agent.py.
+
+A position is hashed as the XOR of one random 64-bit key per occupied
+(square, colour) pair, plus a key for the side to move and a key for the
+colour the values are scored for. The hash of a child is obtained from the
+hash of its parent by XOR-ing in the placed disc and the flipped discs, so
+it never has to be recomputed from scratch during a search.
+
+Each table entry stores the remaining depth it was searched to, whether
+the value is exact or only a lower/upper bound (because of an alpha-beta
+cutoff), and the best move found. The table has a fixed number of slots
+derived from a memory budget; when two positions map to the same slot the
+deeper or more recent one is kept. Slots are two 64-bit words, the key and
+the entry packed into one integer (see pack_entry), held in arrays: 16
+bytes per slot, allocated once, instead of a key object and an entry tuple
+per stored position.
+
+SharedTranspositionTable has the same interface but keeps its slots in a
+multiprocessing.shared_memory block, so that the processes of a parallel
+search (see lazy_smp.py) share one table without locks.
+"""
+
+import random
+import struct
+from array import array
+
+try:
+    from multiprocessing import shared_memory
+except ImportError: # pragma: no cover - platforms without shared memory
+    shared_memory = None
+
+from othello_bitboard import board_to_masks, iter_squares
+
+EXACT = 0 # value is the exact minimax value
+LOWER = 1 # value is a lower bound (the search failed high)
+UPPER = 2 # value is an upper bound (the search failed low)
+
+UNLIMITED = 1 << 16 # depth of entries searched without a depth limit
+
+ENTRY_BYTES = 16 # one slot: the key and the packed entry
+
+_ZOBRIST = {}
+
+
+class Zobrist(object):
+    """
+    Random keys for an n x n board. squares[player][square] is the key of a
+    disc of player on square, flip[square] toggles the colour of a disc on
+    square, to_move[player] and perspective[color] mark the side to move and
+    the colour the stored values are scored for.
+    """
+
+    def __init__(self, n, seed=0x07E110):
+        rng = random.Random(seed * 1000 + n)
+        size = n * n
+        self.n = n
+        self.squares = [None,
+                        [rng.getrandbits(64) for _ in range(size)],
+                        [rng.getrandbits(64) for _ in range(size)]]
+        self.flip = [self.squares[1][sq] ^ self.squares[2][sq] for sq in range(size)]
+        self.to_move = [0, rng.getrandbits(64), rng.getrandbits(64)]
+        self.perspective = [0, rng.getrandbits(64), rng.getrandbits(64)]
+        self.turn = self.to_move[1] ^ self.to_move[2]
+
+    def key(self, board, to_move, color):
+        """
+        Compute the key of a tuple-of-tuples board from scratch.
+        """
+        dark, light = board_to_masks(board)
+        return self.masks_key(dark, light, to_move, color)
+
+    def masks_key(self, dark, light, to_move, color):
+        key = self.to_move[to_move] ^ self.perspective[color]
+        squares = self.squares[1]
+        for square in iter_squares(dark):
+            key ^= squares[square]
+        squares = self.squares[2]
+        for square in iter_squares(light):
+            key ^= squares[square]
+        return key
+
+    def play(self, key, player, square, flips):
+        """
+        Return the key after player places a disc on square and flips the
+        discs in the mask flips. The side to move passes to the opponent.
+        """
+        key ^= self.squares[player][square] ^ self.turn
+        flip = self.flip
+        for square in iter_squares(flips):
+            key ^= flip[square]
+        return key
+
+
+def zobrist(n):
+    """
+    Return the (cached) Zobrist keys for an n x n board.
+    """
+    keys = _ZOBRIST.get(n)
+    if keys is None:
+        keys = _ZOBRIST[n] = Zobrist(n)
+    return keys
+
+
+class TranspositionTable(object):
+    """
+    A fixed-size hash table from position keys to
+    (depth, flag, value, move, generation) entries, where move is a
+    (column, row) tuple or None. As in SharedTranspositionTable, values must
+    be integers below 2**22 in absolute value, moves on boards of at most
+    64 x 64, and generations count modulo 256.
+
+    Replacement policy: a new entry replaces the old one in its slot if it
+    is for the same position, if the old one was stored during an earlier
+    search (see new_search) or if it was searched at least as deep.
+    """
+
+    def __init__(self, megabytes=32):
+        self.generation = 0
+        self.resize(megabytes)
+
+    def resize(self, megabytes):
+        """
+        Use the largest power-of-two number of slots that fits in the memory
+        budget. This empties the table.
+        """
+        slots = 1
+        while slots * 2 * ENTRY_BYTES <= megabytes * (1 << 20):
+            slots *= 2
+        self.slots = slots
+        self.mask = slots - 1
+        self.clear()
+
+    def clear(self):
+        self.keys = array("Q", bytes(8 * self.slots))
+        self.entries = array("Q", bytes(8 * self.slots)) # 0 marks an empty slot
+        self.stored = 0
+
+    def __len__(self):
+        return self.stored
+
+    def new_search(self):
+        """
+        Mark the entries stored so far as older than the ones that follow,
+        so that they are the first to be replaced.
+        """
+        self.generation = (self.generation + 1) & 0xFF
+
+    def probe(self, key):
+        """
+        Return the (depth, flag, value, move, generation) entry stored for
+        key, or None.
+        """
+        index = key & self.mask
+        if self.keys[index] == key:
+            data = self.entries[index]
+            if data: # unpack_entry, inlined
+                value = (data >> 40) & VALUE_MASK
+                if value >= VALUE_LIMIT:
+                    value -= 2 * VALUE_LIMIT
+                return ((data >> 15) & 0x1FFFF, (data >> 13) & 3, value, MOVES[data & 0x1FFF],
+                        (data >> 32) & 0xFF)
+        return None
+
+    def store(self, key, depth, flag, value, move):
+        index = key & self.mask
+        old = self.entries[index]
+        if not old:
+            self.stored += 1
+        elif self.keys[index] != key and (old >> 32) & 0xFF == self.generation and (old >> 15) & 0x1FFFF > depth:
+            return
+        if not -VALUE_LIMIT <= value < VALUE_LIMIT:
+            value = max(min(int(value), VALUE_LIMIT - 1), -VALUE_LIMIT)
+        self.keys[index] = key
+        self.entries[index] = (USED | (value & VALUE_MASK) << 40 | self.generation << 32 | depth << 15 | flag << 13 |
+                               (0 if move is None else move[0] * 64 + move[1] + 1)) # pack_entry, inlined
+
+
+def bound_flag(value, alpha, beta):
+    """
+    Return the flag describing a value found with the window (alpha, beta).
+    """
+    if value <= alpha:
+        return UPPER
+    if value >= beta:
+        return LOWER
+    return EXACT
+
+
+def usable(entry, depth, alpha, beta):
+    """
+    Return True if a probed entry can be used instead of searching a node
+    to the given remaining depth with the window (alpha, beta).
+    """
+    if entry[0] < depth:
+        return False
+    flag = entry[1]
+    if flag == EXACT:
+        return True
+    if flag == LOWER:
+        return entry[2] >= beta
+    return entry[2] <= alpha
+
+
+# Layout of a shared slot: the key XOR-ed with the data word, then the data
+# word. A slot torn by two processes writing at once fails the key check
+# and reads as empty. Data word, from the low bits: move (13 bits, column
+# * 64 + row + 1, 0 for none), flag (2), depth (17), generation (8), value
+# (23, signed) and a bit marking the slot as used.
+SLOT = struct.Struct("<QQ")
+HEADER_BYTES = 64 # header: stop flag (byte 0) for the parallel search
+VALUE_BITS = 23
+VALUE_LIMIT = 1 << (VALUE_BITS - 1)
+VALUE_MASK = 2 * VALUE_LIMIT - 1
+USED = 1 << 63
+MOVES = [None] + [divmod(code, 64) for code in range(64 * 64)] # move of every move code
+
+
+class SharedTranspositionTable(object):
+    """
+    A TranspositionTable whose slots live in shared memory. The process that
+    creates it (name None) owns the block; other processes attach to it by
+    name. Entries are packed into 16 byte slots, so values must be integers
+    below 2**22 in absolute value and moves (column, row) tuples on boards of
+    at most 64 x 64.
+    """
+
+    def __init__(self, megabytes=32, name=None):
+        if shared_memory is None:
+            raise RuntimeError("Shared memory is not available")
+        self.generation = 0
+        self.stored = 0
+        self.owner = name is None
+        self.memory = None
+        if self.owner:
+            self.resize(megabytes)
+        else:
+            self.memory = attach(name)
+            self.slots = (self.memory.size - HEADER_BYTES) // SLOT.size
+            self.mask = self.slots - 1
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def resize(self, megabytes):
+        slots = 1
+        while slots * 2 * SLOT.size <= megabytes * (1 << 20):
+            slots *= 2
+        self.close()
+        self.memory = shared_memory.SharedMemory(create=True, size=HEADER_BYTES + slots * SLOT.size)
+        self.slots = slots
+        self.mask = slots - 1
+        self.clear()
+
+    def clear(self):
+        self.memory.buf[:] = bytes(len(self.memory.buf))
+        self.stored = 0
+
+    def close(self):
+        """
+        Detach from the block (and free it if this process owns it and it
+        was not unlinked yet).
+        """
+        if self.memory is not None:
+            self.memory.close()
+            if self.owner:
+                self.unlink()
+            self.memory = None
+
+    def unlink(self):
+        """
+        Remove the name of the block: processes that are attached keep their
+        mapping, and the memory is freed when the last one exits, however it
+        exits.
+        """
+        try:
+            shared_memory.SharedMemory.unlink(self.memory)
+        except FileNotFoundError:
+            pass
+
+    def __len__(self):
+        return self.stored
+
+    def new_search(self):
+        """
+        Only the owner advances the generation; attached processes follow it
+        (see follow), so that all of them store entries of the same age.
+        """
+        if self.owner:
+            self.generation = (self.generation + 1) & 0xFF
+
+    def follow(self, generation):
+        self.generation = generation & 0xFF
+
+    @property
+    def stop(self):
+        return self.memory.buf[0] != 0
+
+    @stop.setter
+    def stop(self, value):
+        self.memory.buf[0] = 1 if value else 0
+
+    def probe(self, key):
+        check, data = SLOT.unpack_from(self.memory.buf, HEADER_BYTES + (key & self.mask) * SLOT.size)
+        if not data or check ^ data != key:
+            return None
+        return unpack_entry(data)
+
+    def store(self, key, depth, flag, value, move):
+        offset = HEADER_BYTES + (key & self.mask) * SLOT.size
+        buf = self.memory.buf
+        check, data = SLOT.unpack_from(buf, offset)
+        if not data:
+            self.stored += 1
+        elif check ^ data != key:
+            old = unpack_entry(data)
+            if old[4] == self.generation and old[0] > depth:
+                return
+        data = pack_entry(depth, flag, value, move, self.generation)
+        SLOT.pack_into(buf, offset, key ^ data, data)
+
+
+def pack_entry(depth, flag, value, move, generation):
+    value = max(min(int(value), VALUE_LIMIT - 1), -VALUE_LIMIT)
+    code = 0 if move is None else move[0] * 64 + move[1] + 1
+    return (USED | (value & VALUE_MASK) << 40 | generation << 32 |
+            depth << 15 | flag << 13 | code)
+
+
+def unpack_entry(data):
+    value = (data >> 40) & VALUE_MASK
+    if value >= VALUE_LIMIT:
+        value -= 2 * VALUE_LIMIT
+    return ((data >> 15) & 0x1FFFF, (data >> 13) & 3, value, MOVES[data & 0x1FFF], (data >> 32) & 0xFF)
+
+
+def attach(name):
+    """
+    Attach to an existing shared memory block. Only its creator tracks it
+    where Python allows the choice; before Python 3.13 the attaching process
+    registers it again with the resource tracker it shares with its creator,
+    which is harmless since a name is only tracked once.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError: # Python before 3.13
+        return shared_memory.SharedMemory(name=name)
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Weight tuner for compute_heuristic, fitted to the results of self-play games.
+
+compute_heuristic is a weighted sum of five features of the position for
+the player to evaluate (FEATURES): the corner, edge, mobility and disc
+differences and the number of stable discs, with one set of weights for
+each game phase (opening, midgame and endgame, chosen by the share of empty
+squares, see evaluation.game_phase). The tuner:
+
+    * reads a corpus of positions labelled with the final disc difference
+      of their game (the shards of selfplay.py) as NumPy arrays;
+    * computes the five features of every position once, for the side to
+      move, with whole-array operations over chunks of CHUNK boards (the
+      same definitions as EvalState, which the tests check);
+    * for every pair of phase thresholds of OPENING_GRID x ENDGAME_GRID,
+      fits the weights of each phase on the training positions and measures
+      the loss on the held-out ones (the last share of the corpus);
+    * refits the best thresholds on the whole corpus and writes the weights,
+      rounded to integers, as JSON for evaluation.load_weights.
+
+Two losses are available: "mse" fits the final disc difference by least
+squares, "logistic" fits the outcome (1 for a win, 0.5 for a draw, 0 for a
+loss) with Newton iterations on the logistic loss. The fitted weights are
+multiplied by SCALES[loss] before rounding, so that the values of the
+heuristic stay integers (the search needs integer values for its null
+windows) and below TERMINAL_SCALE times the smallest win.
+
+For example, to tune the 8x8 heuristic on the shards of data/:
+    python3 tuner.py -i data -d 8 -l mse -o heuristic.json
+agent.py loads heuristic.json when the evaluator is heuristic (see the
+weights option).
+"""
+
+import getopt
+import json
+import sys
+import time
+
+import numpy as np
+
+import selfplay
+
+FEATURES = ("corners", "edges", "stable", "mobility", "discs")
+OPENING_GRID = (0.4, 0.5, 0.6, 0.7)
+ENDGAME_GRID = (0.1, 0.15, 0.2, 0.25, 0.3)
+SCALES = {"mse": 10, "logistic": 100} # integer weight units per unit of the fitted value
+CHUNK = 1 << 16 # boards per feature extraction step
+VALIDATION = 0.2 # share of the corpus held out to choose the phase thresholds
+RIDGE = 1e-6
+
+DIRECTIONS = [(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if (dr, dc) != (0, 0)]
+
+
+def shifted(masks, dr, dc):
+    """
+    Return the (k, n, n) boolean masks moved by (dr, dc), squares moved off
+    the board dropped: result[:, r, c] = masks[:, r - dr, c - dc].
+    """
+    n = masks.shape[1]
+    result = np.zeros_like(masks)
+    result[:, max(dr, 0):n + min(dr, 0), max(dc, 0):n + min(dc, 0)] = \
+        masks[:, max(-dr, 0):n + min(-dr, 0), max(-dc, 0):n + min(-dc, 0)]
+    return result
+
+
+def mobility(own, opp):
+    """
+    Return the number of legal moves of the owner of own on every board.
+    """
+    n = own.shape[1]
+    empty = ~(own | opp)
+    moves = np.zeros_like(own)
+    for dr, dc in DIRECTIONS:
+        line = shifted(own, dr, dc) & opp
+        for _ in range(n - 3):
+            line |= shifted(line, dr, dc) & opp
+        moves |= shifted(line, dr, dc) & empty
+    return moves.sum(axis=(1, 2))
+
+
+def stable(own):
+    """
+    Return the number of discs of own with an unbroken line of own discs to
+    the edge in at least one direction (evaluation.stable_mask) on every
+    board.
+    """
+    n = own.shape[1]
+    result = np.zeros_like(own)
+    for dr, dc in DIRECTIONS:
+        rim = ~shifted(np.ones_like(own[:1]), -dr, -dc) # squares whose neighbour (r + dr, c + dc) is off the board
+        line = own & rim
+        for _ in range(n - 1):
+            grown = line | (own & shifted(line, -dr, -dc))
+            if np.array_equal(grown, line):
+                break
+            line = grown
+        result |= line
+    return result.sum(axis=(1, 2))
+
+
+def features(boards, players):
+    """
+    Return the features (FEATURES) of the (k, n, n) boards for the players
+    to move as a (k, 5) int32 matrix.
+    """
+    n = boards.shape[1]
+    corners = np.zeros((n, n), dtype=bool)
+    corners[[0, 0, -1, -1], [0, -1, 0, -1]] = True
+    edges = np.zeros((n, n), dtype=bool)
+    edges[[0, -1], :] = True
+    edges[:, [0, -1]] = True
+    edges &= ~corners
+    matrix = np.zeros((len(boards), len(FEATURES)), dtype=np.int32)
+    for start in range(0, len(boards), CHUNK):
+        chunk = boards[start:start + CHUNK]
+        player = players[start:start + CHUNK].reshape(-1, 1, 1)
+        own = chunk == player
+        opp = (chunk != 0) & ~own
+        rows = matrix[start:start + CHUNK]
+        rows[:, 0] = (own & corners).sum(axis=(1, 2)) - (opp & corners).sum(axis=(1, 2))
+        rows[:, 1] = (own & edges).sum(axis=(1, 2)) - (opp & edges).sum(axis=(1, 2))
+        rows[:, 2] = stable(own)
+        rows[:, 3] = mobility(own, opp) - mobility(opp, own)
+        rows[:, 4] = own.sum(axis=(1, 2)) - opp.sum(axis=(1, 2))
+    return matrix
+
+
+def load_corpus(directory, n):
+    """
+    Read the self-play shards of n x n games in directory. Returns
+    (boards, players, results) as arrays, results for the side to move.
+    """
+    boards, players, results = [], [], []
+    for path in selfplay.shard_paths(directory, n):
+        size, records = selfplay.load_shard(path)
+        boards.append(selfplay.boards(records, size))
+        players.append(np.array(records["player"], dtype=np.int8))
+        results.append(np.array(records["result"], dtype=np.int32))
+    if not boards:
+        raise ValueError("no {0}x{0} shards in {1}".format(n, directory))
+    return np.concatenate(boards), np.concatenate(players), np.concatenate(results)
+
+
+def targets(results, loss):
+    if loss == "logistic":
+        return (np.sign(results) + 1) / 2.0
+    return results.astype(np.float64)
+
+
+def fit(matrix, target, loss, iterations=25):
+    """
+    Return the weights (a float array, one per feature) that minimize the
+    loss of matrix @ weights against target.
+    """
+    x = matrix.astype(np.float64)
+    ridge = RIDGE * len(x) * np.eye(x.shape[1])
+    if loss == "mse":
+        return np.linalg.solve(x.T @ x + ridge, x.T @ target)
+    weights = np.zeros(x.shape[1])
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(-(x @ weights)))
+        gradient = x.T @ (p - target) + ridge @ weights
+        hessian = (x * (p * (1 - p))[:, None]).T @ x + ridge
+        step = np.linalg.solve(hessian, gradient)
+        weights -= step
+        if np.abs(step).max() < 1e-7:
+            break
+    return weights
+
+
+def mean_loss(matrix, target, weights, loss):
+    values = matrix.astype(np.float64) @ weights
+    if loss == "mse":
+        return float(np.mean((values - target) ** 2))
+    p = np.clip(1.0 / (1.0 + np.exp(-values)), 1e-12, 1 - 1e-12)
+    return float(-np.mean(target * np.log(p) + (1 - target) * np.log(1 - p)))
+
+
+def phases(empties, size, opening, endgame):
+    """
+    Return the phase of every position, as evaluation.game_phase does.
+    """
+    return np.where(empties > size * opening, 0, np.where(empties > size * endgame, 1, 2))
+
+
+def fit_phases(matrix, target, phase, loss):
+    """
+    Fit the weights of every phase. A phase without positions keeps zero
+    weights.
+    """
+    weights = np.zeros((3, matrix.shape[1]))
+    for index in range(3):
+        rows = phase == index
+        if rows.sum() >= matrix.shape[1]:
+            weights[index] = fit(matrix[rows], target[rows], loss)
+    return weights
+
+
+def tune(matrix, empties, results, size, loss="mse", validation=VALIDATION, log=print):
+    """
+    Choose the phase thresholds on held-out positions and fit the weights of
+    every phase. Returns (opening, endgame, float weights (3, 5), loss).
+    """
+    target = targets(results, loss)
+    split = int(len(matrix) * (1 - validation))
+    best = None
+    for opening in OPENING_GRID:
+        for endgame in ENDGAME_GRID:
+            phase = phases(empties, size, opening, endgame)
+            weights = fit_phases(matrix[:split], target[:split], phase[:split], loss)
+            total = 0.0
+            for index in range(3):
+                rows = phase[split:] == index
+                if rows.any():
+                    total += mean_loss(matrix[split:][rows], target[split:][rows], weights[index], loss) * rows.sum()
+            total /= max(len(matrix) - split, 1)
+            log("opening {:.2f} endgame {:.2f}: held-out loss {:.4f}".format(opening, endgame, total))
+            if best is None or total < best[2]:
+                best = (opening, endgame, total)
+    opening, endgame, held_out = best
+    weights = fit_phases(matrix, target, phases(empties, size, opening, endgame), loss)
+    return opening, endgame, weights, held_out
+
+
+def integer_weights(weights, loss):
+    return [[int(round(weight * SCALES[loss])) for weight in phase] for phase in weights]
+
+
+def write_weights(path, opening, endgame, weights, loss, positions):
+    """
+    Write the thresholds and integer weights as the JSON weights file of
+    evaluation.load_weights.
+    """
+    with open(path, "w") as f:
+        json.dump({"opening_empties": opening, "endgame_empties": endgame, "features": FEATURES,
+                   "weights": weights, "loss": loss, "positions": positions}, f, indent=1)
+
+
+def main(argv):
+    directory = "selfplay"
+    n = 8
+    loss = "mse"
+    validation = VALIDATION
+    output = "heuristic.json"
+    usage = "tuner.py -i <shard directory> -d <dimension> [-l <mse|logistic> -v <held-out share>] -o <file>"
+    try:
+        opts, args = getopt.getopt(argv, "hi:d:l:v:o:", ["input=", "dimension=", "loss=", "validation=",
+                                                        "output="])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            print(usage)
+            sys.exit()
+        elif opt in ("-i", "--input"):
+            directory = arg
+        elif opt in ("-d", "--dimension"):
+            n = int(arg)
+        elif opt in ("-l", "--loss"):
+            loss = arg
+        elif opt in ("-v", "--validation"):
+            validation = float(arg)
+        elif opt in ("-o", "--output"):
+            output = arg
+    if loss not in SCALES:
+        print(usage)
+        sys.exit(2)
+
+    started = time.perf_counter()
+    boards, players, results = load_corpus(directory, n)
+    matrix = features(boards, players)
+    empties = (boards == 0).sum(axis=(1, 2))
+    print("{} positions, features in {:.1f}s".format(len(boards), time.perf_counter() - started))
+    opening, endgame, weights, held_out = tune(matrix, empties, results, n * n, loss, validation)
+    weights = integer_weights(weights, loss)
+    write_weights(output, opening, endgame, weights, loss, len(boards))
+    print("opening above {:.0%} empty, endgame below {:.0%} (held-out loss {:.4f}), in {:.1f}s".format(
+        opening, endgame, held_out, time.perf_counter() - started))
+    for name, phase in zip(("opening", "midgame", "endgame"), weights):
+        print("{:8s} ".format(name) + " ".join("{}={}".format(f, w) for f, w in zip(FEATURES, phase)))
+    print("weights written to {}".format(output))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])